@@ -0,0 +1,327 @@
+"""把项目代码打包为一个供AI阅览的markdown文件（codepack函数的实现）
+
+文件列表只获取一次（git ls-files），每个文件在进程池中只读取一次：用按语言预编译的
+正则提取依赖关系、统计复杂度指标，并复用 token_count 插件的 token_counter 计算token数。
+结果汇总后按顺序一次写出，源代码直接从文件流式复制到输出中。
+"""
+import argparse
+import datetime
+import functools
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+# token_counter 在 token_count 插件目录中，只依赖tiktoken；未安装时不输出token数
+sys.path.insert(0, os.path.join(os.path.dirname(PLUGIN_DIR), 'token_count'))
+try:
+    import token_counter
+except ImportError:
+    token_counter = None
+
+BINARY_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg', '.ico', '.tiff', '.json', '.yaml',
+    '.mp3', '.mp4', '.wav', '.avi', '.mov', '.mkv', '.flv', '.zip', '.tar', '.gz', '.rar',
+    '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.bin', '.exe', '.dll', '.so',
+    '.class', '.pyc', '.pyo', '.o', '.a', '.lib', '.hex',
+    '.node-cache', '.tree-sitter-cache',
+}
+# 文件大小限制（5MB）和JS/TS函数调用分析的超时（秒）
+SIZE_LIMIT = 5 * 1024 * 1024
+PARSER_TIMEOUT = 30
+# 文件数少于此值时不启动进程池
+PARALLEL_THRESHOLD = 32
+TS_PARSER = os.path.join(PLUGIN_DIR, 'ts-parser', 'tree-sitter-parser.js')
+
+# 代码块的语言标记
+FENCE_LANGUAGES = {
+    '.js': 'javascript', '.jsx': 'javascript',
+    '.ts': 'typescript', '.tsx': 'typescript',
+    '.py': 'python', '.rb': 'ruby', '.go': 'go', '.rs': 'rust', '.java': 'java',
+    '.cpp': 'cpp', '.cc': 'cpp', '.h': 'cpp', '.hpp': 'cpp', '.c': 'c',
+    '.sh': 'bash', '.fish': 'bash', '.bash': 'bash',
+}
+
+# 各语言的项目内依赖：每个正则的第一个非空分组是依赖的目标
+_JS_DEPS = [re.compile(r'''^import .+ from ['"](\..*?)['"]|^require\(['"](\..*?)['"]\)''', re.M)]
+_GO_IMPORT_BLOCK = re.compile(r'^import \((.*?)^\)', re.M | re.S)
+DEPENDENCY_PATTERNS = {
+    '.js': _JS_DEPS, '.jsx': _JS_DEPS, '.ts': _JS_DEPS, '.tsx': _JS_DEPS,
+    '.py': [re.compile(r'^from (\.[\w.]*) import ([\w, ]+)|^import (\.[\w.]*)', re.M)],
+    '.rs': [re.compile(r'^use ((?:crate|super|self)::[^;]+);', re.M)],
+    '.go': [re.compile(r'^import (?:\w+ )?"(\./[^"]*)"', re.M)],
+    '.rb': [re.compile(r'''^require_relative ['"](.+?)['"]|^require ['"](\..*?)['"]''', re.M)],
+    '.java': [re.compile(r'^import (?!static )([\w.]+(?:\.\*)?);', re.M)],
+}
+_GO_RELATIVE = re.compile(r'"(\./[^"]*)"')
+
+# 复杂度指标按行匹配，与 rg -c 的计数方式相同
+_CONDITIONS = re.compile(r'if|while|for|switch|&&|\|\|')
+_FUNCTIONS = re.compile(r'function|def |class |fn ')
+_INDENT = re.compile(r'[ \t]*')
+
+def list_files(include_all=False):
+    """返回 (文件列表, 目录类型)，Git仓库中只调用一次 git ls-files"""
+    try:
+        proc = subprocess.run(['git', 'ls-files', '-z'], capture_output=True)
+    except OSError:
+        proc = None
+    if proc is not None and proc.returncode == 0:
+        return [path for path in os.fsdecode(proc.stdout).split('\0') if path], 'Git仓库'
+    if include_all:
+        files = []
+        for root, dirs, names in os.walk('.'):
+            dirs[:] = sorted(d for d in dirs if d != '.git')
+            files.extend(os.path.relpath(os.path.join(root, name)) for name in sorted(names))
+        return files, '普通目录（递归扫描）'
+    return sorted(name for name in os.listdir('.') if not name.startswith('.')), '当前目录'
+
+def is_packed(path):
+    """二进制等扩展名和.gitignore不打包"""
+    _, ext = os.path.splitext(path)
+    return ext.lower() not in BINARY_EXTENSIONS and os.path.basename(path) != '.gitignore'
+
+def extract_dependencies(text, ext):
+    """返回文件中的项目内依赖目标，按出现顺序去重"""
+    targets = []
+    for pattern in DEPENDENCY_PATTERNS.get(ext, ()):
+        for match in pattern.finditer(text):
+            target = next(group for group in match.groups() if group)
+            if ext == '.py':
+                # from . import a, b 的目标是导入的模块名
+                target = target.lstrip('.') or match.group(2).split(',')[0].strip()
+            targets.append(target.strip())
+    if ext == '.go':
+        for block in _GO_IMPORT_BLOCK.finditer(text):
+            targets.extend(_GO_RELATIVE.findall(block.group(1)))
+    return list(dict.fromkeys(target for target in targets if target))
+
+def complexity(lines):
+    """返回 (条件语句数, 函数/类数量, 最大嵌套深度)，嵌套深度按每4个空白字符一级计算"""
+    conditions = functions = max_indent = 0
+    for line in lines:
+        if _CONDITIONS.search(line):
+            conditions += 1
+        if _FUNCTIONS.search(line):
+            functions += 1
+        if line.strip():
+            max_indent = max(max_indent, _INDENT.match(line).end() // 4)
+    return conditions, functions, max_indent
+
+def parse_calls(path, parser):
+    """用tree-sitter解析JS/TS文件，返回 ([(调用者, 被调用者)], 是否超时)"""
+    # 后续改进: 目前每个JS/TS文件仍启动一个node进程。tree-sitter-parser.js不在本仓库中，
+    # 只接受一个文件参数并输出一个JSON列表；它支持多个文件参数并按文件输出结果后，
+    # 应在pack中把所有JS/TS文件一次交给同一个node进程解析，不再在analyze_file中逐个调用。
+    try:
+        proc = subprocess.run(['node', parser, path], capture_output=True, text=True,
+                              timeout=PARSER_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return [], True
+    except OSError:
+        return [], False
+    try:
+        relations = json.loads(proc.stdout)
+    except ValueError:
+        return [], False
+    return [(caller.split(': ', 1)[-1], callee) for caller, callee in relations], False
+
+def analyze_file(path, encoding=None, parser=None):
+    """在工作进程中分析单个文件，只读取一次，返回结果字典"""
+    result = {'path': path}
+    try:
+        size = os.stat(path).st_size
+    except OSError:
+        result['skipped'] = 'missing'
+        return result
+    result['size'] = size
+    if size > SIZE_LIMIT:
+        result['skipped'] = 'large'
+        return result
+    try:
+        with open(path, 'rb') as f:
+            text = f.read().decode('utf-8', errors='replace')
+    except OSError:
+        result['skipped'] = 'missing'
+        return result
+    _, ext = os.path.splitext(path)
+    ext = ext.lower()
+    lines = text.splitlines()
+    result['lines'] = text.count('\n')
+    result['conditions'], result['functions'], result['max_indent'] = complexity(lines)
+    result['dependencies'] = extract_dependencies(text, ext)
+    if parser and ext in ('.js', '.jsx', '.ts', '.tsx'):
+        result['calls'], result['timeout'] = parse_calls(path, parser)
+    if encoding:
+        result['tokens'] = token_counter.count_tokens(text, encoding)
+    return result
+
+def token_encoding(name, encoding_dir=None):
+    """返回可用的tiktoken编码名；token_counter或编码不可用时返回None
+
+    encoding_dir中的 <编码名>.tiktoken 文件会预置到tiktoken缓存，与token_count的--encoding-dir相同。
+    """
+    if token_counter is None:
+        return None
+    token_counter.prepare_encoding_cache(encoding_dir)
+    try:
+        token_counter.get_encoder(name)
+    except Exception:
+        # get_encoder已输出具体错误
+        print(f"警告: 无法加载tiktoken编码 {name}，不统计token数；离线时可用--encoding-dir指定"
+              f"包含 {name}.tiktoken 的目录，或用--no-tokens跳过", file=sys.stderr)
+        return None
+    return name
+
+def analyze_files(paths, jobs=1, encoding=None, parser=None):
+    """按文件顺序返回分析结果，文件较多时在进程池中分析"""
+    analyze = functools.partial(analyze_file, encoding=encoding, parser=parser)
+    if jobs <= 1 or len(paths) < PARALLEL_THRESHOLD:
+        return [analyze(path) for path in paths]
+    from concurrent.futures import ProcessPoolExecutor
+    initializer = token_counter.init_worker if encoding else None
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initializer,
+                             initargs=((encoding,),) if encoding else ()) as executor:
+        return list(executor.map(analyze, paths, chunksize=max(1, len(paths) // (jobs * 8))))
+
+def project_description():
+    try:
+        with open('package.json', encoding='utf-8') as f:
+            return json.load(f).get('description') or ''
+    except (OSError, ValueError, AttributeError):
+        return ''
+
+def write_overview(out, repo_type, total_files, results, encoding):
+    out.write('# 项目概览\n')
+    out.write(f"项目名称: {os.path.basename(os.getcwd())}\n")
+    out.write(f"目录类型: {repo_type}\n")
+    out.write(f"生成时间: {datetime.datetime.now():%Y-%m-%d %H:%M:%S}\n")
+    description = project_description()
+    if description:
+        out.write(f"项目描述: {description}\n")
+    out.write(f"文件总数: {total_files}\n")
+    if encoding:
+        total = sum(result.get('tokens') or 0 for result in results)
+        out.write(f"Token总数: {total}（{encoding}）\n")
+    out.write('\n')
+
+def write_dependencies(out, results):
+    out.write('# 文件依赖关系\n```mermaid\nflowchart TD\n    %% 文件依赖关系图\n')
+    for result in results:
+        if result.get('skipped') == 'large':
+            out.write(f"    %% 跳过大文件: {result['path']} "
+                      f"({result['size'] / 1024 / 1024:.1f}MB > {SIZE_LIMIT // 1024 // 1024}MB)\n")
+            continue
+        source = os.path.basename(result['path'])
+        for target in result.get('dependencies', ()):
+            out.write(f"    {source} --> {target}\n")
+    out.write('```\n\n')
+
+def write_calls(out, results):
+    out.write('# 函数调用关系\n```mermaid\nflowchart TD\n'
+              '    %% 函数调用关系图\n    subgraph 函数调用\n')
+    relations = set()
+    for result in results:
+        if result.get('timeout'):
+            out.write(f"    %% 注意: 分析 {result['path']} 时超时\n")
+        relations.update(result.get('calls', ()))
+    for caller, callee in sorted(relations):
+        out.write(f"        {caller} --> {callee}\n")
+    out.write('    end\n```\n\n')
+
+def write_complexity(out, results):
+    out.write('# 代码复杂度分析\n')
+    for result in results:
+        if result.get('skipped'):
+            continue
+        out.write(f"## {result['path']} 复杂度指标\n")
+        out.write(f"- 条件语句数: {result['conditions']}\n")
+        out.write(f"- 函数/类数量: {result['functions']}\n")
+        out.write(f"- 最大嵌套深度: {result['max_indent']}\n")
+        out.write(f"- 代码行数: {result['lines']}\n")
+        if result.get('tokens') is not None:
+            out.write(f"- Token数: {result['tokens']}\n")
+        if result['conditions'] > 20:
+            out.write('⚠️ 条件语句较多，建议考虑重构\n')
+        if result['max_indent'] > 5:
+            out.write('⚠️ 嵌套层级较深，建议考虑重构\n')
+        out.write('\n')
+
+def write_sources(out, results):
+    """源代码直接从文件流式复制到输出中，不在内存中保留所有文件的内容"""
+    out.write('# 源代码\n')
+    for result in results:
+        if result.get('skipped') == 'large':
+            out.write(f"注意: {result['path']} 超过大小限制 "
+                      f"({SIZE_LIMIT // 1024 // 1024}MB)，已跳过\n")
+            continue
+        if result.get('skipped'):
+            continue
+        _, ext = os.path.splitext(result['path'])
+        out.write(f"## {result['path']}\n```{FENCE_LANGUAGES.get(ext.lower(), '')}\n")
+        try:
+            with open(result['path'], encoding='utf-8', errors='replace') as f:
+                shutil.copyfileobj(f, out)
+        except OSError as e:
+            out.write(f"（读取失败: {e}）\n")
+        out.write('```\n\n')
+
+def pack(output, include_all=False, jobs=1, encoding=None, calls=True, encoding_dir=None):
+    """生成打包文件，返回 (处理的文件数, token总数或None)"""
+    files, repo_type = list_files(include_all)
+    output_path = os.path.abspath(output)
+    paths = [path for path in files
+             if is_packed(path) and os.path.abspath(path) != output_path and os.path.isfile(path)]
+    encoding = token_encoding(encoding, encoding_dir) if encoding else None
+    parser = TS_PARSER if calls and shutil.which('node') and os.path.isfile(TS_PARSER) else None
+    results = analyze_files(paths, jobs, encoding, parser)
+    # 所有章节在一次顺序写入中完成，使用较大的缓冲区减少写入次数
+    with open(output, 'w', encoding='utf-8', buffering=1024 * 1024) as out:
+        write_overview(out, repo_type, len(files), results, encoding)
+        write_dependencies(out, results)
+        write_calls(out, results)
+        write_complexity(out, results)
+        write_sources(out, results)
+    total = sum(result.get('tokens') or 0 for result in results) if encoding else None
+    return len(files), total
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Pack project code files for AI analysis')
+    parser.add_argument('-o', '--output', default='codepack.md',
+                        help='Output markdown file, .md is appended if missing '
+                             '(default: codepack.md)')
+    parser.add_argument('-a', '--all', action='store_true',
+                        help='Outside a git repository, scan the directory recursively')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes for file analysis (default: CPU count)')
+    parser.add_argument('--encoding', default='cl100k_base',
+                        help='tiktoken encoding for per-file token counts (default: cl100k_base)')
+    parser.add_argument('--encoding-dir', metavar='DIR',
+                        default=os.environ.get('TOKEN_COUNT_ENCODING_DIR'),
+                        help='Directory with <name>.tiktoken files to use offline '
+                             '(default: $TOKEN_COUNT_ENCODING_DIR)')
+    parser.add_argument('--no-tokens', action='store_true', help='Do not count tokens')
+    parser.add_argument('--no-calls', action='store_true',
+                        help='Skip the tree-sitter function call analysis of JS/TS files')
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if not args.output.endswith('.md'):
+        args.output += '.md'
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    processed, total = pack(args.output, args.all, args.jobs,
+                            None if args.no_tokens else args.encoding, not args.no_calls,
+                            args.encoding_dir)
+    print(f"代码打包完成，已写入到 {args.output}")
+    print(f"共处理了 {processed} 个文件")
+    if total is not None:
+        print(f"Token总数: {total}")
+
+if __name__ == '__main__':
+    main()
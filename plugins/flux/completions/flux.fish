@@ -18,5 +18,14 @@ complete -c flux -s p -l prompt -d '直接提供提示词' -x -a '(echo \
     "复古风格海报"\t"设计复古风格作品"\
 )'
 
+# 批量任务文件，启用文件补全
+complete -c flux -s b -l batch -r -d '批量生成（每行一个提示词或JSONL任务）'
+
+# 宽高比
+complete -c flux -s a -l aspect-ratio -d '宽高比（如 16:9），不询问' -x -a '16:9 4:3 21:9 9:16 3:2 1:1'
+
 # 随机种子选项
-complete -c flux -s s -l seed -d '设置随机种子' -x
\ No newline at end of file
+complete -c flux -s s -l seed -d '设置随机种子' -x
+
+# 忽略缓存
+complete -c flux -l force -d '忽略缓存，重新生成相同提示词和种子的图片'
\ No newline at end of file
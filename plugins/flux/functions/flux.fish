@@ -6,7 +6,7 @@ function flux -d "Generate images using Flux AI with common aspect ratios"
     end
 
     # 检查必要的命令
-    for cmd in md5sum jq python3 curl uv
+    for cmd in python3 uv
         if not command -v $cmd >/dev/null
             echo "Error: $cmd is not installed. Please install it first."
             return 1
@@ -55,7 +55,7 @@ function flux -d "Generate images using Flux AI with common aspect ratios"
     mkdir -p $save_dir
 
     # 参数解析
-    argparse h/help 'f/file=' 'p/prompt=' 's/seed=' -- $argv
+    argparse h/help 'f/file=' 'p/prompt=' 's/seed=' 'b/batch=' 'a/aspect-ratio=' force -- $argv
     or begin
         # 如果参数解析失败，恢复PATH
         set -gx PATH $old_path
@@ -64,13 +64,16 @@ function flux -d "Generate images using Flux AI with common aspect ratios"
     end
 
     if set -q _flag_help
-        echo "Usage: flux [-h/--help] [-f/--file PROMPT_FILE] [-p/--prompt PROMPT_TEXT] [-s/--seed SEED]"
+        echo "Usage: flux [-h/--help] [-f/--file PROMPT_FILE] [-p/--prompt PROMPT_TEXT] [-s/--seed SEED] [-a/--aspect-ratio W:H] [-b/--batch JOBS_FILE] [--force]"
         echo
         echo "Options:"
         echo "  -h, --help            显示帮助信息"
         echo "  -f, --file FILE       从文件读取提示词"
         echo "  -p, --prompt PROMPT   直接提供提示词"
         echo "  -s, --seed SEED       设置随机种子"
+        echo "  -a, --aspect-ratio R  宽高比（如 16:9），不询问；批量模式下只用于没有指定尺寸的任务"
+        echo "  -b, --batch FILE      批量生成：每行一个提示词，或JSONL格式的任务"
+        echo "      --force           忽略缓存，重新生成相同提示词和种子的图片"
         echo
         echo "支持的宽高比:"
         for ratio in $aspect_ratios
@@ -87,7 +90,17 @@ function flux -d "Generate images using Flux AI with common aspect ratios"
     set -l prompt_source
     set -l prompt_content
 
-    if set -q _flag_file
+    if set -q _flag_batch
+        if not test -f $_flag_batch
+            echo "Error: Batch file does not exist: $_flag_batch"
+            # 错误时恢复PATH
+            set -gx PATH $old_path
+            set -gx PYTHONPATH $old_python_path
+            return 1
+        end
+        set prompt_arg --batch $_flag_batch
+        set prompt_source "batch: $_flag_batch"
+    else if set -q _flag_file
         if not test -f $_flag_file
             echo "Error: Prompt file does not exist: $_flag_file"
             # 错误时恢复PATH
@@ -130,19 +143,23 @@ function flux -d "Generate images using Flux AI with common aspect ratios"
         set prompt_source "interactive input"
     end
 
-    # 计算提示词的MD5哈希
-    set -l prompt_hash (echo -n $prompt_content | md5sum | cut -d' ' -f1)
+    # 选择宽高比：批量模式不询问，任务自己的尺寸和模型由Python端处理
+    set -l aspect_ratio
+    set -l choice
+    if not set -q _flag_aspect_ratio; and not set -q _flag_batch
+        echo "请选择宽高比 (默认 16:9):"
+        for i in (seq (count $aspect_ratios))
+            echo "[$i] $aspect_ratios[$i]"
+        end
 
-    # 选择宽高比
-    echo "请选择宽高比 (默认 16:9):"
-    for i in (seq (count $aspect_ratios))
-        echo "[$i] $aspect_ratios[$i]"
+        read -P "选择序号 (直接回车使用默认): " choice
     end
 
-    read -P "选择序号 (直接回车使用默认): " choice
-
-    set -l aspect_ratio
-    if test -z "$choice"
+    if set -q _flag_aspect_ratio
+        set aspect_ratio $_flag_aspect_ratio
+    else if set -q _flag_batch
+        set aspect_ratio
+    else if test -z "$choice"
         set aspect_ratio "16:9"
     else if test "$choice" -ge 1 -a "$choice" -le (count $aspect_ratio_values)
         if test "$aspect_ratio_values[$choice]" = custom
@@ -178,144 +195,59 @@ function flux -d "Generate images using Flux AI with common aspect ratios"
     # 构建命令参数
     set -l cmd_args
     set -a cmd_args $prompt_arg
-    set -a cmd_args --model flux-pro-1.1-ultra
-    set -a cmd_args --aspect-ratio $aspect_ratio
+    # 给出宽高比时Python端自动使用flux-pro-1.1-ultra；批量模式下只用于没有指定尺寸的任务
+    if test -n "$aspect_ratio"
+        set -a cmd_args --aspect-ratio $aspect_ratio
+    end
 
     if set -q _flag_seed
         set -a cmd_args --seed $_flag_seed
     end
 
-    # 创建一个临时管道
-    function mkfifo_temp
-        set -l pipe_path (mktemp -u)
-        mkfifo $pipe_path
-        echo $pipe_path # 返回管道路径供调用者使用
+    if set -q _flag_force
+        set -a cmd_args --force
     end
 
-    # 创建临时文件
-    set -l output_file (mkfifo_temp)
+    # 图片由Python端流式下载到保存目录，文件名为 <提示词md5>.<请求参数哈希>.s<seed>.jpeg，提示词保存为 <提示词md5>.txt
+    set -a cmd_args --output-dir $save_dir
 
     # 执行生成命令
     echo "正在生成图片..."
     echo "提示词来源: $prompt_source"
-    echo "使用宽高比: $aspect_ratio"
-
-    # 直接执行命令并同时将输出发送到终端和文件
-    python -u $SCRIPTS_DIR/fish/plugins/flux/generate_flux_image.py $cmd_args 2>&1 | tee $output_file &
-
-    # 检查命令是否成功执行
-    if test $status -ne 0
-        echo "Error: Generation failed"
-        cat $output_file
-        rm -f $output_file
-        # 错误时恢复PATH
-        set -gx PATH $old_path
-        set -gx PYTHONPATH $old_python_path
-        return 1
-    end
-
-    # 从输出中提取最后一个Result块
-    set -l lines (cat $output_file)
-    set -l start_line -1
-    set -l end_line -1
-    set -l current_line 1
-
-    # 遍历所有行，找到最后一个"Result:"和对应的JSON块
-    for line in $lines
-        # 标记Result开始位置
-        if string match -q "Result: {" -- $line
-            set start_line $current_line
-        else if test $start_line -gt 0; and string match -q "}" -- $line
-            # 找到闭合的大括号
-            set end_line $current_line
-        end
-        set current_line (math $current_line + 1)
+    if test -n "$aspect_ratio"
+        echo "使用宽高比: $aspect_ratio"
     end
 
-    if test $start_line -gt 0 -a $end_line -gt 0
-        # 提取JSON内容
-        set -l result_content
-        set -l line_num 1
-        for line in $lines
-            if test $line_num -ge $start_line -a $line_num -le $end_line
-                # 第一行需要去掉"Result: "前缀
-                if test $line_num -eq $start_line
-                    set -a result_content (string replace "Result: " "" -- $line)
-                else
-                    set -a result_content $line
-                end
-            end
-            set line_num (math $line_num + 1)
+    # 标准输出为每个任务一行JSON（批量模式最后一行是汇总），状态信息直接输出到标准错误
+    set -l records (python -u $SCRIPTS_DIR/fish/plugins/flux/generate_flux_image.py $cmd_args)
+    set -l generate_status $status
+
+    for record in $records
+        if string match -q '{"summary": true*' -- $record
+            set -l ready (string match -rg '"ready": (\d+)' -- $record)
+            set -l failed (string match -rg '"failed": (\d+)' -- $record)
+            set -l cached (string match -rg '"cached": (\d+)' -- $record)
+            echo "完成 $ready 张（其中 $cached 张来自缓存），失败 $failed 张"
+            continue
         end
-
-        # 将多行内容合并成单个字符串
-        set -l json_result (string join \n $result_content)
-
-        # 从JSON结果中提取URL和seed
-        set -l download_url (echo $json_result | jq -r '.sample')
-        set -l seed (echo $json_result | jq -r '.seed')
-
-        # 构建输出文件名
-        set -l base_filename $save_dir/$prompt_hash
-
-        # 先保存提示词文本
-        set -l prompt_file $base_filename.txt
-        # 如果文件不存在或为空文件
-        if test ! -s $prompt_file
-            printf "%s" "$prompt_content" >$prompt_file
-            echo "提示词已保存到: $prompt_file"
+        set -l image_file (string match -rg '"path": "((?:[^"\\\\]|\\\\.)*)"' -- $record)
+        if test -n "$image_file"
+            echo "图片已保存到: $image_file"
         else
-            echo "提示词文件已存在: $prompt_file"
+            set -l prompt (string match -rg '"prompt": "((?:[^"\\\\]|\\\\.)*)"' -- $record)
+            set -l error (string match -rg '"error": "((?:[^"\\\\]|\\\\.)*)"' -- $record)
+            echo "Error: $prompt: $error"
         end
+    end
 
-        # 添加文件名后缀
-        # 如果seed不为空，使用seed作为后缀，否则使用当前时间戳
-        if test "$seed" != null # for the usage of jq
-            set base_filename $base_filename.s$seed
-        else
-            set unix_timestamp (date +%s.%N)
-            set base_filename $base_filename.t$unix_timestamp
-        end
-
-        # 保存图片
-        set -l image_file $base_filename.jpeg
-        echo "正在下载图片到: $image_file"
-
-        # 下载图片（使用-f强制覆盖，-L跟随重定向，关闭进度显示）
-        if test -n "$download_url"
-            curl -s -f -L "$download_url" -o "$image_file"
-            set -l download_status $status
-            if test $download_status -eq 0; and test -f $image_file
-                echo "下载完成！"
-            else
-                echo "下载失败 (状态码: $download_status)"
-                rm -f $image_file
-                rm -f $output_file
-                # 错误时恢复PATH
-                set -gx PATH $old_path
-                set -gx PYTHONPATH $old_python_path
-                return 1
-            end
-        else
-            echo "Error: Could not extract download URL from result"
-            cat $output_file
-            rm -f $output_file
-            # 错误时恢复PATH
-            set -gx PATH $old_path
-            set -gx PYTHONPATH $old_python_path
-            return 1
-        end
-    else
-        echo "Error: Could not find complete Result section in output"
-        rm -f $output_file
+    if test $generate_status -ne 0
+        echo "Error: Generation failed"
         # 错误时恢复PATH
         set -gx PATH $old_path
         set -gx PYTHONPATH $old_python_path
         return 1
     end
 
-    rm -f $output_file
-
     # 成功完成后，恢复PATH
     set -gx PATH $old_path
     set -gx PYTHONPATH $old_python_path
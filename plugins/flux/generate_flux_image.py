@@ -3,8 +3,17 @@ import os
 import time
 import json
 import argparse
+import email.utils
+import hashlib
+import heapq
+import random
+import sys
 import requests
-from typing import Dict, Optional, Union
+import urllib3
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from fractions import Fraction
 class FluxImageGenerator:
     """用于生成 Flux AI 图像的类"""
@@ -20,14 +29,43 @@ class FluxImageGenerator:
     # 宽高比限制
     MIN_ASPECT_RATIO = Fraction(9, 21)  # 9:21
     MAX_ASPECT_RATIO = Fraction(21, 9)  # 21:9
-    def __init__(self, api_key: Optional[str] = None):
+    # 生成失败、不会再变化的任务状态
+    FAILED_STATUSES = {'Error', 'Request Moderated', 'Content Moderated', 'Task not found'}
+    # 轮询间隔：从POLL_INITIAL开始按POLL_MULTIPLIER增长，最长POLL_MAX秒
+    POLL_INITIAL = 0.5
+    POLL_MAX = 8.0
+    POLL_MULTIPLIER = 1.5
+    # 单个任务的默认等待上限（秒）
+    DEFAULT_TIMEOUT = 600.0
+    # 单个HTTP请求的超时 (连接, 读取)
+    REQUEST_TIMEOUT = (10, 60)
+    # 提交任务遇到限流或连接失败时的重试次数
+    SUBMIT_RETRIES = 3
+    # 下载中断后续传的次数，以及每次写入的块大小
+    DOWNLOAD_RETRIES = 3
+    DOWNLOAD_CHUNK_SIZE = 64 * 1024
+    def __init__(self,
+                 api_key: Optional[str] = None,
+                 base_url: Optional[str] = None,
+                 max_connections: int = 16):
         """
         初始化生成器
         api_key: API密钥，如果未提供则从环境变量BFL_API_KEY中获取
+        base_url: API地址，如果未提供则从环境变量BFL_BASE_URL中获取（可指向本地测试服务）
+        max_connections: 连接池大小，批量模式下应不小于同时进行的请求数
         """
         self.api_key = api_key or os.environ.get("BFL_API_KEY")
         if not self.api_key:
             raise ValueError("API key must be provided either directly or via BFL_API_KEY environment variable")
+        self.base_url = (base_url or os.environ.get("BFL_BASE_URL") or self.BASE_URL).rstrip('/')
+        # 所有请求共用一个会话，复用TLS连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update(self._get_headers())
+        # 查询次数、限流次数和其他可重试错误的次数
+        self.metrics = {'polls': 0, 'throttled': 0, 'retries': 0}
     def _get_headers(self) -> Dict[str, str]:
         """获取API请求头"""
         return {
@@ -112,34 +150,459 @@ class FluxImageGenerator:
         if seed is not None:
             request_data['seed'] = seed
         request_data.update(params)
-        response = requests.post(
-            f'{self.BASE_URL}/{model}',
-            headers=self._get_headers(),
-            json=request_data
-        )
+        response = self._request('POST', f'{self.base_url}/{model}', json=request_data)
         response.raise_for_status()
         return response.json()
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        发送提交任务的请求（收费且不幂等），只在确定服务端没有接受任务时重试：
+        限流(429)时按Retry-After或退避时间重试，连接阶段失败（请求未发出）时按退避时间重试；
+        5xx和读取超时可能发生在任务已创建之后，重试会重复生成并计费，因此直接返回或抛出
+        """
+        for attempt in range(self.SUBMIT_RETRIES + 1):
+            try:
+                response = self.session.request(method, url, timeout=self.REQUEST_TIMEOUT, **kwargs)
+            except requests.ConnectionError as e:
+                if not self._not_sent(e) or attempt == self.SUBMIT_RETRIES:
+                    raise
+                time.sleep(self.POLL_INITIAL * self.POLL_MULTIPLIER ** attempt)
+                continue
+            if response.status_code != 429 or attempt == self.SUBMIT_RETRIES:
+                return response
+            self.metrics['throttled'] += 1
+            retry_after = self._retry_after(response)
+            time.sleep(retry_after if retry_after is not None
+                       else self.POLL_INITIAL * self.POLL_MULTIPLIER ** attempt)
+        return response
+    @staticmethod
+    def _not_sent(error: requests.ConnectionError) -> bool:
+        """连接超时或建立连接失败（含DNS解析失败）：请求没有发出"""
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, urllib3.exceptions.NewConnectionError)
+    @staticmethod
+    def _is_retryable(response: requests.Response) -> bool:
+        return response.status_code == 429 or response.status_code >= 500
+    @staticmethod
+    def _retry_after(response: requests.Response) -> Optional[float]:
+        """解析Retry-After响应头（秒数或HTTP日期），没有或无法解析时返回None"""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, when.timestamp() - time.time())
     def get_result(self, request_id: str) -> Dict:
         """获取生成结果"""
-        response = requests.get(
-            f'{self.BASE_URL}/get_result',
-            headers=self._get_headers(),
-            params={'id': request_id}
+        response = self.session.get(
+            f'{self.base_url}/get_result',
+            params={'id': request_id},
+            timeout=self.REQUEST_TIMEOUT
         )
         response.raise_for_status()
         return response.json()
-    def wait_for_result(self, request_id: str, interval: float = 0.5) -> Dict:
-        """等待并获取生成结果"""
+    def poll(self, request_id: str) -> Tuple[Optional[Dict], Optional[float]]:
+        """
+        查询一次结果
+        返回 (结果, Retry-After秒数)；限流、服务端错误或连接错误时结果为None，应稍后重试
+        其他HTTP错误抛出异常
+        """
+        self.metrics['polls'] += 1
+        try:
+            response = self.session.get(
+                f'{self.base_url}/get_result',
+                params={'id': request_id},
+                timeout=self.REQUEST_TIMEOUT
+            )
+        except (requests.ConnectionError, requests.Timeout):
+            self.metrics['retries'] += 1
+            return None, None
+        if self._is_retryable(response):
+            if response.status_code == 429:
+                self.metrics['throttled'] += 1
+            else:
+                self.metrics['retries'] += 1
+            return None, self._retry_after(response)
+        response.raise_for_status()
+        return response.json(), None
+    def _new_schedule(self, interval: Optional[float], timeout: Optional[float]) -> 'PollSchedule':
+        return PollSchedule(
+            self.POLL_INITIAL if interval is None else interval,
+            self.POLL_MAX,
+            self.POLL_MULTIPLIER,
+            self.DEFAULT_TIMEOUT if timeout is None else timeout
+        )
+    def wait_for_result(self,
+                        request_id: str,
+                        interval: Optional[float] = None,
+                        timeout: Optional[float] = None) -> Dict:
+        """
+        等待并获取生成结果
+        interval: 第一次查询前的等待时间，之后按指数退避（带抖动）逐渐加长，最长POLL_MAX秒
+        timeout: 总的等待时间上限，超过后抛出TimeoutError
+        生成失败（出错、被审核拦截）时抛出GenerationError
+        """
+        schedule = self._new_schedule(interval, timeout)
+        last_status = None
+        time.sleep(schedule.next_delay())
         while True:
-            result = self.get_result(request_id)
-            if result["status"] == "Ready":
-                return result
-            print(f"Status: {result['status']}")
-            time.sleep(interval)
+            result, retry_after = self.poll(request_id)
+            schedule.polls += 1
+            if result is not None:
+                status = result.get('status')
+                if status == 'Ready':
+                    return result
+                if status in self.FAILED_STATUSES:
+                    raise GenerationError(request_id, status)
+                # 只在状态变化时输出
+                if status != last_status:
+                    print(f"Status: {status}", file=sys.stderr)
+                    last_status = status
+            if schedule.expired():
+                raise TimeoutError(f"Generation {request_id} not ready after {schedule.timeout:g}s "
+                                   f"({schedule.polls} polls)")
+            time.sleep(schedule.next_delay(retry_after))
+    def generate_batch(self,
+                       jobs: Iterable[Dict],
+                       max_in_flight: int = 8,
+                       interval: Optional[float] = None,
+                       timeout: Optional[float] = None) -> Iterator[Dict]:
+        """
+        并发生成多张图像，按完成顺序产出每个任务的结果
+        jobs: 任务列表，每个任务为generate的关键字参数（prompt、model、seed等）
+        max_in_flight: 同时进行（已提交、未完成）的任务数上限
+        interval, timeout: 同wait_for_result，对每个任务分别计算
+        所有任务的查询由同一个调度循环按各自的下次查询时间进行，到期的查询并发发出；
+        收到Retry-After时所有查询都推迟到该时间之后。
+        产出 {'index': 序号, 'job': 任务, 'id': 请求ID, 'polls': 查询次数,
+        'generate_s': 提交到完成的秒数, 'result': 结果} 或带 'error' 的字典
+        """
+        queue = deque(enumerate(jobs))
+        pending = {}  # 请求ID -> (序号, 任务, 轮询状态)
+        due = []  # (下次查询时间, 请求ID) 组成的堆
+        not_before = 0.0  # 限流时所有查询推迟到该时间之后
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            while queue or pending:
+                # 补充提交新任务，使进行中的任务数不超过上限
+                submits = []
+                while queue and len(pending) + len(submits) < max_in_flight:
+                    index, job = queue.popleft()
+                    submits.append((index, job, executor.submit(self.generate, **job)))
+                for index, job, future in submits:
+                    try:
+                        request = future.result()
+                    except Exception as e:
+                        yield {'index': index, 'job': job, 'error': str(e)}
+                        continue
+                    schedule = self._new_schedule(interval, timeout)
+                    pending[request['id']] = (index, job, schedule)
+                    heapq.heappush(due, (time.monotonic() + schedule.next_delay(), request['id']))
+                if not pending:
+                    continue
+                # 等到最早的查询时间，然后同时查询所有已到期的任务
+                time.sleep(max(0.0, max(due[0][0], not_before) - time.monotonic()))
+                now = time.monotonic()
+                polls = {}
+                while due and due[0][0] <= now:
+                    _, request_id = heapq.heappop(due)
+                    polls[request_id] = executor.submit(self.poll, request_id)
+                for request_id, future in polls.items():
+                    index, job, schedule = pending[request_id]
+                    schedule.polls += 1
+                    item = {'index': index, 'job': job, 'id': request_id, 'polls': schedule.polls,
+                            'generate_s': round(schedule.elapsed(), 3)}
+                    try:
+                        result, retry_after = future.result()
+                    except Exception as e:
+                        del pending[request_id]
+                        yield dict(item, error=str(e))
+                        continue
+                    status = result.get('status') if result is not None else None
+                    if status == 'Ready':
+                        del pending[request_id]
+                        yield dict(item, result=result['result'])
+                        continue
+                    if status in self.FAILED_STATUSES:
+                        del pending[request_id]
+                        yield dict(item, status=status, error=f"Generation failed: {status}")
+                        continue
+                    if schedule.expired():
+                        del pending[request_id]
+                        yield dict(item, error=f"Timed out after {schedule.timeout:g}s")
+                        continue
+                    if retry_after is not None:
+                        not_before = max(not_before, time.monotonic() + retry_after)
+                    heapq.heappush(due, (time.monotonic() + schedule.next_delay(retry_after),
+                                         request_id))
+    def download(self, url: str, path: str) -> int:
+        """
+        流式下载文件到path，返回文件大小
+        先写入 path.part，下载中断时按已写入的大小用Range请求续传，完成后再重命名为path。
+        path.part.url 记录 .part 文件对应的地址，
+        地址不同（其他任务或重新生成的图片）时丢弃已下载的部分。
+        """
+        part_path = path + '.part'
+        url_path = part_path + '.url'
+        if os.path.exists(part_path) and self._read_part_url(url_path) != url:
+            os.remove(part_path)
+        with open(url_path, 'w', encoding='utf-8') as f:
+            f.write(url)
+        for attempt in range(self.DOWNLOAD_RETRIES + 1):
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
+            try:
+                with self.session.get(url, headers=headers, stream=True,
+                                      timeout=self.REQUEST_TIMEOUT) as response:
+                    if response.status_code == 416:
+                        # 已下载完整，服务端没有更多内容
+                        break
+                    response.raise_for_status()
+                    # 服务端不支持Range时返回200和完整内容，从头写入；
+                    # 206的起始位置不对时同样从头下载
+                    content_range = response.headers.get('Content-Range', '')
+                    resumed = (offset and response.status_code == 206 and
+                               content_range.startswith(f'bytes {offset}-'))
+                    if offset and response.status_code == 206 and not resumed:
+                        os.remove(part_path)
+                        continue
+                    mode = 'ab' if resumed else 'wb'
+                    with open(part_path, mode) as f:
+                        for chunk in response.iter_content(self.DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+                break
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError):
+                if attempt == self.DOWNLOAD_RETRIES:
+                    raise
+                time.sleep(self.POLL_INITIAL * self.POLL_MULTIPLIER ** attempt)
+        else:
+            # 每次续传都返回起始位置不对的206，已下载的部分已经丢弃
+            if os.path.exists(url_path):
+                os.remove(url_path)
+            raise DownloadError(url, "the last resume attempt got a 206 response whose "
+                                     "Content-Range did not match the partial file")
+        os.replace(part_path, path)
+        os.remove(url_path)
+        return os.path.getsize(path)
+    @staticmethod
+    def _read_part_url(url_path: str) -> Optional[str]:
+        try:
+            with open(url_path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+    def save_result(self, result: Dict, job: Dict, output_dir: str) -> Dict:
+        """
+        下载生成的图片并保存提示词
+        job为生成时的请求参数（prompt、model、seed、尺寸/宽高比）。文件名为
+        <提示词md5>.<请求参数哈希>.s<seed>.jpeg，模型或尺寸不同的请求不会写入同一个文件；
+        没有seed时为 <提示词md5>.t<时间戳>.jpeg。提示词保存为 <提示词md5>.txt
+        返回 {'path', 'prompt_file', 'bytes', 'sha256', 'download_s'}
+        """
+        prompt = job['prompt']
+        os.makedirs(output_dir, exist_ok=True)
+        base = os.path.join(output_dir, prompt_hash(prompt))
+        prompt_file = base + '.txt'
+        # 提示词文件不存在或为空时才写入
+        if not os.path.exists(prompt_file) or os.path.getsize(prompt_file) == 0:
+            with open(prompt_file, 'w', encoding='utf-8') as f:
+                f.write(prompt)
+        seed = result.get('seed', job.get('seed'))
+        if seed is not None:
+            path = f"{base}.{file_key(dict(job, seed=seed))}.s{seed}.jpeg"
+        else:
+            path = f"{base}.t{time.time():.9f}.jpeg"
+        start = time.monotonic()
+        size = self.download(result['sample'], path)
+        return {'path': path, 'prompt_file': prompt_file, 'bytes': size,
+                'sha256': file_sha256(path), 'download_s': round(time.monotonic() - start, 3)}
+# 任务的尺寸参数，flux-pro-1.1使用width/height，flux-pro-1.1-ultra使用aspect_ratio
+DIMENSION_FIELDS = ('width', 'height', 'aspect_ratio')
+class GenerationError(Exception):
+    """生成任务以失败状态结束（出错、被审核拦截、任务不存在）"""
+    def __init__(self, request_id: str, status: str):
+        super().__init__(f"Generation {request_id} failed: {status}")
+        self.request_id = request_id
+        self.status = status
+class DownloadError(Exception):
+    """重试后仍未下载到完整的图片"""
+    def __init__(self, url: str, reason: str):
+        super().__init__(f"Download of {url} failed: {reason}")
+        self.url = url
+        self.reason = reason
+class PollSchedule:
+    """单个请求的轮询时间：指数退避加抖动，遵守Retry-After，并有总的截止时间"""
+    def __init__(self, initial: float, maximum: float, multiplier: float, timeout: float):
+        self.delay = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+        self.timeout = timeout
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout
+        self.polls = 0
+    def expired(self) -> bool:
+        return time.monotonic() >= self.deadline
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+    def next_delay(self, retry_after: Optional[float] = None) -> float:
+        """返回距下次查询的等待时间，不超过截止时间"""
+        if retry_after is not None:
+            delay = retry_after
+        else:
+            # 在 [delay/2, delay] 之间随机，避免大量任务同时查询
+            delay = random.uniform(self.delay / 2, self.delay)
+            self.delay = min(self.delay * self.multiplier, self.maximum)
+        return max(0.0, min(delay, self.deadline - time.monotonic()))
+class ResultCache:
+    """
+    已下载图片的清单，保存在输出目录的 .flux-cache.jsonl 中
+    只缓存确定性的请求（指定了seed）：提示词、模型、seed和尺寸/宽高比都相同时返回已下载的图片；
+    命中时确认图片文件名中的请求参数哈希、文件大小和sha256都与记录一致
+    """
+    FILENAME = '.flux-cache.jsonl'
+    KEY_FIELDS = ('prompt', 'model', 'seed', 'width', 'height', 'aspect_ratio')
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, self.FILENAME)
+        self.entries = {}
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 写入中断留下的不完整行
+                    continue
+                self.entries[entry['key']] = entry['record']
+    @classmethod
+    def key(cls, job: Dict) -> Optional[str]:
+        """请求参数的哈希，没有seed（结果不确定）时返回None"""
+        if job.get('seed') is None:
+            return None
+        return request_hash(job)
+    def get(self, key: Optional[str]) -> Optional[Dict]:
+        """返回已下载图片的记录，图片文件已不存在、属于其他请求或内容已变化时视为未命中"""
+        record = self.entries.get(key) if key else None
+        if record is None or 'sha256' not in record:
+            return None
+        path = record.get('path', '')
+        # 文件名中的请求参数哈希即key的前16位（见file_key）
+        if f".{key[:16]}." not in os.path.basename(path):
+            return None
+        try:
+            if (os.path.getsize(path) != record.get('bytes')
+                    or file_sha256(path) != record['sha256']):
+                return None
+        except OSError:
+            return None
+        return record
+    def put(self, key: Optional[str], record: Dict) -> None:
+        if not key:
+            return
+        self.entries[key] = record
+        # 追加写入，清单损坏时最多丢失最后一行
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'key': key, 'record': record}, ensure_ascii=False) + '\n')
+def cached_record(record: Dict, index: int) -> Dict:
+    """缓存命中时输出的记录"""
+    record = dict(record, index=index, cached=True)
+    record.pop('timings', None)
+    return record
+def request_hash(job: Dict) -> str:
+    """请求参数（ResultCache.KEY_FIELDS）的sha256"""
+    params = {name: job[name] for name in ResultCache.KEY_FIELDS if job.get(name) is not None}
+    return hashlib.sha256(
+        json.dumps(params, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    ).hexdigest()
+def file_key(job: Dict) -> str:
+    """图片文件名中的请求参数哈希，取前16位"""
+    return request_hash(job)[:16]
+def file_sha256(path: str) -> str:
+    """文件内容的sha256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+def prompt_hash(prompt: str) -> str:
+    """提示词的md5，用作保存文件名"""
+    return hashlib.md5(prompt.encode('utf-8')).hexdigest()
+def job_record(item: Dict) -> Dict:
+    """把generate_batch产出的结果整理为输出记录"""
+    job = item['job']
+    record = {'index': item['index'], 'id': item.get('id'), 'prompt': job['prompt']}
+    if 'error' in item:
+        record['error'] = item['error']
+        return record
+    result = item['result']
+    record.update(seed=result.get('seed', job.get('seed')), sample=result.get('sample'),
+                  polls=item['polls'], timings={'generate_s': item['generate_s']})
+    return record
+def emit(record: Dict) -> None:
+    # 每个任务输出一行JSON，保留非ASCII字符原样
+    print(json.dumps(record, ensure_ascii=False), flush=True)
+def infer_model(job: Dict) -> str:
+    """根据尺寸参数推断模型：指定了aspect_ratio时为flux-pro-1.1-ultra，否则为flux-pro-1.1"""
+    return 'flux-pro-1.1-ultra' if job.get('aspect_ratio') is not None else 'flux-pro-1.1'
+def apply_defaults(job: Dict, defaults: Optional[Dict] = None) -> Dict:
+    """
+    用命令行实际给出的参数补全任务
+    尺寸参数（width、height、aspect_ratio）只在任务自己没有指定任何一个时补全，且只补全任务指定的模型支持的参数；
+    任务没有model时，按任务自己的尺寸参数推断，没有尺寸参数时使用--model，都没有时按补全后的尺寸推断
+    """
+    defaults = {key: value for key, value in (defaults or {}).items() if value is not None}
+    own_dimensions = any(job.get(key) is not None for key in DIMENSION_FIELDS)
+    if not own_dimensions:
+        supported = FluxImageGenerator.SUPPORTED_MODELS.get(job.get('model'), DIMENSION_FIELDS)
+        for key in DIMENSION_FIELDS:
+            if key in defaults and key in supported:
+                job[key] = defaults[key]
+    if job.get('seed') is None and 'seed' in defaults:
+        job['seed'] = defaults['seed']
+    if job.get('model') is None:
+        if 'model' in defaults and not own_dimensions:
+            job['model'] = defaults['model']
+        else:
+            job['model'] = infer_model(job)
+    return job
 def read_prompt_file(file_path: str) -> str:
     """从文件中读取提示词"""
     with open(file_path, 'r', encoding='utf-8') as f:
         return f.read().strip()
+def load_jobs(file_path: str, defaults: Optional[Dict] = None) -> List[Dict]:
+    """
+    从文件读取批量任务
+    .jsonl文件（或以{开头的行）每行一个JSON对象，包含prompt及可选的model、seed、width、height、aspect_ratio；
+    其他行每行作为一个提示词。defaults为命令行给出的参数，按apply_defaults补全任务。
+    """
+    jobs = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if file_path.endswith('.jsonl') or line.startswith('{'):
+                try:
+                    job = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{file_path}:{line_number}: invalid JSON: {e}") from e
+                if 'aspect-ratio' in job:
+                    job['aspect_ratio'] = job.pop('aspect-ratio')
+                unknown = set(job) - {'prompt', 'model', 'seed', 'width', 'height', 'aspect_ratio'}
+                if unknown or not job.get('prompt'):
+                    raise ValueError(f"{file_path}:{line_number}: job needs a prompt "
+                                     f"and only prompt/model/seed/width/height/aspect_ratio")
+            else:
+                job = {'prompt': line}
+            jobs.append(apply_defaults(job, defaults))
+    return jobs
 def validate_dimension_arg(value: Optional[str]) -> Optional[int]:
     """验证并转换命令行传入的尺寸参数"""
     if value is None:
@@ -148,6 +611,93 @@ def validate_dimension_arg(value: Optional[str]) -> Optional[int]:
         return int(value)
     except ValueError:
         raise argparse.ArgumentTypeError(f"'{value}' is not a valid integer")
+def run_batch(args) -> int:
+    """批量模式：每个任务完成（指定--output-dir时为下载完成）时输出一行JSON，最后输出汇总记录"""
+    defaults = {'model': args.model, 'seed': args.seed, 'width': args.width,
+                'height': args.height, 'aspect_ratio': args.aspect_ratio}
+    try:
+        jobs = load_jobs(args.batch, defaults)
+        generator = FluxImageGenerator(api_key=args.api_key, base_url=args.base_url,
+                                       max_connections=args.max_in_flight + args.download_jobs)
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+    cache = ResultCache(args.output_dir) if args.output_dir else None
+    failed = 0
+    cached = 0
+    generated = 0
+    # 相同的确定性请求只提交一次，其余任务在第一个任务完成时输出同样的结果
+    keys = [ResultCache.key(job) for job in jobs]
+    first = {}  # 请求哈希 -> 第一个任务的序号
+    duplicates = {}  # 第一个任务的序号 -> 重复任务的序号
+    submitted = []  # 实际提交的任务序号
+    for index, key in enumerate(keys):
+        hit = cache.get(key) if cache is not None and not args.force else None
+        if hit is not None:
+            cached += 1
+            emit(cached_record(hit, index))
+        elif key is not None and key in first:
+            duplicates.setdefault(first[key], []).append(index)
+        else:
+            if key is not None:
+                first[key] = index
+            submitted.append(index)
+    def complete(record):
+        nonlocal failed, generated
+        index = record['index']
+        records = [record] + [dict(record, index=duplicate, duplicate_of=index)
+                              for duplicate in duplicates.get(index, [])]
+        if 'error' in record:
+            failed += len(records)
+        else:
+            generated += 1
+            if cache is not None and 'path' in record:
+                cache.put(keys[index], record)
+        for item in records:
+            emit(item)
+    downloads = {}  # future -> 输出记录
+    def finish(done):
+        for future in done:
+            record = downloads.pop(future)
+            try:
+                saved = future.result()
+            except Exception as e:
+                record['error'] = f"Download failed: {str(e)}"
+            else:
+                record['timings']['download_s'] = saved.pop('download_s')
+                record.update(saved)
+            complete(record)
+    # 生成完成的图片交给下载线程池并行下载，与其他任务的轮询同时进行
+    with ThreadPoolExecutor(max_workers=args.download_jobs) as executor:
+        results = generator.generate_batch([jobs[index] for index in submitted],
+                                           max_in_flight=args.max_in_flight,
+                                           timeout=args.timeout)
+        for item in results:
+            item['index'] = submitted[item['index']]
+            record = job_record(item)
+            if 'error' not in record and args.output_dir:
+                future = executor.submit(generator.save_result, item['result'],
+                                         item['job'], args.output_dir)
+                downloads[future] = record
+            else:
+                complete(record)
+            finish([future for future in downloads if future.done()])
+        while downloads:
+            done, _ = wait(list(downloads), return_when=FIRST_COMPLETED)
+            finish(done)
+    # 最后输出汇总记录，包括平均每张生成的图片的查询次数
+    ready = len(jobs) - failed
+    emit({
+        'summary': True,
+        'jobs': len(jobs),
+        'ready': ready,
+        'failed': failed,
+        'cached': cached,
+        'coalesced': sum(len(indices) for indices in duplicates.values()),
+        **generator.metrics,
+        'polls_per_image': round(generator.metrics['polls'] / generated, 2) if generated else None,
+    })
+    return 1 if failed else 0
 def main():
     parser = argparse.ArgumentParser(
         description='Generate images using Flux AI models',
@@ -163,12 +713,17 @@ def main():
 示例:
   %(prog)s --prompt "风景画" --model flux-pro-1.1 --width 1024 --height 768
   %(prog)s --prompt "城市夜景" --model flux-pro-1.1-ultra --aspect-ratio 16:9
+  %(prog)s --batch prompts.txt --model flux-pro-1.1-ultra --aspect-ratio 16:9 --max-in-flight 8
+  %(prog)s --batch jobs.jsonl   # 每行 {"prompt": "...", "seed": 1, "aspect_ratio": "1:1"}
+批量模式中命令行的 --width/--height/--aspect-ratio 只用于没有指定任何尺寸参数的任务，
+没有 model 的任务按自己的尺寸参数推断模型（aspect_ratio 为 ultra，否则为 flux-pro-1.1）。
         """
     )
     parser.add_argument('--prompt', type=str, help='Text prompt for image generation')
     parser.add_argument('--prompt-file', type=str, help='File containing the prompt')
     parser.add_argument('--model', type=str, choices=['flux-pro-1.1', 'flux-pro-1.1-ultra'],
-                      default='flux-pro-1.1', help='Model to use for generation')
+                      help='Model to use for generation (default: flux-pro-1.1-ultra with '
+                           '--aspect-ratio, flux-pro-1.1 otherwise)')
     parser.add_argument('--seed', type=int, help='Random seed for generation')
     parser.add_argument('--width', type=validate_dimension_arg,
                       help='Image width (flux-pro-1.1 only, 256-1440, multiple of 32)')
@@ -177,30 +732,73 @@ def main():
     parser.add_argument('--aspect-ratio', type=str,
                       help='Image aspect ratio (flux-pro-1.1-ultra only, between 9:21 and 21:9)')
     parser.add_argument('--api-key', type=str, help='BFL API key (optional, can use BFL_API_KEY env var)')
+    parser.add_argument('--base-url', type=str,
+                      help='API base URL (optional, can use BFL_BASE_URL env var)')
+    parser.add_argument('--batch', type=str,
+                      help='File with one prompt per line, '
+                           'or JSONL jobs with prompt/seed/aspect_ratio/...')
+    parser.add_argument('--max-in-flight', type=int, default=8,
+                      help='Maximum number of concurrent jobs in batch mode (default: 8)')
+    parser.add_argument('--timeout', type=float, default=FluxImageGenerator.DEFAULT_TIMEOUT,
+                      help='Give up on a generation after this many seconds (default: 600)')
+    parser.add_argument('--output-dir', type=str,
+                      help='Download images into this directory as '
+                           '<md5(prompt)>.<request hash>.s<seed>.jpeg next to <md5(prompt)>.txt')
+    parser.add_argument('--download-jobs', type=int, default=4,
+                      help='Parallel downloads in batch mode (default: 4)')
+    parser.add_argument('--force', action='store_true',
+                      help='Generate again even if an identical seeded request '
+                           'was already downloaded')
     args = parser.parse_args()
-    if not args.prompt and not args.prompt_file:
-        parser.error("Either --prompt or --prompt-file must be provided")
-    if args.prompt and args.prompt_file:
-        parser.error("Cannot use both --prompt and --prompt-file")
+    if sum(bool(source) for source in (args.prompt, args.prompt_file, args.batch)) != 1:
+        parser.error("Exactly one of --prompt, --prompt-file or --batch must be provided")
+    if args.max_in_flight < 1 or args.download_jobs < 1:
+        parser.error("--max-in-flight and --download-jobs must be at least 1")
+    if args.output_dir:
+        args.output_dir = os.path.expanduser(args.output_dir)
+    if args.batch:
+        return run_batch(args)
     prompt = args.prompt if args.prompt else read_prompt_file(args.prompt_file)
+    job = {'prompt': prompt, 'model': args.model, 'seed': args.seed, 'width': args.width,
+           'height': args.height, 'aspect_ratio': args.aspect_ratio}
+    job['model'] = args.model or infer_model(job)
+    cache = ResultCache(args.output_dir) if args.output_dir else None
+    # 相同的确定性请求已经下载过时直接返回，不再调用API
+    hit = cache.get(ResultCache.key(job)) if cache is not None and not args.force else None
+    if hit is not None:
+        print("Using cached image", file=sys.stderr)
+        emit(cached_record(hit, 0))
+        return 0
     try:
-        generator = FluxImageGenerator(api_key=args.api_key)
+        generator = FluxImageGenerator(api_key=args.api_key, base_url=args.base_url)
         # 生成图像
         request = generator.generate(
             prompt=prompt,
-            model=args.model,
+            model=job['model'],
             seed=args.seed,
             width=args.width,
             height=args.height,
             aspect_ratio=args.aspect_ratio
         )
-        print(f"Generation requested, ID: {request['id']}")
+        start = time.monotonic()
+        print(f"Generation requested, ID: {request['id']}", file=sys.stderr)
         # 等待结果
-        result = generator.wait_for_result(request['id'])
-        print(f"Generation complete!")
-        print(f"Result: {json.dumps(result['result'], indent=2)}")
+        result = generator.wait_for_result(request['id'], timeout=args.timeout)['result']
+        print(f"Generation complete!", file=sys.stderr)
+        record = job_record({'index': 0, 'job': {'prompt': prompt, 'seed': args.seed},
+                             'id': request['id'], 'result': result,
+                             'polls': generator.metrics['polls'],
+                             'generate_s': round(time.monotonic() - start, 3)})
+        if args.output_dir:
+            saved = generator.save_result(result, job, args.output_dir)
+            record['timings']['download_s'] = saved.pop('download_s')
+            record.update(saved)
+            if cache is not None:
+                cache.put(ResultCache.key(job), record)
+        # 标准输出只有这一行JSON，状态信息输出到标准错误
+        emit(record)
     except Exception as e:
-        print(f"Error: {str(e)}")
+        print(f"Error: {str(e)}", file=sys.stderr)
         return 1
     return 0
 if __name__ == '__main__':
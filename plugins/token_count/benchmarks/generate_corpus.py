@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""生成token_count基准测试用的合成语料
+
+语料包括：
+- small/      大量小源码文件（.py .js .md .fish .json）
+- logs/       少量超过流式统计阈值的大日志文件
+- encodings/  GBK、Latin-1、带BOM的UTF-16文件
+- pdfs/       多页PDF（内置的最小PDF写入器生成，不依赖其他库）
+
+同样的 --seed 和 --scale 生成的语料完全相同，便于在不同提交之间比较。
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+WORDS = (
+    'the of and to in is for on that with as are this be by from at or an it not which '
+    'token count file text encoding stream chunk buffer index cache page worker process '
+    'result summary budget priority magic detect extract parse value error return yield'
+).split()
+IDENTIFIERS = ['path', 'data', 'result', 'count', 'index', 'chunk', 'buffer', 'options',
+               'records', 'summary', 'encoding', 'tokens', 'pages', 'worker', 'cache']
+CHINESE = ('的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动'
+           '同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二'
+           '理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义'
+           '文件编码统计令牌缓存索引页面进程结果汇总预算优先级检测提取解析错误返回')
+LATIN1_WORDS = ['café', 'naïve', 'façade', 'señor', 'über', 'smørrebrød', 'déjà', 'vu',
+                'résumé', 'crème', 'brûlée', 'jalapeño', 'Ångström', 'Noël', 'piñata']
+LOG_LEVELS = ['DEBUG', 'INFO', 'INFO', 'INFO', 'WARN', 'ERROR']
+LOG_MESSAGES = [
+    'request {id} completed in {ms}ms status={status}',
+    'cache {word} for key={hex} size={size}',
+    'worker-{n} processed {size} records from {word}/{word}.log',
+    'retrying {word} after {ms}ms (attempt {n})',
+    'connection from 10.0.{n}.{id} closed: {word} {word}',
+]
+
+def sentence(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+def python_source(rng, size):
+    lines = ['import os', 'import sys', '']
+    while sum(len(line) + 1 for line in lines) < size:
+        name = rng.choice(IDENTIFIERS)
+        arg = rng.choice(IDENTIFIERS)
+        lines.append(f'def {name}_{rng.randrange(1000)}({arg}, {rng.choice(IDENTIFIERS)}=None):')
+        lines.append(f'    """{sentence(rng, rng.randint(4, 12))}"""')
+        for _ in range(rng.randint(2, 8)):
+            lines.append(f'    {rng.choice(IDENTIFIERS)} = {arg}.get({rng.randrange(100)!r}) '
+                         f'or {rng.randrange(1 << 16)}')
+        lines.append(f'    return {arg}')
+        lines.append('')
+    return '\n'.join(lines) + '\n'
+
+def javascript_source(rng, size):
+    lines = []
+    while sum(len(line) + 1 for line in lines) < size:
+        name = rng.choice(IDENTIFIERS)
+        lines.append(f'export function {name}{rng.randrange(1000)}({rng.choice(IDENTIFIERS)}) {{')
+        lines.append(f'  // {sentence(rng, rng.randint(4, 10))}')
+        constant = rng.choice(IDENTIFIERS)
+        values = ', '.join(str(rng.randrange(99)) for _ in range(6))
+        lines.append(f'  const {constant} = [{values}];')
+        lines.append(f'  return {name}.map((x) => x * {rng.randrange(10)});')
+        lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+def markdown_source(rng, size):
+    lines = []
+    while sum(len(line) + 1 for line in lines) < size:
+        lines.append(f'## {sentence(rng, 3).title()}')
+        lines.append('')
+        lines.append(sentence(rng, rng.randint(20, 60)) + '.')
+        lines.append('')
+        lines.append(f'- `{rng.choice(IDENTIFIERS)}`: {sentence(rng, 8)}')
+        lines.append('')
+    return '\n'.join(lines) + '\n'
+
+def fish_source(rng, size):
+    lines = []
+    while sum(len(line) + 1 for line in lines) < size:
+        name = rng.choice(IDENTIFIERS)
+        lines.append(f'function {name}_{rng.randrange(1000)}')
+        lines.append(f'    # {sentence(rng, 6)}')
+        lines.append(f'    set -l {name} (string split , -- $argv[1])')
+        lines.append(f'    for item in ${name}')
+        lines.append('        echo $item')
+        lines.append('    end')
+        lines.append('end')
+    return '\n'.join(lines) + '\n'
+
+def json_source(rng, size):
+    items = []
+    while len(items) * 60 < size:
+        items.append({rng.choice(IDENTIFIERS): rng.randrange(1 << 20),
+                      'text': sentence(rng, 5)})
+    return json.dumps(items, indent=2) + '\n'
+
+SOURCES = {
+    '.py': python_source,
+    '.js': javascript_source,
+    '.md': markdown_source,
+    '.fish': fish_source,
+    '.json': json_source,
+}
+
+def log_lines(rng):
+    """无限产出日志行"""
+    second = 0
+    while True:
+        second += rng.randint(0, 2)
+        message = rng.choice(LOG_MESSAGES).format(
+            id=rng.randrange(256), ms=rng.randrange(5000), status=rng.choice([200, 200, 404, 500]),
+            word=rng.choice(WORDS), hex=f'{rng.getrandbits(64):016x}', size=rng.randrange(1 << 20),
+            n=rng.randrange(64)
+        )
+        yield (f'2024-01-{1 + second // 86400 % 28:02d}T{second // 3600 % 24:02d}:'
+               f'{second // 60 % 60:02d}:{second % 60:02d}Z {rng.choice(LOG_LEVELS):5} {message}\n')
+
+def write_log(path, size, rng):
+    lines = log_lines(rng)
+    written = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        while written < size:
+            block = ''.join(next(lines) for _ in range(2000))
+            f.write(block)
+            written += len(block)
+
+def chinese_text(rng, chars):
+    lines = []
+    total = 0
+    while total < chars:
+        line = ''.join(rng.choice(CHINESE) for _ in range(rng.randint(20, 60))) + '。'
+        lines.append(line)
+        total += len(line) + 1
+    return '\n'.join(lines) + '\n'
+
+def latin1_text(rng, chars):
+    lines = []
+    total = 0
+    while total < chars:
+        words = [rng.choice(LATIN1_WORDS if rng.random() < 0.3 else WORDS)
+                 for _ in range(rng.randint(8, 20))]
+        line = ' '.join(words) + '.'
+        lines.append(line)
+        total += len(line) + 1
+    return '\n'.join(lines) + '\n'
+
+def pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def write_pdf(path, pages):
+    """写入一个最小的多页PDF，pages为每页的文本行列表，使用Helvetica字体"""
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    font = add(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+    page_ids = []
+    content_ids = []
+    for lines in pages:
+        stream = ['BT /F1 11 Tf 14 TL 50 780 Td']
+        stream.extend(f'({pdf_escape(line)}) Tj T*' for line in lines)
+        stream.append('ET')
+        data = '\n'.join(stream).encode('latin-1')
+        content_ids.append(add(b'<< /Length %d >>\nstream\n' % len(data) + data + b'\nendstream'))
+        page_ids.append(add(None))
+    pages_id = add(None)
+    catalog = add(b'<< /Type /Catalog /Pages %d 0 R >>' % pages_id)
+    for content_id, page_id in zip(content_ids, page_ids):
+        objects[page_id - 1] = (
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] '
+            b'/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>'
+            % (pages_id, font, content_id)
+        )
+    kids = b' '.join(b'%d 0 R' % page_id for page_id in page_ids)
+    objects[pages_id - 1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(page_ids))
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        out += b'%010d 00000 n \n' % offset
+    out += b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+        len(objects) + 1, catalog, xref)
+    with open(path, 'wb') as f:
+        f.write(out)
+
+def generate(out_dir, scale=1.0, seed=0, log_mb=24, logs=2):
+    """生成语料并返回清单 {类别: [{path, bytes}]}"""
+    rng = random.Random(seed)
+    manifest = {}
+
+    def record(category, path):
+        manifest.setdefault(category, []).append(
+            {'path': os.path.relpath(path, out_dir), 'bytes': os.path.getsize(path)})
+
+    small_dir = os.path.join(out_dir, 'small')
+    for i in range(max(1, int(2000 * scale))):
+        ext = rng.choice(list(SOURCES))
+        sub = os.path.join(small_dir, f'pkg{i % 20:02d}')
+        os.makedirs(sub, exist_ok=True)
+        path = os.path.join(sub, f'module_{i:05d}{ext}')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(SOURCES[ext](rng, rng.randint(200, 8000)))
+        record('small', path)
+
+    log_dir = os.path.join(out_dir, 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+    for i in range(logs):
+        path = os.path.join(log_dir, f'service_{i}.log')
+        write_log(path, int(log_mb * 1024 * 1024 * scale), rng)
+        record('logs', path)
+
+    encoding_dir = os.path.join(out_dir, 'encodings')
+    os.makedirs(encoding_dir, exist_ok=True)
+    for i in range(max(1, int(20 * scale))):
+        # .txt 扩展名已知但内容不是UTF-8，会进入编码检测层级
+        samples = [
+            (f'gbk_{i:03d}.txt', 'gbk', chinese_text(rng, rng.randint(2000, 40000))),
+            (f'latin1_{i:03d}.txt', 'latin-1', latin1_text(rng, rng.randint(2000, 40000))),
+            (f'utf16_{i:03d}.txt', 'utf-16', chinese_text(rng, rng.randint(1000, 10000))
+             + latin1_text(rng, rng.randint(1000, 10000))),
+        ]
+        for name, encoding, text in samples:
+            path = os.path.join(encoding_dir, name)
+            # Python的utf-16编解码器写入BOM
+            with open(path, 'w', encoding=encoding) as f:
+                f.write(text)
+            record('encodings', path)
+
+    pdf_dir = os.path.join(out_dir, 'pdfs')
+    os.makedirs(pdf_dir, exist_ok=True)
+    for i in range(max(1, int(5 * scale))):
+        path = os.path.join(pdf_dir, f'document_{i}.pdf')
+        page_count = rng.randint(20, 100)
+        write_pdf(path, [[f'Page {page} {sentence(rng, rng.randint(6, 12))}'
+                          for _ in range(rng.randint(30, 50))]
+                         for page in range(1, page_count + 1)])
+        record('pdfs', path)
+
+    with open(os.path.join(out_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump({'scale': scale, 'seed': seed, 'files': manifest}, f, indent=2)
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate a synthetic corpus for token_count benchmarks')
+    parser.add_argument('out', nargs='?',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus'),
+                        help='Output directory (default: benchmarks/corpus)')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Multiply file counts and log sizes by SCALE (default: 1.0)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--log-mb', type=float, default=24,
+                        help='Size of each log file in MiB before scaling (default: 24, '
+                             'above the 16 MiB streaming threshold)')
+    parser.add_argument('--logs', type=int, default=2, help='Number of log files (default: 2)')
+    args = parser.parse_args()
+
+    if os.path.exists(os.path.join(args.out, 'manifest.json')):
+        print(f"Error: {args.out} already contains a corpus, remove it first", file=sys.stderr)
+        sys.exit(1)
+    manifest = generate(args.out, args.scale, args.seed, args.log_mb, args.logs)
+    for category, files in manifest.items():
+        size = sum(item['bytes'] for item in files)
+        print(f"{category:10} {len(files):6d} files {size / 1024 / 1024:10.1f} MiB")
+
+if __name__ == '__main__':
+    main()
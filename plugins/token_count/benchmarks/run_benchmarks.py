@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""token_count 基准测试
+
+对 generate_corpus.py 生成的语料分别计时 get_file_type、classify_file、detect_encoding、
+extract_pdf_text、count_tokens 和端到端的 process_file，输出 files/sec、MB/sec 和峰值RSS。
+每个基准在独立的子进程中运行，峰值RSS互不影响。
+
+startup:* 基准计时 `python -m token_counter` 从启动到退出的耗时（startup:cold 不使用结果缓存，
+其余为缓存命中），并用 -X importtime 列出最慢的顶层导入；启动时导入了应延迟加载的模块，
+或超过 --startup-budget（startup:cold 为 --cold-budget）时退出码为1。
+
+    python benchmarks/generate_corpus.py
+    python benchmarks/run_benchmarks.py --json before.json
+    python benchmarks/run_benchmarks.py --compare before.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_CORPUS = os.path.join(BENCH_DIR, 'corpus')
+
+# 基准名称 -> 使用的语料类别
+BENCHMARKS = {
+    'get_file_type': ['small', 'encodings', 'logs', 'pdfs'],
+    'classify_file': ['small', 'encodings', 'logs', 'pdfs'],
+    'detect_encoding': ['small', 'encodings', 'logs'],
+    'extract_pdf_text': ['pdfs'],
+    'count_tokens': ['small', 'encodings'],
+    'process_file:small': ['small'],
+    'process_file:encodings': ['encodings'],
+    'process_file:logs': ['logs'],
+    'process_file:pdfs': ['pdfs'],
+    'startup:help': [],
+    'startup:text': ['small'],
+    'startup:cold': ['small'],
+}
+
+# token_counter.py 在第一次用到时才导入的模块，启动时出现即视为回归
+LAZY_MODULES = ('magic', 'chardet', 'tiktoken', 'pdfplumber', 'concurrent.futures')
+# 启动基准中允许导入的延迟加载模块：不使用缓存时必须加载tiktoken计数
+STARTUP_ALLOWED = {'startup:cold': ('tiktoken',)}
+# 启动耗时预算（毫秒）：startup:help、startup:text 和不使用结果缓存的 startup:cold
+STARTUP_BUDGET_MS = 150
+COLD_BUDGET_MS = 400
+
+def load_manifest(corpus):
+    path = os.path.join(corpus, 'manifest.json')
+    if not os.path.exists(path):
+        print(f"Error: no corpus in {corpus}, run generate_corpus.py first", file=sys.stderr)
+        sys.exit(2)
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def corpus_files(corpus, manifest, categories):
+    """返回 [(路径, 字节数)]"""
+    return [(os.path.join(corpus, item['path']), item['bytes'])
+            for category in categories for item in manifest['files'].get(category, [])]
+
+def peak_rss(who=resource.RUSAGE_SELF):
+    """当前进程（或已结束的子进程）的峰值RSS（字节），Linux上ru_maxrss单位为KB，macOS上为字节"""
+    usage = resource.getrusage(who).ru_maxrss
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+def prepare(name, files):
+    """返回 (每轮执行的函数, 文件数, 字节数)，计时不包括准备阶段"""
+    import token_counter
+
+    paths = [path for path, _ in files]
+    size = sum(size for _, size in files)
+    if name == 'get_file_type':
+        return lambda: [token_counter.get_file_type(path) for path in paths], len(paths), size
+    if name == 'classify_file':
+        return lambda: [token_counter.classify_file(path) for path in paths], len(paths), size
+    if name == 'detect_encoding':
+        # detect_encoding只读取文件头，按实际读取的字节数计算吞吐量
+        size = sum(min(size, token_counter.SNIFF_SIZE) for _, size in files)
+        return lambda: [token_counter.detect_encoding(path) for path in paths], len(paths), size
+    if name == 'extract_pdf_text':
+        return lambda: [token_counter.extract_pdf_text(path) for path in paths], len(paths), size
+    if name == 'count_tokens':
+        # 只计时token计数，文本预先解码到内存中
+        texts = []
+        for path in paths:
+            _, encoding, _ = token_counter.classify_file(path)
+            _, text = token_counter.read_with_fallback(path, encoding, token_counter.read_text_file)
+            texts.append(text)
+        texts = [text for text in texts if text is not None]
+        size = sum(len(text.encode('utf-8')) for text in texts)
+        return lambda: [token_counter.count_tokens(text) for text in texts], len(texts), size
+    if name.startswith('process_file:'):
+        return lambda: [token_counter.process_file(path) for path in paths], len(paths), size
+    raise ValueError(f"unknown benchmark: {name}")
+
+def parse_importtime(stderr):
+    """解析 -X importtime 的输出，返回 (程序导入的模块, {顶层模块: 累计微秒})
+
+    site（.pth文件、sitecustomize）中导入的模块与token_counter无关，不计入返回的模块集合。
+    """
+    modules = set()
+    nested = set()
+    top_level = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        # 嵌套的导入按层级缩进，并且在其所属的顶层模块之前输出
+        if name[1:].startswith(' '):
+            nested.add(name.strip())
+            continue
+        top_level[name.strip()] = int(cumulative)
+        if name.strip() != 'site':
+            modules |= nested | {name.strip()}
+        nested = set()
+    return modules, top_level
+
+def run_startup(name, corpus, repeat):
+    """计时 python -m token_counter 的完整启动
+
+    结果缓存放在临时目录中并预热；startup:cold 加上 --no-cache，每次都加载编码并计数。
+    tiktoken的编码文件仍使用平时的缓存目录，不计入下载时间。
+    """
+    if name == 'startup:help':
+        args = ['--help']
+    else:
+        path, _ = corpus_files(corpus, load_manifest(corpus), BENCHMARKS[name])[0]
+        args = ['--no-cache', path] if name == 'startup:cold' else [path]
+    command = [sys.executable, '-m', 'token_counter', *args]
+    cache_base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    encodings = os.path.join(cache_base, 'fish-assistant', 'token_count', 'encodings')
+    with tempfile.TemporaryDirectory() as cache_home:
+        env = dict(os.environ, XDG_CACHE_HOME=cache_home)
+        env.setdefault('TIKTOKEN_CACHE_DIR', encodings)
+        # 第一次运行写入结果缓存和字节码缓存，第二次记录各模块的导入耗时
+        # （-X importtime 本身有开销，不计时）
+        subprocess.run(command, cwd=PLUGIN_DIR, env=env, check=True, capture_output=True)
+        proc = subprocess.run([sys.executable, '-X', 'importtime', *command[1:]], cwd=PLUGIN_DIR,
+                              env=env, check=True, capture_output=True, text=True)
+        modules, top_level = parse_importtime(proc.stderr)
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run(command, cwd=PLUGIN_DIR, env=env, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+    slowest = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:5]
+    return {
+        'name': name,
+        'files': 0 if name == 'startup:help' else 1,
+        'repeat': repeat,
+        'best_s': round(min(times), 6),
+        'median_s': round(statistics.median(times), 6),
+        'import_ms': round(sum(top_level.values()) / 1000, 1),
+        'slowest_imports': [[module, round(us / 1000, 1)] for module, us in slowest],
+        'eager_imports': [module for module in LAZY_MODULES
+                          if module in modules and module not in STARTUP_ALLOWED.get(name, ())],
+        'peak_rss_mb': round(peak_rss(resource.RUSAGE_CHILDREN) / 1024 / 1024, 1),
+    }
+
+def run_worker(name, corpus, repeat):
+    """在当前进程中运行单个基准，返回结果字典"""
+    if name.startswith('startup:'):
+        return run_startup(name, corpus, repeat)
+    sys.path.insert(0, PLUGIN_DIR)
+    import token_counter
+
+    manifest = load_manifest(corpus)
+    # 预先加载libmagic和tiktoken编码，不计入计时
+    token_counter.init_worker()
+    token_counter.get_magic()
+    run, files, size = prepare(name, corpus_files(corpus, manifest, BENCHMARKS[name]))
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    return {
+        'name': name,
+        'files': files,
+        'bytes': size,
+        'repeat': repeat,
+        'best_s': round(best, 6),
+        'median_s': round(statistics.median(times), 6),
+        'files_per_s': round(files / best, 2) if best else None,
+        'mb_per_s': round(size / 1024 / 1024 / best, 3) if best else None,
+        'peak_rss_mb': round(peak_rss() / 1024 / 1024, 1),
+    }
+
+def run_benchmark(name, corpus, repeat):
+    """在独立的子进程中运行基准，避免前一个基准的内存占用影响峰值RSS"""
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--worker', name,
+         '--corpus', corpus, '--repeat', str(repeat)],
+        capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        return {'name': name, 'error': proc.stderr.strip().splitlines()[-1:] or ['failed']}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PLUGIN_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_table(results, baseline=None):
+    header = (f"{'benchmark':24} {'files':>7} {'MB':>8} {'best s':>9} {'files/s':>10} "
+              f"{'MB/s':>9} {'RSS MB':>8}")
+    if baseline:
+        header += f" {'vs base':>8}"
+    print(header)
+    for result in results:
+        if 'error' in result:
+            print(f"{result['name']:24} error: {' '.join(result['error'])}")
+            continue
+        if result['name'].startswith('startup:'):
+            line = (f"{result['name']:24} {result['files']:7d} {'':>8} {result['best_s']:9.3f} "
+                    f"{'':>10} {'':>9} {result['peak_rss_mb']:8.1f}")
+        else:
+            line = (f"{result['name']:24} {result['files']:7d} "
+                    f"{result['bytes'] / 1024 / 1024:8.1f} {result['best_s']:9.3f} "
+                    f"{result['files_per_s']:10.1f} {result['mb_per_s']:9.2f} "
+                    f"{result['peak_rss_mb']:8.1f}")
+        base = (baseline or {}).get(result['name'])
+        if base and 'best_s' in base and base['best_s']:
+            line += f" {result['best_s'] / base['best_s']:7.2f}x"
+        print(line)
+    for result in results:
+        if 'slowest_imports' in result:
+            slowest = ', '.join(f"{module} {ms:.1f}" for module, ms in result['slowest_imports'])
+            print(f"{result['name']}: imports {result['import_ms']:.1f} ms ({slowest})")
+
+def over_budget(results, budget_ms, cold_budget_ms):
+    """返回启动耗时超过预算或导入了应延迟加载模块的基准名称，startup:cold 使用单独的预算"""
+    failures = []
+    for result in results:
+        if 'error' in result or not result['name'].startswith('startup:'):
+            continue
+        budget = cold_budget_ms if result['name'] == 'startup:cold' else budget_ms
+        if result['best_s'] * 1000 > budget or result['eager_imports']:
+            failures.append(result['name'])
+    return failures
+
+def compare(results, baseline, threshold):
+    """返回比基线慢超过threshold（按最佳耗时）的基准名称"""
+    regressions = []
+    for result in results:
+        base = baseline.get(result['name'])
+        if 'error' in result or not base or not base.get('best_s'):
+            continue
+        if result['best_s'] > base['best_s'] * (1 + threshold):
+            regressions.append(result['name'])
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the token_count pipeline')
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS,
+                        help='Corpus generated by generate_corpus.py (default: benchmarks/corpus)')
+    parser.add_argument('--only', action='append', choices=list(BENCHMARKS), metavar='NAME',
+                        help="Run only these benchmarks, may be repeated "
+                             f"({', '.join(BENCHMARKS)})")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per benchmark, the best run is reported (default: 3)')
+    parser.add_argument('--json', metavar='FILE', help='Write results as JSON to FILE')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='Compare against a previous --json result; exit 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Relative slowdown counted as a regression (default: 0.10)')
+    parser.add_argument('--startup-budget', type=float, default=STARTUP_BUDGET_MS, metavar='MS',
+                        help='Maximum best startup time in ms for startup:* benchmarks; '
+                             f'exit 1 when exceeded (default: {STARTUP_BUDGET_MS})')
+    parser.add_argument('--cold-budget', type=float, default=COLD_BUDGET_MS, metavar='MS',
+                        help='Maximum best time in ms for startup:cold, which loads tiktoken and '
+                             f'counts without the result cache (default: {COLD_BUDGET_MS})')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.corpus, args.repeat)))
+        return
+
+    manifest = load_manifest(args.corpus)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = {result['name']: result for result in json.load(f)['results']}
+
+    results = []
+    for name in args.only or BENCHMARKS:
+        results.append(run_benchmark(name, args.corpus, args.repeat))
+    print_table(results, baseline)
+
+    if args.json:
+        report = {
+            'commit': git_commit(),
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'corpus': {'scale': manifest.get('scale'), 'seed': manifest.get('seed')},
+            'results': results,
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    status = 1 if any('error' in result for result in results) else 0
+    failures = over_budget(results, args.startup_budget, args.cold_budget)
+    if failures:
+        for result in results:
+            if result['name'] in failures and result['eager_imports']:
+                eager = ', '.join(result['eager_imports'])
+                print(f"{result['name']}: imported at startup: {eager}", file=sys.stderr)
+        print(f"Startup over {args.startup_budget:g} ms budget (cold {args.cold_budget:g} ms) "
+              f"or importing lazy modules: {', '.join(failures)}", file=sys.stderr)
+        status = 1
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions over {args.threshold:.0%}: {', '.join(regressions)}",
+                  file=sys.stderr)
+            status = 1
+    sys.exit(status)
+
+if __name__ == '__main__':
+    main()
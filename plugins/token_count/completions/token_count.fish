@@ -60,4 +60,11 @@ complete -c token_count -s v -l verbose -d "显示详细处理信息和警告"
 complete -c token_count -s r -l recursive -d "递归处理目录中的文件"
 complete -c token_count -s e -l exclude -d "排除匹配指定模式的文件" -x
 complete -c token_count -l max-files -d "限制处理的最大文件数（默认1000）" -x
+complete -c token_count -l no-cache -d "不使用计数结果缓存，重新计算所有文件"
+complete -c token_count -l pages -d "只统计PDF的指定页，如 1-10,15,20-" -x
+complete -c token_count -l max-pages -d "每个PDF最多统计N页" -x
+complete -c token_count -l encodings -d "使用的tiktoken编码（逗号分隔）" -x -a "cl100k_base o200k_base p50k_base r50k_base"
+complete -c token_count -l budget -d "只选取token总数不超过N的文件" -x
+complete -c token_count -l priority -d "预算模式的文件优先级" -x -a "mtime size glob"
+complete -c token_count -l prefer -d "按模式优先选取文件（可多次指定）" -x
 complete -c token_count -l help -d "显示帮助信息"
@@ -1,10 +1,10 @@
 function token_count --description 'Count tokens in text files for LLM interaction'
     # 参数处理
-    set -l options 'h/human-readable' 'v/verbose' 'r/recursive' 'e/exclude=' 'max-files='
+    set -l options 'h/human-readable' 'v/verbose' 'r/recursive' 'e/exclude=' 'max-files=' 'no-cache' 'pages=' 'max-pages=' 'encodings=' 'budget=' 'priority=' 'prefer=+'
     argparse $options -- $argv
 
     if test (count $argv) -eq 0
-        echo "Usage: token_count [-h|--human-readable] [-v|--verbose] [-r|--recursive] [--max-files=N] [-e|--exclude=PATTERN] <file_path|directory> [file_path|directory...]" >&2
+        echo "Usage: token_count [-h|--human-readable] [-v|--verbose] [-r|--recursive] [--max-files=N] [-e|--exclude=PATTERN] [--no-cache] [--pages=RANGES] [--max-pages=N] [--encodings=NAMES] [--budget=N [--priority=mtime|size|glob] [--prefer=GLOB]] <file_path|directory> [file_path|directory...]" >&2
         echo "Run 'token_count --help' for more information" >&2
         return 1
     end
@@ -25,7 +25,6 @@ function token_count --description 'Count tokens in text files for LLM interacti
 
     # 设置脚本目录
     set -l script_dir $FISH_ASSISTANT_HOME/plugins/token_count
-    set -l counter_script $script_dir/token_counter.py
     set -l venv_dir $script_dir/.venv
     set -l files $argv
     set -l is_multiple 0
@@ -41,6 +40,7 @@ function token_count --description 'Count tokens in text files for LLM interacti
 
     # 处理目录和文件路径
     set -l expanded_files
+    set -l index_dirs
     set -l max_files 1000 # 默认最大文件数
 
     # 如果设置了最大文件数限制
@@ -50,8 +50,11 @@ function token_count --description 'Count tokens in text files for LLM interacti
 
     # 处理每个输入路径
     for path in $files
+        # 递归统计的目录交给Python端的持久索引，再次查询时只重新计算变化的文件
+        if test -d "$path"; and set -q _flag_recursive; and not set -q _flag_budget
+            set -a index_dirs (path resolve -- $path)
         # 检查是否目录
-        if test -d "$path"
+        else if test -d "$path"
             set -l find_cmd
 
             # 优先使用fd工具，如果可用
@@ -270,77 +273,93 @@ function token_count --description 'Count tokens in text files for LLM interacti
     set -l last_tokens 0
     set -l last_size 0
 
-    # 处理每个文件
-    for file in $files
-        set -l file_path (realpath $file)
+    # 文件列表模式和目录索引模式共用的参数
+    set -l shared_args
+    if set -q _flag_verbose
+        set -a shared_args --verbose
+    end
+    # 计数结果默认缓存在 $XDG_CACHE_HOME/fish-assistant/token_count 中
+    if set -q _flag_no_cache
+        set -a shared_args --no-cache
+    end
+    # PDF页码范围和最大页数
+    if set -q _flag_pages
+        set -a shared_args --pages $_flag_pages
+    end
+    if set -q _flag_max_pages
+        set -a shared_args --max-pages $_flag_max_pages
+    end
+    # tiktoken编码，显示第一个编码的token数
+    if set -q _flag_encodings
+        set -a shared_args --encodings $_flag_encodings
+    end
 
-        if not test -f "$file_path"
-            echo "Warning: 文件不存在或不是常规文件: $file_path" >&2
-            continue
+    # 所有文件交给同一个Python进程批量处理，避免每个文件都启动一次解释器
+    # Python端默认按CPU核数并行计算，--ordered保证输出顺序与输入一致
+    set -l counter_args --files-from - --ordered $shared_args
+    # 预算模式：只保留token总数不超过预算的文件
+    if set -q _flag_budget
+        set -a counter_args --budget $_flag_budget
+        if set -q _flag_priority
+            set -a counter_args --priority $_flag_priority
         end
-
-        # 在子shell中执行Python脚本，自动激活和退出虚拟环境
-        set -l verbose_flag ""
-        if set -q _flag_verbose
-            set verbose_flag "--verbose"
+        for pattern in $_flag_prefer
+            set -a counter_args --prefer $pattern
         end
+    end
 
-        # 使用fish -c在子shell中执行，自动激活和退出虚拟环境
-        set result (fish -c "cd $script_dir && source $venv_dir/bin/activate.fish && uv run --active $counter_script \"$file_path\" $verbose_flag")
-        set -l status_code $status
+    # 转换为绝对路径（子shell会切换到脚本目录），以NUL分隔通过标准输入传递
+    # 以模块方式运行（python -m）会使用__pycache__中的字节码，也省去uv启动器的开销
+    set -l results
+    if test (count $files) -gt 0
+        set -l file_paths (path resolve -- $files)
+        set -l escaped_args (string escape -- $counter_args)
+        set results (printf '%s\0' $file_paths | fish -c "cd $script_dir && source $venv_dir/bin/activate.fish && python -m token_counter $escaped_args")
+    end
 
-        if test $status_code -ne 0
-            echo "Error: 处理文件失败: $file_path" >&2
-            continue
+    # 目录索引保存在 $XDG_CACHE_HOME/fish-assistant/token_count/index 中，
+    # update只对大小或修改时间变化的文件重新计数
+    if test (count $index_dirs) -gt 0
+        set -l index_args update --ext (string join , $text_extensions $doc_extensions) --max-files $max_files $shared_args
+        if set -q _flag_exclude
+            set -a index_args --exclude $_flag_exclude
         end
+        set -a index_args -- $index_dirs
+        # 参数经string escape转义，避免排除模式和路径在子shell中被展开
+        set -l escaped_args (string escape -- $index_args)
+        set -a results (fish -c "cd $script_dir && source $venv_dir/bin/activate.fish && python -m token_counter $escaped_args")
+    end
 
-        # 从JSON结果中提取数据
-        set -l type ""
-        set -l encoding ""
-        set -l chars 0
-        set -l words 0
-        set -l tokens 0
-        set -l size 0
-        set -l parsed 0
-
-        # 优先使用jq，再使用jnv，最后使用正则表达式
-        if command -q jq
-            set type (echo $result | jq -r '.type' 2>/dev/null)
-            if test $status -eq 0
-                set parsed 1
-                set encoding (echo $result | jq -r '.encoding' 2>/dev/null)
-                set chars (echo $result | jq -r '.chars' 2>/dev/null)
-                set words (echo $result | jq -r '.words' 2>/dev/null)
-                set tokens (echo $result | jq -r '.tokens' 2>/dev/null)
-                set size (echo $result | jq -r '.size' 2>/dev/null)
+    # 每个文件对应一行JSON记录，文件路径从记录中读取，汇总记录以 {"summary": true 开头
+    # 预算模式下只输出选中的文件，并按优先级排序
+    set -l budget_summary
+    for result in $results
+        # 汇总记录
+        if string match -q '{"summary": true*' -- $result
+            if set -q _flag_budget
+                set budget_summary $result
             end
+            continue
         end
 
-        if test $parsed -eq 0; and command -q jnv
-            set type (echo $result | jnv -r '.type' 2>/dev/null)
-            if test $status -eq 0
-                set parsed 1
-                set encoding (echo $result | jnv -r '.encoding' 2>/dev/null)
-                set chars (echo $result | jnv -r '.chars' 2>/dev/null)
-                set words (echo $result | jnv -r '.words' 2>/dev/null)
-                set tokens (echo $result | jnv -r '.tokens' 2>/dev/null)
-                set size (echo $result | jnv -r '.size' 2>/dev/null)
-            end
-        end
+        set -l file (string match -rg '^\{"path": "((?:[^"\\\\]|\\\\.)*)"' -- $result)
 
-        # 如果jq和jnv都不可用或解析失败，使用正则表达式解析
-        if test $parsed -eq 0
-            set type (echo $result | string match -r '"type":\s*"([^"]*)"' | tail -n 1)
-            set encoding (echo $result | string match -r '"encoding":\s*"([^"]*)"' | tail -n 1)
-            set chars (echo $result | string match -r '"chars":\s*(\d+)' | tail -n 1)
-            set words (echo $result | string match -r '"words":\s*(\d+)' | tail -n 1)
-            set tokens (echo $result | string match -r '"tokens":\s*(\d+)' | tail -n 1)
-            set size (echo $result | string match -r '"size":\s*(\d+)' | tail -n 1)
+        if string match -q '*"error": *' -- $result
+            echo "Error: 处理文件失败: $file" >&2
+            continue
         end
 
+        # 使用fish内置的string match解析字段，不再为每个字段启动jq
+        set -l type (string match -rg '"type": "([^"]*)"' -- $result)
+        set -l encoding (string match -rg '"encoding": "([^"]*)"' -- $result)
+        set -l chars (string match -rg '"chars": (\d+)' -- $result)
+        set -l words (string match -rg '"words": (\d+)' -- $result)
+        set -l tokens (string match -rg '"tokens": (\d+)' -- $result)
+        set -l size (string match -rg '"size": (\d+)' -- $result)
+
         # 如果数据解析失败，跳过该文件
         if test -z "$type" -o -z "$encoding" -o -z "$chars" -o -z "$words" -o -z "$tokens" -o -z "$size"
-            echo "Error: 无法解析文件处理结果: $file_path" >&2
+            echo "Error: 无法解析文件处理结果: $file" >&2
             continue
         end
 
@@ -372,6 +391,9 @@ function token_count --description 'Count tokens in text files for LLM interacti
 
     # 没有有效文件
     if test $file_count -eq 0
+        if test -n "$budget_summary"
+            _token_count_budget_info $budget_summary
+        end
         echo "Error: 没有找到有效的文件进行处理" >&2
         return 1
     end
@@ -399,6 +421,9 @@ function token_count --description 'Count tokens in text files for LLM interacti
         echo "单词数: $display_words"
         echo "Token数: $display_tokens"
         echo "文件大小: $display_size"
+        if test -n "$budget_summary"
+            _token_count_budget_info $budget_summary
+        end
         return 0
     end
 
@@ -640,6 +665,20 @@ function token_count --description 'Count tokens in text files for LLM interacti
     echo -n " | "
     _pad_to_width "$display_total_size" $size_width
     echo " |"
+
+    if test -n "$budget_summary"
+        _token_count_budget_info $budget_summary
+    end
+end
+
+# 辅助函数：显示预算模式的汇总信息
+function _token_count_budget_info --argument-names summary
+    set -l budget (string match -rg '"budget": (\d+)' -- $summary)
+    set -l used (string match -rg '"tokens": (\d+)' -- $summary)
+    set -l remaining (string match -rg '"remaining": (\d+)' -- $summary)
+    set -l skipped (string match -rg '"skipped": (\d+)' -- $summary)
+    echo
+    echo "Token预算: $budget，已选用: $used，剩余: $remaining，未选中文件: $skipped 个"
 end
 
 # 辅助函数：基于可见宽度的格式化
@@ -695,9 +734,16 @@ function _token_count_help
     echo "选项:"
     echo "  -h, --human-readable    使用人类可读格式显示数字（如K/M/G等）"
     echo "  -v, --verbose           显示详细处理信息和警告"
-    echo "  -r, --recursive         递归处理目录中的文件"
+    echo "  -r, --recursive         递归处理目录中的文件（使用持久索引，再次统计时只处理变化的文件）"
     echo "  -e, --exclude=PATTERN   排除匹配指定模式的文件"
     echo "  --max-files=N           限制处理的最大文件数（默认1000）"
+    echo "  --no-cache              不使用计数结果缓存，重新计算所有文件"
+    echo "  --pages=RANGES          只统计PDF的指定页，如 1-10,15,20-"
+    echo "  --max-pages=N           每个PDF最多统计N页"
+    echo "  --encodings=NAMES       使用的tiktoken编码，逗号分隔，显示第一个（默认cl100k_base）"
+    echo "  --budget=N              只选取token总数不超过N的文件（用于准备LLM上下文）"
+    echo "  --priority=MODE         预算模式的文件优先级: mtime(最近修改,默认) size(token少) glob"
+    echo "  --prefer=GLOB           按模式优先选取文件，可多次指定（隐含--priority=glob）"
     echo "  --help                  显示此帮助信息"
     echo
     echo "示例:"
@@ -706,6 +752,9 @@ function _token_count_help
     echo "  token_count *.md                          # 处理所有Markdown文件"
     echo "  token_count -h *.md                       # 使用人类可读格式显示所有Markdown文件的统计"
     echo "  token_count -v document.pdf               # 处理PDF文件并显示详细警告信息"
+    echo "  token_count --pages=1-50 manual.pdf       # 只统计PDF的前50页"
+    echo "  token_count --encodings=o200k_base *.md   # 使用o200k_base编码统计"
+    echo "  token_count -r --budget=100000 src/       # 选出最近修改且总计不超过10万token的文件"
     echo "  token_count src/                          # 处理src目录下的所有文件（非递归）"
     echo "  token_count -r src/                       # 递归处理src目录及其子目录下的所有文件"
     echo "  token_count -r -e=".git" src/              # 递归处理src目录，但排除.git目录"
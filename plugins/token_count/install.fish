@@ -15,15 +15,17 @@ echo "创建Python虚拟环境..."
 uv venv -p 3.12
 echo "安装Python依赖..."
 uv pip install -r requirements.txt
+# 预先编译字节码，第一次运行时不需要再编译
+uv run python -m compileall -q token_counter.py token_cache.py token_index.py
 
 echo "安装完成！"
 
 # 测试安装
 echo "测试安装..."
 if test -f README.md
-    # 激活虚拟环境并使用--active参数
+    # 激活虚拟环境，与token_count函数一样以模块方式运行
     source .venv/bin/activate.fish
-    uv run --active token_counter.py README.md
+    python -m token_counter README.md
     # 不需要deactivate，因为这是一个独立的脚本
 else
     echo "测试文件不存在，跳过测试"
@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PLUGIN_DIR)
+
+# 与cl100k_base相同的预分词规则，测试中用小词表代替需要下载的编码文件
+CL100K_PATTERN = (r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+|"""
+                  r""" ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s""")
+MERGES = ['th', 'he', 'in', 'er', 'an', ' t', ' a', 're', 'on', 'the', ' the', '12', '123']
+
+
+def toy_ranks():
+    """256个单字节加上少量合并，足以让BPE产生跨字节的token"""
+    ranks = {bytes([i]): i for i in range(256)}
+    for merge in MERGES:
+        ranks[merge.encode('utf-8')] = len(ranks)
+    return ranks
+
+
+@pytest.fixture
+def toy_params():
+    """tiktoken.Encoding的构造参数"""
+    return {'pat_str': CL100K_PATTERN, 'mergeable_ranks': toy_ranks(), 'special_tokens': {}}
+
+
+@pytest.fixture
+def toy_encoding(monkeypatch, toy_params):
+    """离线构造的编码，替换token_counter加载的所有编码"""
+    import tiktoken
+
+    import token_counter
+    encoding = tiktoken.Encoding('toy_cl100k', **toy_params)
+    monkeypatch.setattr(token_counter, 'get_encoder', lambda name: encoding)
+    return encoding
@@ -0,0 +1,65 @@
+import base64
+import socket
+
+import pytest
+import tiktoken
+import tiktoken.registry
+from tiktoken.load import load_tiktoken_bpe
+
+import token_counter
+
+NAME = 'offline_test'
+
+
+@pytest.fixture
+def offline(monkeypatch, tmp_path, toy_params):
+    """禁止网络连接，并使用空的tiktoken缓存目录和全新的编码注册表"""
+    def refuse(*args, **kwargs):
+        raise OSError('network disabled in tests')
+    monkeypatch.setattr(socket.socket, 'connect', refuse)
+    monkeypatch.setattr(socket, 'getaddrinfo', refuse)
+    monkeypatch.setenv('TIKTOKEN_CACHE_DIR', str(tmp_path / 'tiktoken-cache'))
+    monkeypatch.setattr(token_counter, '_encoders', {})
+    monkeypatch.setattr(token_counter, '_encoder_errors', {})
+    tiktoken.registry.list_encoding_names()
+    monkeypatch.setattr(tiktoken.registry, 'ENCODINGS', {})
+
+    # 与内置编码一样从ENCODING_URL加载，只是不校验文件哈希
+    def constructor():
+        return dict(toy_params, name=NAME,
+                    mergeable_ranks=load_tiktoken_bpe(token_counter.ENCODING_URL.format(NAME)))
+    monkeypatch.setitem(tiktoken.registry.ENCODING_CONSTRUCTORS, NAME, constructor)
+
+
+def write_encoding_dir(directory, ranks):
+    directory.mkdir()
+    lines = [f"{base64.b64encode(token).decode()} {rank}" for token, rank in ranks.items()]
+    (directory / f'{NAME}.tiktoken').write_text('\n'.join(lines) + '\n')
+    return str(directory)
+
+
+def test_load_from_encoding_dir_offline(offline, tmp_path, toy_params):
+    encoding_dir = write_encoding_dir(tmp_path / 'encodings', toy_params['mergeable_ranks'])
+    token_counter.prepare_encoding_cache(encoding_dir)
+    assert token_counter.count_tokens('the quick brown fox', NAME) > 0
+    assert token_counter.load_encoders((NAME,)) is None
+
+
+def test_failed_load_is_not_retried(offline, tmp_path, monkeypatch):
+    calls = []
+    get_encoding = tiktoken.get_encoding
+
+    def counting(name):
+        calls.append(name)
+        return get_encoding(name)
+    monkeypatch.setattr(tiktoken, 'get_encoding', counting)
+    paths = []
+    for i in range(3):
+        path = tmp_path / f'{i}.txt'
+        path.write_text(f'file {i}\n')
+        paths.append(str(path))
+    results = list(token_counter.iter_results(paths, {'encodings': (NAME,)}))
+    assert [path for path, _, _ in results] == paths
+    assert all(result is None and '--encoding-dir' in error for _, result, error in results)
+    assert token_counter.count_tokens('more text', NAME) is None
+    assert calls == [NAME]
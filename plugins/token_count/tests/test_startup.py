@@ -0,0 +1,95 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import token_counter
+from benchmarks.run_benchmarks import LAZY_MODULES, STARTUP_BUDGET_MS
+from token_cache import open_cache
+
+# 记录启动前已有的模块（包括site导入的），运行main后把新导入的模块写入argv[1]
+SCRIPT = '''
+import json, sys
+before = set(sys.modules)
+import token_counter
+try:
+    token_counter.main(sys.argv[2:])
+finally:
+    with open(sys.argv[1], 'w') as f:
+        json.dump(sorted(set(sys.modules) - before), f)
+'''
+# 计时测试使用基准的启动预算并留出余量，避免在较慢或繁忙的机器上误报
+BUDGET_MARGIN = 3
+TIMING_RUNS = 5
+
+
+def run_main(tmp_path, *args):
+    """在子进程中运行token_counter.main，返回 (新导入的模块, 标准输出)"""
+    out = tmp_path / 'modules.json'
+    env = dict(os.environ, XDG_CACHE_HOME=str(tmp_path / 'cache'))
+    proc = subprocess.run([sys.executable, '-c', SCRIPT, str(out), *args],
+                          cwd=os.path.dirname(token_counter.__file__), env=env,
+                          capture_output=True, text=True)
+    return set(json.loads(out.read_text())), proc.stdout
+
+
+def lazy(modules):
+    return [module for module in LAZY_MODULES if module in modules]
+
+
+def test_help_imports_no_lazy_modules(tmp_path):
+    modules, stdout = run_main(tmp_path, '--help')
+    assert 'usage:' in stdout
+    assert lazy(modules) == []
+
+
+def cached_file(tmp_path, monkeypatch):
+    """写入一个文本文件并在结果缓存中预置它的计数，返回文件路径"""
+    path = tmp_path / 'notes.txt'
+    path.write_text('cached text\n')
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    cache = open_cache()
+    record = {'type': 'text/plain', 'encoding': 'utf-8', 'chars': 12, 'words': 2,
+              'tokens': 3, 'size': 12, 'tier': 'extension'}
+    cache.store(str(path), os.stat(path), token_counter.cache_profile({}), record)
+    cache.flush()
+    cache.close()
+    return str(path)
+
+
+def test_cache_hit_imports_no_lazy_modules(tmp_path, monkeypatch):
+    modules, stdout = run_main(tmp_path, cached_file(tmp_path, monkeypatch))
+    assert json.loads(stdout)['tokens'] == 3
+    assert lazy(modules) == []
+
+
+def best_startup_ms(tmp_path, *args):
+    """多次运行 python -m token_counter，返回最快一次的毫秒数；第一次运行写入字节码缓存，不计时"""
+    command = [sys.executable, '-m', 'token_counter', *args]
+    cwd = os.path.dirname(token_counter.__file__)
+    env = dict(os.environ, XDG_CACHE_HOME=str(tmp_path / 'cache'))
+    subprocess.run(command, cwd=cwd, env=env, check=True, capture_output=True)
+    times = []
+    for _ in range(TIMING_RUNS):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+timing = pytest.mark.skipif(bool(os.environ.get('CI')),
+                            reason='startup timing is unreliable on shared CI runners')
+
+
+@timing
+def test_help_startup_within_budget(tmp_path):
+    assert best_startup_ms(tmp_path, '--help') < STARTUP_BUDGET_MS * BUDGET_MARGIN
+
+
+@timing
+def test_cache_hit_startup_within_budget(tmp_path, monkeypatch):
+    path = cached_file(tmp_path, monkeypatch)
+    assert best_startup_ms(tmp_path, path) < STARTUP_BUDGET_MS * BUDGET_MARGIN
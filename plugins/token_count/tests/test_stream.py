@@ -0,0 +1,78 @@
+import pytest
+
+import token_counter
+
+ENGLISH = ("The quick brown fox jumps over the lazy dog.\n"
+           "  Indented line with  double spaces and tabs\there.\n"
+           "\n"
+           "Numbers 1234567 and contractions: it's, we'll, they're.\r\n") * 20
+MULTIBYTE = ("中文文本没有空格，但是有标点。😀 emoji 🎉 and ünïcödé words\n"
+             "日本語のテキスト　全角スペース\n") * 20
+NO_WHITESPACE = "abc123def4567ghij89klmno0" * 200
+
+
+def write(tmp_path, text):
+    path = tmp_path / 'input.txt'
+    path.write_bytes(text.encode('utf-8'))
+    return str(path)
+
+
+def whole(path):
+    return token_counter.count_text(token_counter.read_text_file(path, 'utf-8'))
+
+
+@pytest.mark.parametrize('text', [ENGLISH, MULTIBYTE, NO_WHITESPACE],
+                         ids=['english', 'multibyte', 'no-whitespace'])
+@pytest.mark.parametrize('chunk_size', [1, 3, 64])
+def test_stream_matches_whole_file(tmp_path, toy_encoding, text, chunk_size):
+    path = write(tmp_path, text)
+    assert token_counter.count_text_stream(path, 'utf-8', chunk_size=chunk_size) == whole(path)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64])
+def test_no_whitespace_cut_between_letters_and_digits(tmp_path, toy_encoding, chunk_size):
+    # 超过max_buffer时在字母和数字交界处切分，结果仍与整体读取一致
+    path = write(tmp_path, NO_WHITESPACE)
+    counts = token_counter.count_text_stream(path, 'utf-8', chunk_size=chunk_size, max_buffer=100)
+    assert counts == whole(path)
+
+
+def test_multibyte_character_across_read_boundary(tmp_path, toy_encoding):
+    # 4字节的emoji跨越文本层每次读取的8192字节边界
+    text = 'a' * 8190 + '😀' + ' tail 中文\n' + 'b' * 10
+    path = write(tmp_path, text)
+    for chunk_size in (1, 8190, 8191, 8192):
+        assert token_counter.count_text_stream(path, 'utf-8', chunk_size=chunk_size) == whole(path)
+
+
+def test_no_whitespace_buffer_is_bounded(tmp_path, toy_encoding, monkeypatch):
+    # 只有字母、没有任何切分点的内容按max_buffer强制切分，单词数和字符数仍然准确
+    text = 'abcdefghij' * 1000
+    path = write(tmp_path, text)
+    parts = []
+    count_text = token_counter.count_text
+
+    def record(part, encodings=token_counter.DEFAULT_ENCODINGS):
+        parts.append(len(part))
+        return count_text(part, encodings)
+    monkeypatch.setattr(token_counter, 'count_text', record)
+    chars, words, tokens = token_counter.count_text_stream(path, 'utf-8', chunk_size=16,
+                                                           max_buffer=256)
+    assert (chars, words) == (len(text), 1)
+    assert max(parts) < 256 + 16
+    assert tokens['cl100k_base'] > 0
+
+
+def test_scan_starts_at_new_data(tmp_path, toy_encoding, monkeypatch):
+    # 没有切分点时每次只扫描新读入的部分，不重复扫描整个缓冲区
+    text = 'x' * 4000 + ' end'
+    path = write(tmp_path, text)
+    starts = []
+    find = token_counter.find_safe_boundary
+
+    def record(buffer, start=0):
+        starts.append(start)
+        return find(buffer, start)
+    monkeypatch.setattr(token_counter, 'find_safe_boundary', record)
+    token_counter.count_text_stream(path, 'utf-8', chunk_size=100, max_buffer=10000)
+    assert starts == [max(0, 100 * i - 2) for i in range(len(starts))]
@@ -0,0 +1,167 @@
+"""token_counter.py 的持久化结果缓存（SQLite）
+
+缓存以 (路径, 配置) 为主键，并记录文件的 size、mtime_ns 和 inode：
+三者都未变化时直接返回缓存记录，不读取文件内容。
+文件元数据变化（touch、git checkout、复制）时，再按内容哈希查找，命中后更新元数据。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+
+# 缓存记录格式或计数逻辑变化时递增，使旧记录失效
+CACHE_VERSION = 4
+DEFAULT_MAX_ENTRIES = 200000
+
+def default_cache_dir():
+    """返回 $XDG_CACHE_HOME/fish-assistant/token_count"""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'fish-assistant', 'token_count')
+
+def default_cache_path():
+    return os.path.join(default_cache_dir(), 'cache.sqlite3')
+
+def file_digest(file_path):
+    """计算文件内容哈希，用于元数据变化但内容未变的情况"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class TokenCache:
+    """token计数结果缓存，按最近使用时间淘汰超出上限的记录"""
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES, readonly=False):
+        self.path = path or default_cache_path()
+        self.max_entries = max_entries
+        self.readonly = readonly
+        self.hits = 0
+        self.digest_hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._touched = []
+        self._pending = []
+        if readonly:
+            uri = 'file:' + self.path + '?mode=ro'
+            self.conn = sqlite3.connect(uri, uri=True, timeout=5)
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=5)
+        # WAL模式允许工作进程在主进程写入时并发读取
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS entries (
+                path TEXT NOT NULL,
+                profile TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                digest TEXT,
+                record TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (path, profile)
+            );
+            CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest, profile);
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+        ''')
+
+    def lookup(self, file_path, st, profile):
+        """按路径和文件元数据查找，命中时返回记录，只需要一次stat"""
+        row = self.conn.execute(
+            'SELECT size, mtime_ns, inode, record FROM entries WHERE path = ? AND profile = ?',
+            (file_path, profile)
+        ).fetchone()
+        if row is None or tuple(row[:3]) != (st.st_size, st.st_mtime_ns, st.st_ino):
+            return None
+        self.hits += 1
+        self._touched.append((time.time(), file_path, profile))
+        return json.loads(row[3])
+
+    def lookup_digest(self, digest, profile):
+        """按内容哈希查找，用于元数据变化但内容未变的文件"""
+        row = self.conn.execute(
+            'SELECT record FROM entries WHERE digest = ? AND profile = ? LIMIT 1',
+            (digest, profile)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def store(self, file_path, st, profile, record, digest=None):
+        """记录一个文件的计数结果，写入在flush时批量提交"""
+        self._pending.append((
+            file_path, profile, st.st_size, st.st_mtime_ns, st.st_ino, digest,
+            json.dumps(record), time.time()
+        ))
+        if len(self._pending) >= 500:
+            self.flush()
+
+    def flush(self):
+        """提交待写入的记录和访问时间，并淘汰超出上限的记录"""
+        if self.readonly or not (self._pending or self._touched):
+            return
+        with self.conn:
+            if self._pending:
+                self.conn.executemany(
+                    'INSERT OR REPLACE INTO entries '
+                    '(path, profile, size, mtime_ns, inode, digest, record, last_used) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    self._pending
+                )
+            if self._touched:
+                self.conn.executemany(
+                    'UPDATE entries SET last_used = ? WHERE path = ? AND profile = ?',
+                    self._touched
+                )
+            self._pending = []
+            self._touched = []
+            self.evict()
+
+    def evict(self):
+        """按最近使用时间淘汰超过max_entries的记录"""
+        count = self.conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+        self.conn.execute(
+            'DELETE FROM entries WHERE rowid IN '
+            '(SELECT rowid FROM entries ORDER BY last_used LIMIT ?)',
+            (excess,)
+        )
+        self.evicted += excess
+
+    def stats(self):
+        entries = self.conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        size = 0
+        for suffix in ('', '-wal'):
+            if os.path.exists(self.path + suffix):
+                size += os.path.getsize(self.path + suffix)
+        return {
+            'path': self.path,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'bytes': size,
+            'hits': self.hits,
+            'digest_hits': self.digest_hits,
+            'misses': self.misses,
+            'evicted': self.evicted,
+        }
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.conn.close()
+
+def open_cache(path=None, max_entries=DEFAULT_MAX_ENTRIES, readonly=False):
+    """打开缓存，失败时（只读目录、数据库损坏等）给出警告并返回None"""
+    try:
+        return TokenCache(path, max_entries, readonly)
+    except (OSError, sqlite3.Error) as e:
+        if not readonly:
+            print(f"Warning: token cache disabled: {str(e)}", file=sys.stderr)
+        return None
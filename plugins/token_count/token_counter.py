@@ -1,169 +1,1252 @@
 import sys
 import os
-import magic
-import chardet
-import tiktoken
-import pdfplumber
 import json  # 添加json模块导入
-import warnings
-from pathlib import Path
+import argparse
+import codecs
+import contextlib
+import fnmatch
+import hashlib
+import re
+import shutil
+import stat
+import threading
+import time
+from token_cache import (
+    CACHE_VERSION, DEFAULT_MAX_ENTRIES, default_cache_dir, file_digest, open_cache
+)
+from token_index import DirectoryIndex
+
+# magic、chardet、tiktoken和pdfplumber在第一次用到时才导入（合计约150ms），
+# --help、缓存命中和按扩展名判定的文本文件不需要其中的大部分；进程池同样按需导入
+# libmagic句柄在进程内复用，避免每个文件都重新加载magic数据库
+_magic_handle = None
+# 工作进程中按路径复用的只读缓存连接
+_readonly_caches = {}
+# 已加载的tiktoken编码，以及加载失败的编码和错误：离线时每个进程只尝试下载一次
+_encoders = {}
+_encoder_errors = {}
+
+# 默认使用的tiktoken编码，第一个编码的计数作为记录中的tokens
+DEFAULT_ENCODINGS = ('cl100k_base',)
+# tiktoken下载编码文件的地址，缓存文件名为该地址的sha1
+ENCODING_URL = 'https://openaipublic.blob.core.windows.net/encodings/{}.tiktoken'
+
+# 目录索引子命令，其余参数仍按文件路径处理
+INDEX_COMMANDS = ('index', 'update')
+
+# 超过该大小的文本文件按块流式统计，内存占用不随文件大小增长
+STREAM_THRESHOLD = 16 * 1024 * 1024
+# 流式统计时每次读取的字符数
+CHUNK_SIZE = 1024 * 1024
+# 流式统计时缓冲区找不到安全切分点的最大字符数，超过后强制切分
+MAX_BUFFER = 4 * CHUNK_SIZE
+FALLBACK_ENCODINGS = ['utf-8', 'latin1', 'cp1252', 'ascii']
+# PDF按页并行提取时，每个进程至少分到的页数
+PDF_PAGES_PER_JOB = 8
+# 支持统计的MIME类型（前缀或子串匹配）
+SUPPORTED_TYPES = [
+    "text/", "application/json", "application/x-script", "application/xml",
+    "application/pdf", "application/msword", "application/vnd.openxmlformats-officedocument"
+]
+# 预算模式背包求解时容量的最大单位数
+KNAPSACK_CELLS = 4096
+# 判断文件类型和编码时读取的文件头大小
+SNIFF_SIZE = 16 * 1024
+# 常见扩展名对应的MIME类型，命中时不需要调用libmagic（与token_count.fish中的扩展名列表一致）
+EXTENSION_TYPES = {
+    '.txt': 'text/plain', '.log': 'text/plain', '.ini': 'text/plain', '.conf': 'text/plain',
+    '.md': 'text/markdown', '.markdown': 'text/markdown', '.rst': 'text/x-rst',
+    '.py': 'text/x-python', '.js': 'text/javascript', '.jsx': 'text/javascript',
+    '.ts': 'text/x-typescript', '.tsx': 'text/x-typescript',
+    '.html': 'text/html', '.css': 'text/css', '.scss': 'text/x-scss', '.sass': 'text/x-sass',
+    '.less': 'text/x-less', '.vue': 'text/x-vue', '.svelte': 'text/x-svelte',
+    '.xml': 'text/xml', '.json': 'application/json', '.yaml': 'text/yaml', '.yml': 'text/yaml',
+    '.toml': 'text/x-toml', '.csv': 'text/csv', '.tsv': 'text/tab-separated-values',
+    '.sh': 'text/x-shellscript', '.bash': 'text/x-shellscript', '.zsh': 'text/x-shellscript',
+    '.fish': 'text/x-shellscript', '.php': 'text/x-php', '.rb': 'text/x-ruby', '.pl': 'text/x-perl',
+    '.sql': 'text/x-sql', '.c': 'text/x-c', '.h': 'text/x-c', '.cpp': 'text/x-c++',
+    '.hpp': 'text/x-c++', '.java': 'text/x-java', '.go': 'text/x-go', '.cs': 'text/x-csharp',
+    '.scala': 'text/x-scala', '.kt': 'text/x-kotlin', '.swift': 'text/x-swift',
+    '.rs': 'text/x-rust', '.d': 'text/x-d',
+    '.pdf': 'application/pdf',
+}
+# shebang解释器对应的MIME类型
+SHEBANG_TYPES = {
+    'sh': 'text/x-shellscript', 'bash': 'text/x-shellscript', 'zsh': 'text/x-shellscript',
+    'fish': 'text/x-shellscript', 'python': 'text/x-script.python', 'node': 'text/javascript',
+    'perl': 'text/x-perl', 'ruby': 'text/x-ruby', 'php': 'text/x-php',
+}
+# 带BOM的编码，UTF-32的BOM以UTF-16 LE的BOM开头，需要先判断
+BOM_ENCODINGS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'), (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+# 文本文件中不应出现的控制字符（保留制表、换行、换页、退格和ESC）
+_BINARY_BYTES = re.compile(rb'[\x00-\x07\x0b\x0e-\x1a\x1c-\x1f]')
+# 可安全切分的位置：非空白字符之后紧跟空格，或紧跟单个换行且换行后是非空白字符。
+# tiktoken各编码的预分词片段都不会跨越这些位置，切分前后的单词数和token数不变。
+_SAFE_BOUNDARY = re.compile(r'\S(?= |\n\S)')
+# 没有空白的超长内容（如压缩的JSON、base64）在字母和数字交界处强制切分，预分词片段同样不会跨越
+_CLASS_CHANGE = re.compile(r'(?<=[^\W\d_])(?=\d)|(?<=\d)(?=[^\W\d_])')
+
+def get_magic():
+    global _magic_handle
+    if _magic_handle is None:
+        import magic
+        _magic_handle = magic.Magic(mime=True)
+    return _magic_handle
 
 def get_file_type(file_path):
-    mime = magic.Magic(mime=True)
-    return mime.from_file(file_path)
+    return get_magic().from_file(file_path)
+
+def is_supported_type(file_type):
+    return any(t in file_type for t in SUPPORTED_TYPES)
+
+def shebang_type(sniff):
+    """根据 #! 行中的解释器名判断脚本类型"""
+    line = sniff[2:sniff.find(b'\n')].decode('utf-8', 'replace').split()
+    if not line:
+        return None
+    interpreter = os.path.basename(line[0])
+    # 形如 #!/usr/bin/env python3 的写法
+    if interpreter == 'env' and len(line) > 1:
+        interpreter = os.path.basename(line[-1])
+    return SHEBANG_TYPES.get(interpreter.rstrip('0123456789.'))
+
+def sniff_encoding(sniff, complete=False):
+    """通过BOM和严格UTF-8校验判断编码，无法确定时返回None
 
-def extract_pdf_text(file_path, verbose=False):
+    complete表示sniff已包含整个文件，否则末尾被截断的多字节字符不视为错误。
+    """
+    for bom, encoding in BOM_ENCODINGS:
+        if sniff.startswith(bom):
+            return encoding
+    if _BINARY_BYTES.search(sniff):
+        return None
     try:
-        # 默认过滤pdfplumber警告，除非启用详细模式
-        if not verbose:
-            # 完全禁用警告输出
-            old_stderr = sys.stderr
-            sys.stderr = open(os.devnull, 'w')
+        codecs.getincrementaldecoder('utf-8')().decode(sniff, final=complete)
+    except UnicodeDecodeError:
+        return None
+    return 'utf-8'
 
-            try:
-                with pdfplumber.open(file_path) as pdf:
-                    text = ""
-                    for page in pdf.pages:
-                        extracted = page.extract_text()
-                        if extracted:
-                            text += extracted
-            finally:
-                # 恢复stderr
-                sys.stderr.close()
-                sys.stderr = old_stderr
+def classify_file(file_path, detector='chardet'):
+    """分级判断文件类型和编码，返回 (MIME类型, 编码, 判定层级)
+
+    依次尝试：扩展名或shebang查表、BOM和严格UTF-8校验，
+    都无法确定时才调用libmagic和chardet（或charset_normalizer）。
+    判定层级为 extension、shebang、bom、utf8、chardet、charset_normalizer 或 magic。
+    """
+    with open(file_path, 'rb') as file:
+        sniff = file.read(SNIFF_SIZE)
+    complete = len(sniff) < SNIFF_SIZE
+
+    tier = 'extension'
+    file_type = EXTENSION_TYPES.get(os.path.splitext(file_path)[1].lower())
+    if file_type is None and sniff.startswith(b'#!'):
+        tier = 'shebang'
+        file_type = shebang_type(sniff)
+    if file_type == 'application/pdf':
+        if sniff.startswith(b'%PDF-'):
+            return file_type, None, tier
+        # 扩展名与内容不符，交给libmagic判断
+        file_type = None
+
+    encoding = sniff_encoding(sniff, complete)
+    if file_type is None and encoding is not None:
+        tier = 'bom' if encoding != 'utf-8' else 'utf8'
+        file_type = 'text/plain'
+    if file_type is not None and encoding is not None:
+        return file_type, encoding, tier
+
+    # 不是UTF-8文本：扩展名已知时只需检测编码，否则由libmagic判断类型
+    if file_type is None or _BINARY_BYTES.search(sniff):
+        file_type = get_file_type(file_path)
+        tier = 'magic'
+    else:
+        tier = detector
+    # PDF和不支持的类型不需要检测编码
+    if file_type == 'application/pdf' or not is_supported_type(file_type):
+        return file_type, None, tier
+    return file_type, detect_encoding_bytes(sniff, detector, file_path), tier
+
+def parse_page_ranges(spec):
+    """解析页码范围，如 "1-10,15,20-"，返回 (起始页, 结束页或None) 列表，页码从1开始"""
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        try:
+            if '-' in part:
+                first, last = part.split('-', 1)
+                first = int(first) if first.strip() else 1
+                last = int(last) if last.strip() else None
+            else:
+                first = last = int(part)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid page range: '{part}'")
+        if first < 1 or (last is not None and last < first):
+            raise argparse.ArgumentTypeError(f"invalid page range: '{part}'")
+        ranges.append((first, last))
+    return ranges
+
+def select_pages(page_count, pages=None, max_pages=None):
+    """根据页码范围和最大页数，返回要提取的页序号列表（从0开始）"""
+    if pages is None:
+        indices = list(range(page_count))
+    else:
+        selected = set()
+        for first, last in pages:
+            last = page_count if last is None else min(last, page_count)
+            selected.update(range(first - 1, last))
+        indices = sorted(selected)
+    if max_pages is not None:
+        indices = indices[:max_pages]
+    return indices
+
+@contextlib.contextmanager
+def quiet_stderr(verbose=False):
+    """默认过滤pdfplumber警告，除非启用详细模式"""
+    if verbose:
+        yield
+        return
+    # 完全禁用警告输出
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+        yield
+
+def extract_page_range(file_path, indices, verbose=False):
+    """提取指定页的文本，返回与indices对应的文本列表；同时作为进程池的任务函数"""
+    import pdfplumber
+    texts = []
+    with quiet_stderr(verbose), pdfplumber.open(file_path) as pdf:
+        for index in indices:
+            page = pdf.pages[index]
+            texts.append(page.extract_text() or "")
+            # 释放页面解析缓存，大文档的内存占用不随页数增长
+            page.close()
+    return texts
+
+def extract_pdf_pages(file_path, verbose=False, pages=None, max_pages=None, jobs=1):
+    """按页提取PDF文本，返回 [(页码, 文本), ...]，页码从1开始；出错时返回None
+
+    页数较多且jobs大于1时，按连续页段分给多个进程并行提取。
+    """
+    try:
+        import pdfplumber
+        with quiet_stderr(verbose), pdfplumber.open(file_path) as pdf:
+            page_count = len(pdf.pages)
+        indices = select_pages(page_count, pages, max_pages)
+        jobs = min(jobs, len(indices) // PDF_PAGES_PER_JOB)
+        if jobs > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            size = -(-len(indices) // jobs)
+            groups = [indices[i:i + size] for i in range(0, len(indices), size)]
+            with ProcessPoolExecutor(max_workers=len(groups)) as executor:
+                results = executor.map(extract_page_range, [file_path] * len(groups),
+                                       groups, [verbose] * len(groups))
+                texts = [text for group in results for text in group]
         else:
-            # 详细模式：显示所有警告
-            with pdfplumber.open(file_path) as pdf:
-                text = ""
-                for page in pdf.pages:
-                    extracted = page.extract_text()
-                    if extracted:
-                        text += extracted
-
-        if not text:
-            print(f"Warning: No text extracted from PDF: {file_path}", file=sys.stderr)
-            return ""
-        return text
+            texts = extract_page_range(file_path, indices, verbose)
+        return [(index + 1, text) for index, text in zip(indices, texts)]
     except Exception as e:
         print(f"Error extracting PDF text: {str(e)}", file=sys.stderr)
         return None
 
-def detect_encoding(file_path):
+def extract_pdf_text(file_path, verbose=False, pages=None, max_pages=None, jobs=1):
+    page_texts = extract_pdf_pages(file_path, verbose, pages, max_pages, jobs)
+    if page_texts is None:
+        return None
+    # 使用join拼接，避免逐页 += 在大文档上的二次方开销
+    text = "".join(text for _, text in page_texts)
+    if not text:
+        print(f"Warning: No text extracted from PDF: {file_path}", file=sys.stderr)
+        return ""
+    return text
+
+def detect_encoding_bytes(raw_data, detector='chardet', file_path=None):
+    """用chardet或charset_normalizer检测字节数据的编码"""
+    if not raw_data:  # 文件为空
+        return 'utf-8'  # 默认使用UTF-8
+    if detector == 'charset_normalizer':
+        # 可选依赖，只在选择该检测器时导入
+        from charset_normalizer import from_bytes
+        best = from_bytes(raw_data).best()
+        encoding = best.encoding if best is not None else None
+    else:
+        import chardet
+        encoding = chardet.detect(raw_data)['encoding']
+    if encoding is None:
+        print(f"Warning: Could not detect encoding for {file_path}, using utf-8", file=sys.stderr)
+        return 'utf-8'
+    return encoding
+
+def detect_encoding(file_path, detector='chardet'):
     try:
         with open(file_path, 'rb') as file:
             # 只读取前几KB数据来加快检测
-            raw_data = file.read(4096 * 4)  # 16KB should be enough for encoding detection
-            if not raw_data:  # 文件为空
-                return 'utf-8'  # 默认使用UTF-8
-            result = chardet.detect(raw_data)
-            encoding = result['encoding']
-            if encoding is None:
-                print(f"Warning: Could not detect encoding for {file_path}, using utf-8", file=sys.stderr)
-                return 'utf-8'
-            return encoding
+            raw_data = file.read(SNIFF_SIZE)  # 16KB should be enough for encoding detection
+        return detect_encoding_bytes(raw_data, detector, file_path)
     except Exception as e:
         print(f"Error detecting encoding: {str(e)}", file=sys.stderr)
         return 'utf-8'  # 出错时默认使用UTF-8
 
+def prepare_encoding_cache(encoding_dir=None):
+    """让tiktoken使用持久的缓存目录，并从本地目录预置 <编码名>.tiktoken 文件以便离线使用
+
+    未设置TIKTOKEN_CACHE_DIR时使用 $XDG_CACHE_HOME/fish-assistant/token_count/encodings，
+    tiktoken默认的临时目录可能在重启后被清空。
+    """
+    if 'TIKTOKEN_CACHE_DIR' in os.environ:
+        cache_dir = os.environ['TIKTOKEN_CACHE_DIR']
+    elif 'DATA_GYM_CACHE_DIR' in os.environ:
+        cache_dir = os.environ['DATA_GYM_CACHE_DIR']
+    else:
+        cache_dir = os.path.join(default_cache_dir(), 'encodings')
+        # 环境变量会被进程池中的工作进程继承
+        os.environ['TIKTOKEN_CACHE_DIR'] = cache_dir
+    if not encoding_dir or not cache_dir:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    for entry in os.listdir(encoding_dir):
+        name, ext = os.path.splitext(entry)
+        if ext != '.tiktoken':
+            continue
+        # tiktoken读取缓存时会校验文件哈希，不匹配的文件不会被使用
+        key = hashlib.sha1(ENCODING_URL.format(name).encode()).hexdigest()
+        target = os.path.join(cache_dir, key)
+        if not os.path.exists(target):
+            shutil.copyfile(os.path.join(encoding_dir, entry), target)
+
+class TokenCountError(Exception):
+    """tiktoken编码加载或计数失败，文件的token数未知"""
+
+def get_encoder(name):
+    """按需加载tiktoken编码，在进程生命周期内只加载一次
+
+    加载失败时输出一次错误并记住，之后直接抛出同样的TokenCountError，不再重试下载。
+    """
+    if name in _encoders:
+        return _encoders[name]
+    if name in _encoder_errors:
+        raise _encoder_errors[name]
+    import tiktoken
+    try:
+        encoder = tiktoken.get_encoding(name)
+    except Exception as e:
+        error = TokenCountError(f"Unable to load tiktoken encoding {name} "
+                                f"(offline? pass --encoding-dir with {name}.tiktoken)")
+        _encoder_errors[name] = error
+        print(f"Error: {error}: {str(e)}", file=sys.stderr)
+        raise error from e
+    _encoders[name] = encoder
+    return encoder
+
+def load_encoders(encodings=DEFAULT_ENCODINGS):
+    """加载全部编码，返回第一个加载失败的错误信息，全部成功时返回None"""
+    for name in encodings:
+        try:
+            get_encoder(name)
+        except TokenCountError as e:
+            return str(e)
+    return None
+
+def parse_encodings(value):
+    """解析--encodings参数，如 "cl100k_base,o200k_base" """
+    names = tuple(name.strip() for name in value.split(',') if name.strip())
+    if not names:
+        raise argparse.ArgumentTypeError("at least one encoding is required")
+    import tiktoken
+    unknown = [name for name in names if name not in tiktoken.list_encoding_names()]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown encoding: {', '.join(unknown)} "
+            f"(available: {', '.join(tiktoken.list_encoding_names())})"
+        )
+    return names
+
 def count_tokens(text, model="cl100k_base"):
     try:
-        encoding = tiktoken.get_encoding(model)
-        token_count = len(encoding.encode(text))
+        encoding = get_encoder(model)
+    except TokenCountError:
+        # 加载失败已在第一次时报告
+        return None
+    try:
+        # 按普通文本计数，文件中出现的<|endoftext|>等特殊标记不再导致计数失败
+        token_count = len(encoding.encode_ordinary(text))
         return token_count
     except Exception as e:
         print(f"Error counting tokens: {str(e)}", file=sys.stderr)
         return None
 
-def process_file(file_path, verbose=False):
+def count_text(text, encodings=DEFAULT_ENCODINGS):
+    """返回文本的 (字符数, 单词数, {编码名: token数})，文本只遍历一次"""
+    tokens = {name: count_tokens(text, name) for name in encodings}
+    return len(text), len(text.split()), tokens
+
+def token_fields(tokens):
+    """把 {编码名: token数} 转为记录字段：tokens为第一个编码的计数，多个编码时附带token_counts
+
+    任一编码计数失败（为None）时抛出TokenCountError，不把未知的计数记为0。
+    """
+    failed = [name for name, count in tokens.items() if count is None]
+    if failed:
+        raise TokenCountError(f"Unable to count tokens with {', '.join(failed)}")
+    fields = {'tokens': next(iter(tokens.values()))}
+    if len(tokens) > 1:
+        fields['token_counts'] = dict(tokens)
+    return fields
+
+def find_safe_boundary(text, start=0):
+    """返回text[start:]中最后一个可安全切分的位置，找不到时返回0"""
+    # 先只在末尾附近查找，大多数情况下无需扫描整个区间
+    for begin in (max(start, len(text) - 65536), start):
+        last = None
+        for last in _SAFE_BOUNDARY.finditer(text, begin):
+            pass
+        if last is not None:
+            # 在空格之前切分；换行则在换行之后切分
+            cut = last.end()
+            return cut if text[cut] == ' ' else cut + 1
+        if begin == start:
+            break
+    return 0
+
+def find_forced_boundary(text):
+    """没有安全切分点时返回最后一个字母与数字交界的位置，找不到时返回0"""
+    last = None
+    for last in _CLASS_CHANGE.finditer(text):
+        pass
+    return last.start() if last is not None else 0
+
+def count_text_stream(file_path, encoding, encodings=DEFAULT_ENCODINGS, chunk_size=CHUNK_SIZE,
+                      max_buffer=MAX_BUFFER):
+    """按块读取文本文件并累计 (字符数, 单词数, {编码名: token数})
+
+    每次只在新读入的部分查找切分点。缓冲区超过max_buffer仍没有安全切分点时在字母和数字交界处切分，
+    也没有交界时直接统计整个缓冲区（此时token数可能与整体读取相差几个），内存占用始终有上限。
+    """
+    chars = words = 0
+    tokens = dict.fromkeys(encodings, 0)
+    buffer = ''
+    # buffer[:scanned]中已确认没有安全切分点；
+    # 切分点的判断要看后两个字符，所以从scanned-2开始重新查找
+    scanned = 0
+    # 上一块是否以非空白字符结尾，强制切分把一个单词分在两块时单词数要减一
+    joined = False
+    with open(file_path, 'r', encoding=encoding) as file:
+        while True:
+            chunk = file.read(chunk_size)
+            buffer += chunk
+            if chunk:
+                cut = find_safe_boundary(buffer, max(0, scanned - 2))
+                if cut == 0 and len(buffer) >= max_buffer:
+                    cut = find_forced_boundary(buffer) or len(buffer)
+                if cut == 0:
+                    # 缓冲区内没有安全切分点（如超长的单行），继续读取
+                    scanned = len(buffer)
+                    continue
+                part, buffer = buffer[:cut], buffer[cut:]
+                scanned = 0
+            else:
+                part, buffer = buffer, ''
+            if part:
+                part_chars, part_words, part_tokens = count_text(part, encodings)
+                chars += part_chars
+                words += part_words
+                if joined and not part[0].isspace():
+                    words -= 1
+                joined = not part[-1].isspace()
+                for name, count in part_tokens.items():
+                    # 任一块计数失败时该编码的结果记为None
+                    if tokens[name] is not None:
+                        tokens[name] = None if count is None else tokens[name] + count
+            if not chunk:
+                return chars, words, tokens
+
+def read_text_file(file_path, encoding):
+    with open(file_path, 'r', encoding=encoding) as file:
+        return file.read()
+
+def read_with_fallback(file_path, encoding, reader):
+    """用检测到的编码读取文件，解码失败时依次尝试常见编码，返回 (编码, 读取结果)"""
     try:
-        file_type = get_file_type(file_path)
+        return encoding, reader(file_path, encoding)
+    except UnicodeDecodeError as e:
+        print(f"Error: Unable to decode file with detected encoding ({encoding}): {str(e)}",
+              file=sys.stderr)
+    # 尝试使用常见编码
+    for fallback_encoding in FALLBACK_ENCODINGS:
+        try:
+            result = reader(file_path, fallback_encoding)
+        except UnicodeDecodeError:
+            continue
+        print(f"Successfully read file using fallback encoding: {fallback_encoding}",
+              file=sys.stderr)
+        return fallback_encoding, result
+    return encoding, None
+
+def process_file(file_path, verbose=False, stream_threshold=STREAM_THRESHOLD,
+                 pages=None, max_pages=None, pdf_jobs=1, detector='chardet',
+                 encodings=DEFAULT_ENCODINGS):
+    try:
+        file_type, detected_encoding, tier = classify_file(file_path, detector)
         file_size = os.path.getsize(file_path)
-        content = None
+        counts = None
         encoding = None
 
         # 检查文件类型是否支持
-        supported_types = [
-            "text/", "application/json", "application/x-script", "application/xml",
-            "application/pdf", "application/msword", "application/vnd.openxmlformats-officedocument"
-        ]
-
-        is_supported = False
-        for t in supported_types:
-            if t in file_type:
-                is_supported = True
-                break
-
-        if not is_supported:
+        if not is_supported_type(file_type):
             print(f"Error: Unsupported file type: {file_type}", file=sys.stderr)
             return None
 
+        page_counts = None
         if file_type == "application/pdf":
-            content = extract_pdf_text(file_path, verbose)
             encoding = "pdf"
+            page_texts = extract_pdf_pages(file_path, verbose, pages, max_pages, pdf_jobs)
+            if page_texts is not None:
+                # 每页单独统计，便于找出占用上下文最多的页
+                page_counts = []
+                for page_number, text in page_texts:
+                    chars, words, tokens = count_text(text, encodings)
+                    page_counts.append({'page': page_number, 'chars': chars,
+                                        'words': words, **token_fields(tokens)})
+                content = "".join(text for _, text in page_texts)
+                if not content:
+                    print(f"Warning: No text extracted from PDF: {file_path}", file=sys.stderr)
+                counts = count_text(content, encodings)
+        elif file_size > stream_threshold:
+            # 大文件按块流式统计，不把整个文件读入内存
+            encoding, counts = read_with_fallback(
+                file_path, detected_encoding,
+                lambda path, enc: count_text_stream(path, enc, encodings)
+            )
         else:
-            try:
-                encoding = detect_encoding(file_path)
-                with open(file_path, 'r', encoding=encoding) as file:
-                    content = file.read()
-            except UnicodeDecodeError as e:
-                print(f"Error: Unable to decode file with detected encoding ({encoding}): {str(e)}", file=sys.stderr)
-                # 尝试使用常见编码
-                for fallback_encoding in ['utf-8', 'latin1', 'cp1252', 'ascii']:
-                    try:
-                        with open(file_path, 'r', encoding=fallback_encoding) as file:
-                            content = file.read()
-                            encoding = fallback_encoding
-                            print(f"Successfully read file using fallback encoding: {fallback_encoding}", file=sys.stderr)
-                            break
-                    except UnicodeDecodeError:
-                        continue
-
-        if content is None:
+            encoding, content = read_with_fallback(file_path, detected_encoding, read_text_file)
+            if content is not None:
+                counts = count_text(content, encodings)
+
+        if counts is None:
             print(f"Error: Unable to extract content from file", file=sys.stderr)
             return None
 
-        char_count = len(content)
-        word_count = len(content.split())
-        token_count = count_tokens(content)
+        char_count, word_count, tokens = counts
 
-        if token_count is None:
-            token_count = 0
-
-        return {
+        result = {
             'type': file_type,
             'encoding': encoding,
             'chars': char_count,
             'words': word_count,
-            'tokens': token_count,
-            'size': file_size
+            **token_fields(tokens),
+            'size': file_size,
+            'tier': tier
         }
+        if page_counts is not None:
+            result['pages'] = page_counts
+        return result
+    except TokenCountError:
+        # 交给调用方作为错误报告，不能当作0个token写入缓存和索引
+        raise
     except Exception as e:
         print(f"Error processing file: {str(e)}", file=sys.stderr)
         return None
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python token_counter.py <file_path> [--verbose]", file=sys.stderr)
-        sys.exit(1)
-
-    file_path = sys.argv[1]
-    verbose = "--verbose" in sys.argv or "-v" in sys.argv
+def read_file_list(source):
+    """从文件或标准输入读取文件列表，自动识别NUL分隔和换行分隔"""
+    if source == '-':
+        data = sys.stdin.buffer.read()
+    else:
+        with open(source, 'rb') as f:
+            data = f.read()
+    separator = b'\0' if b'\0' in data else b'\n'
+    paths = []
+    for item in data.split(separator):
+        # 换行分隔时兼容CRLF结尾
+        if separator == b'\n':
+            item = item.rstrip(b'\r')
+        if item:
+            paths.append(os.fsdecode(item))
+    return paths
 
+def check_path(file_path):
+    """检查路径是否为可处理的常规文件，返回错误信息或None"""
     if not os.path.exists(file_path):
-        print(f"File not found: {file_path}", file=sys.stderr)
-        sys.exit(1)
-
+        return f"File not found: {file_path}"
     if not os.path.isfile(file_path):
-        print(f"Not a file: {file_path}", file=sys.stderr)
-        sys.exit(1)
+        return f"Not a file: {file_path}"
+    return None
+
+def cache_profile(options=None):
+    """影响计数结果的配置，作为缓存键的一部分"""
+    options = options or {}
+    profile = f"v{CACHE_VERSION}:{','.join(options.get('encodings', DEFAULT_ENCODINGS))}"
+    if options.get('pages') is not None:
+        spec = ','.join(f"{first}-{'' if last is None else last}"
+                        for first, last in options['pages'])
+        profile += f":pages={spec}"
+    if options.get('max_pages') is not None:
+        profile += f":max_pages={options['max_pages']}"
+    if options.get('detector', 'chardet') != 'chardet':
+        profile += f":detector={options['detector']}"
+    return profile
+
+def lookup_digest(file_path, cache_path, profile):
+    """计算内容哈希并在缓存中查找，返回 (哈希, 缓存记录或None)"""
+    if cache_path not in _readonly_caches:
+        _readonly_caches[cache_path] = open_cache(cache_path, readonly=True)
+    cache = _readonly_caches[cache_path]
+    digest = file_digest(file_path)
+    if cache is None:
+        return digest, None
+    return digest, cache.lookup_digest(digest, profile)
+
+def reuse_record(file_path, record, detector='chardet'):
+    """把内容相同的另一个文件的记录用于file_path
+
+    只沿用由内容决定的计数，类型和判定层级按当前路径重新判断；当前路径的类型不支持，
+    或对内容的解读（PDF、文本编码）与记录不同时返回None，需要重新计算。
+    """
+    try:
+        file_type, encoding, tier = classify_file(file_path, detector)
+    except OSError:
+        return None
+    if not is_supported_type(file_type):
+        return None
+    if file_type == 'application/pdf':
+        if record.get('encoding') != 'pdf':
+            return None
+    elif encoding != record.get('encoding'):
+        return None
+    return dict(record, type=file_type, tier=tier)
 
-    result = process_file(file_path, verbose)
+def process_path(index, file_path, options=None, cache=None):
+    """处理单个路径，同时作为进程池的任务函数
 
-    if result:
-        # 使用json模块输出简洁的单行JSON
-        print(json.dumps(result))
+    options为传给process_file的关键字参数；cache为 (缓存路径, 配置) 时先按内容哈希查找缓存。
+    返回 (序号, 路径, 结果, 错误信息, 内容哈希, 是否来自缓存)。
+    """
+    error = check_path(file_path)
+    if error:
+        print(error, file=sys.stderr)
+        return index, file_path, None, error, None, False
+    digest = None
+    if cache is not None:
+        try:
+            digest, record = lookup_digest(file_path, *cache)
+        except OSError as e:
+            return index, file_path, None, f"Unable to read file: {str(e)}", None, False
+        if record is not None:
+            record = reuse_record(file_path, record, (options or {}).get('detector', 'chardet'))
+        if record is not None:
+            return index, file_path, record, None, digest, True
+    try:
+        result = process_file(file_path, **(options or {}))
+    except TokenCountError as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return index, file_path, None, str(e), digest, False
+    return index, file_path, result, None if result else 'Unable to process file', digest, False
+
+def init_worker(encodings=DEFAULT_ENCODINGS):
+    # 每个工作进程启动时加载一次tiktoken编码；libmagic只在扩展名等无法判定类型时才加载。
+    # 加载失败（如离线且无缓存）时不中断进程池，失败会被记住，由process_path报告错误
+    load_encoders(encodings)
+
+def resolve_jobs(value):
+    """解析--jobs参数，auto表示使用当前进程可用的CPU核数"""
+    if value == 'auto':
+        if hasattr(os, 'sched_getaffinity'):
+            return len(os.sched_getaffinity(0))
+        return os.cpu_count() or 1
+    try:
+        jobs = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a valid number of jobs")
+    if jobs < 1:
+        raise argparse.ArgumentTypeError("number of jobs must be at least 1")
+    return jobs
+
+def iter_parallel(tasks, options=None, jobs=2, ordered=False, cache=None):
+    """在进程池中并行处理 (序号, 路径) 任务，结果完成即产出；ordered时按任务顺序产出"""
+    # 限制在途任务和待排序结果的数量，避免一次提交全部文件占用大量内存
+    window = jobs * 4
+    queue = iter(enumerate(tasks))
+    pending = {}
+    finished = {}
+    next_position = 0
+    encodings = (options or {}).get('encodings', DEFAULT_ENCODINGS)
+    # 进程池只在多个文件时使用，导入concurrent.futures（含multiprocessing）约需30ms
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                             initargs=(encodings,)) as executor:
+        def submit_more():
+            while len(pending) + len(finished) < window:
+                item = next(queue, None)
+                if item is None:
+                    return
+                position, (index, file_path) = item
+                future = executor.submit(process_path, index, file_path, options, cache)
+                pending[future] = position
+
+        submit_more()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                position = pending.pop(future)
+                if ordered:
+                    finished[position] = future.result()
+                else:
+                    yield future.result()
+            while next_position in finished:
+                yield finished.pop(next_position)
+                next_position += 1
+            submit_more()
+
+def iter_computed(tasks, options=None, jobs=1, ordered=False, cache=None):
+    """计算缓存未命中的任务，jobs大于1时使用进程池"""
+    jobs = min(jobs, len(tasks))
+    if jobs > 1:
+        # 文件级已经并行，PDF不再按页并行，避免进程数超出CPU核数
+        options = dict(options or {}, pdf_jobs=1)
+        yield from iter_parallel(tasks, options, jobs, ordered, cache)
+        return
+    for index, file_path in tasks:
+        yield process_path(index, file_path, options, cache)
+
+def iter_results(paths, options=None, jobs=1, ordered=False, cache=None, profile=None):
+    """产出每个文件的 (路径, 结果, 错误信息)
+
+    先用一次stat在缓存中查找，未命中的文件再计算并写回缓存。
+    """
+    hits = {}
+    stats = {}
+    tasks = []
+    for index, file_path in enumerate(paths):
+        if cache is not None:
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                st = None
+            if st is not None and stat.S_ISREG(st.st_mode):
+                record = cache.lookup(file_path, st, profile)
+                if record is not None:
+                    hits[index] = record
+                    continue
+                stats[index] = st
+        tasks.append((index, file_path))
+
+    # 有需要计算的文件时先在主进程中加载编码：加载失败（如离线）时所有未命中的文件
+    # 直接报告同一个错误，不再逐个文件或在每个工作进程中重试下载
+    error = load_encoders((options or {}).get('encodings', DEFAULT_ENCODINGS)) if tasks else None
+    if error:
+        computed = ((index, file_path, None, error, None, False) for index, file_path in tasks)
     else:
-        sys.exit(1)
+        computed = iter_computed(tasks, options, jobs, ordered,
+                                 (cache.path, profile) if cache is not None else None)
+
+    def finish(index, file_path, result, error, digest, reused):
+        if result is not None and index in stats:
+            if reused:
+                cache.digest_hits += 1
+            else:
+                cache.misses += 1
+            cache.store(file_path, stats[index], profile, result, digest)
+        return file_path, result, error
+
+    if not ordered:
+        for index in sorted(hits):
+            yield paths[index], hits[index], None
+        for item in computed:
+            yield finish(*item)
+        return
+
+    # 有序模式：缓存命中的记录与计算结果按序号合并输出
+    next_index = 0
+    for item in computed:
+        while next_index in hits:
+            yield paths[next_index], hits.pop(next_index), None
+            next_index += 1
+        yield finish(*item)
+        next_index = item[0] + 1
+    while next_index in hits:
+        yield paths[next_index], hits.pop(next_index), None
+        next_index += 1
+
+def emit(record):
+    # 每条记录输出为单行JSON，保留非ASCII文件名原样
+    print(json.dumps(record, ensure_ascii=False), flush=True)
+
+def new_summary():
+    return {'summary': True, 'files': 0, 'failed': 0,
+            'chars': 0, 'words': 0, 'tokens': 0, 'size': 0, 'tiers': {}}
+
+def add_to_summary(summary, result):
+    summary['files'] += 1
+    for key in ('chars', 'words', 'tokens', 'size'):
+        summary[key] += result[key]
+    if 'token_counts' in result:
+        totals = summary.setdefault('token_counts', {})
+        for name, count in result['token_counts'].items():
+            totals[name] = totals.get(name, 0) + count
+    # 统计各判定层级的命中次数
+    tier = result.get('tier')
+    if tier is not None:
+        summary['tiers'][tier] = summary['tiers'].get(tier, 0) + 1
+
+def run_batch(paths, options=None, jobs=1, ordered=False, cache=None):
+    """批量模式：每个文件输出一行JSON记录，最后输出汇总记录"""
+    summary = new_summary()
+    results = iter_results(paths, options, jobs, ordered, cache, cache_profile(options))
+    for file_path, result, error in results:
+        if result is None:
+            summary['failed'] += 1
+            emit({'path': file_path, 'error': error})
+            continue
+        add_to_summary(summary, result)
+        emit({'path': file_path, **result})
+    emit(summary)
+    # 只要有一个文件处理成功就视为成功
+    return 0 if summary['files'] > 0 or not paths else 1
+
+def priority_order(items, priority='mtime', prefer=None):
+    """按优先级排序 (路径, 结果) 列表，优先级相同时保持输入顺序
+
+    mtime：最近修改的优先；size：token数少的优先；glob：按匹配的--prefer模式先后排序。
+    """
+    if priority == 'mtime':
+        def key(item):
+            try:
+                return -os.stat(item[0]).st_mtime_ns
+            except OSError:
+                return 0
+    elif priority == 'size':
+        def key(item):
+            return item[1]['tokens']
+    else:
+        patterns = prefer or []
+
+        def key(item):
+            for rank, pattern in enumerate(patterns):
+                if (fnmatch.fnmatch(item[0], pattern)
+                        or fnmatch.fnmatch(os.path.basename(item[0]), pattern)):
+                    return rank
+            return len(patterns)
+    return sorted(items, key=key)
+
+def pack_greedy(items, budget):
+    """按优先级顺序依次选取放得下的文件"""
+    selected = []
+    remaining = budget
+    for item in items:
+        if item[1]['tokens'] <= remaining:
+            selected.append(item)
+            remaining -= item[1]['tokens']
+    return selected
+
+def pack_knapsack(items, budget):
+    """0/1背包：在预算内使所选文件的优先级权重之和最大
+
+    排在第r位（共n个）的文件权重为 n - r。token数按预算缩放到至多KNAPSACK_CELLS个单位，
+    并向上取整，所选文件的token总数一定不超过预算。
+    """
+    unit = max(1, -(-budget // KNAPSACK_CELLS))
+    capacity = budget // unit
+    count = len(items)
+    best = [0] * (capacity + 1)
+    # 每个文件对应一行，标记在该容量下是否选取了该文件，用于回溯选取结果
+    taken = []
+    for rank, (_, result) in enumerate(items):
+        weight = -(-result['tokens'] // unit)
+        value = count - rank
+        row = bytearray(capacity + 1)
+        if weight <= capacity:
+            for c in range(capacity, weight - 1, -1):
+                candidate = best[c - weight] + value
+                if candidate > best[c]:
+                    best[c] = candidate
+                    row[c] = 1
+        taken.append(row)
+    selected = []
+    c = capacity
+    for rank in range(count - 1, -1, -1):
+        if taken[rank][c]:
+            selected.append(items[rank])
+            c -= -(-items[rank][1]['tokens'] // unit)
+    selected.reverse()
+    return selected
+
+def run_budget(paths, budget, options=None, jobs=1, cache=None,
+               priority='mtime', prefer=None, solver='greedy'):
+    """预算模式：统计所有文件后选出token总数不超过预算的子集
+
+    按优先级顺序输出选中的文件记录，汇总记录中给出预算、剩余预算和未选中的文件。
+    """
+    items = []
+    failed = 0
+    results = iter_results(paths, options, jobs, True, cache, cache_profile(options))
+    for file_path, result, error in results:
+        if result is None:
+            failed += 1
+            emit({'path': file_path, 'error': error})
+            continue
+        items.append((file_path, result))
+
+    ranked = priority_order(items, priority, prefer)
+    pack = pack_knapsack if solver == 'knapsack' else pack_greedy
+    selected = pack(ranked, budget)
+
+    summary = new_summary()
+    summary['failed'] = failed
+    for file_path, result in selected:
+        add_to_summary(summary, result)
+        emit({'path': file_path, **result})
+    chosen = {file_path for file_path, _ in selected}
+    skipped = [file_path for file_path, _ in ranked if file_path not in chosen]
+    summary.update({
+        'budget': budget,
+        'remaining': budget - summary['tokens'],
+        'skipped': len(skipped),
+        'skipped_paths': skipped,
+    })
+    emit(summary)
+    return 0 if items or not paths else 1
+
+def merge_summary(summary, other):
+    """把另一个汇总记录累加到summary中"""
+    for key in ('files', 'failed', 'chars', 'words', 'tokens', 'size'):
+        summary[key] += other[key]
+    for key in ('tiers', 'token_counts'):
+        if key in other:
+            totals = summary.setdefault(key, {})
+            for name, count in other[key].items():
+                totals[name] = totals.get(name, 0) + count
+
+def update_index(index, scanned, options=None, jobs=1, cache=None, partial=False):
+    """重新计算元数据变化的文件并写入索引，返回 (重新计算的路径, 已删除的路径)"""
+    changed, removed = index.diff(scanned, partial)
+    index.remove(removed)
+    rels = {os.path.join(index.root, rel): rel for rel in changed}
+    results = iter_results(list(rels), options, jobs, False, cache, cache_profile(options))
+    for file_path, result, error in results:
+        rel = rels[file_path]
+        index.store(rel, scanned[rel], result, None if result else error)
+    if changed or removed:
+        index.rollup()
+    index.commit()
+    return changed, removed
+
+def emit_index_records(index, directory, rels=None):
+    """输出索引中的文件记录，路径以用户给出的目录为前缀"""
+    for rel, record, error in index.records(rels):
+        file_path = os.path.join(directory, rel)
+        if record is None:
+            print(json.dumps({'path': file_path, 'error': error}, ensure_ascii=False))
+            continue
+        # 索引中保存的是JSON文本，直接拼接路径字段，不再解析和序列化
+        print('{"path": ' + json.dumps(file_path, ensure_ascii=False) + ', ' + record[1:])
+    sys.stdout.flush()
+
+def emit_index_dirs(index, directory):
+    for totals in index.dirs():
+        totals['dir'] = os.path.normpath(os.path.join(directory, totals['dir']))
+        emit(totals)
+
+def index_summary(indexes, stats=None):
+    summary = new_summary()
+    for directory, index in indexes:
+        merge_summary(summary, index.summary())
+    if stats is not None:
+        summary['index'] = stats
+    return summary
+
+def start_observer(indexes, pending, lock):
+    """用watchdog（Linux上基于inotify）监视目录，变更的路径记入pending
+
+    pending以索引序号为键，值为变更路径的集合，或None表示需要完整扫描。
+    未安装watchdog时返回None。
+    """
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        return None
+
+    class Handler(FileSystemEventHandler):
+        def __init__(self, slot):
+            self.slot = slot
+
+        def on_any_event(self, event):
+            if event.event_type in ('opened', 'closed_no_write'):
+                return
+            with lock:
+                if event.is_directory:
+                    # 目录的创建、删除和移动需要完整扫描，目录修改事件由其中文件的事件覆盖
+                    if event.event_type != 'modified':
+                        pending[self.slot] = None
+                    return
+                paths = pending.setdefault(self.slot, set())
+                if paths is not None:
+                    paths.add(event.src_path)
+                    if getattr(event, 'dest_path', ''):
+                        paths.add(event.dest_path)
+
+    observer = Observer()
+    for slot, (directory, index) in enumerate(indexes):
+        observer.schedule(Handler(slot), index.root, recursive=True)
+    observer.start()
+    return observer
+
+def watch_indexes(indexes, args, options=None, cache=None):
+    """监视目录并保持索引最新，每次变化后输出变化的记录和新的汇总记录"""
+    pending = {}
+    lock = threading.Lock()
+    observer = start_observer(indexes, pending, lock)
+    if observer is None and args.verbose:
+        print(f"watchdog not installed, polling every {args.interval}s", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(args.interval)
+            with lock:
+                if observer is None:
+                    # 轮询模式：每次完整扫描，只有stat，不读取未变化的文件
+                    batch = dict.fromkeys(range(len(indexes)))
+                else:
+                    batch = dict(pending)
+                    pending.clear()
+            updated = False
+            for slot, paths in batch.items():
+                directory, index = indexes[slot]
+                if paths is None:
+                    scanned = index.scan(args.ext, args.exclude, args.max_files)
+                else:
+                    scanned = index.scan_paths(paths, args.ext, args.exclude)
+                changed, removed = update_index(index, scanned, options, args.jobs, cache,
+                                                partial=paths is not None)
+                if not args.summary_only:
+                    emit_index_records(index, directory, changed)
+                    for rel in removed:
+                        emit({'path': os.path.join(directory, rel), 'removed': True})
+                updated = updated or bool(changed or removed)
+            if updated:
+                emit(index_summary(indexes))
+                if cache is not None:
+                    cache.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+
+def index_scope(args):
+    """扫描范围参数，决定使用哪个索引文件"""
+    return json.dumps([sorted(args.ext) if args.ext is not None else None,
+                       args.exclude, args.max_files])
+
+def run_index(args):
+    """index/update命令：维护目录索引并输出每个文件的记录和汇总记录"""
+    options = build_options(args)
+    prepare_encoding_cache(args.encoding_dir)
+    cache = None
+    if not args.no_cache:
+        cache = open_cache(max_entries=args.cache_max_entries)
+    profile = cache_profile(options)
+    indexes = []
+    stats = []
+    try:
+        for directory in args.dirs:
+            if not os.path.isdir(directory):
+                print(f"Not a directory: {directory}", file=sys.stderr)
+                continue
+            index = DirectoryIndex(directory, scope=index_scope(args))
+            indexes.append((directory, index))
+            index.set_profile(profile)
+            if args.command == 'index':
+                index.clear()
+            scanned = index.scan(args.ext, args.exclude, args.max_files)
+            changed, removed = update_index(index, scanned, options, args.jobs, cache)
+            stats.append({'dir': directory, 'files': len(scanned),
+                          'counted': len(changed), 'removed': len(removed)})
+            if args.verbose:
+                print(f"{directory}: {len(scanned)} files, {len(changed)} counted, "
+                      f"{len(removed)} removed", file=sys.stderr)
+            if not args.summary_only:
+                emit_index_records(index, directory)
+            if args.show_dirs:
+                emit_index_dirs(index, directory)
+        emit(index_summary(indexes, stats))
+        if cache is not None:
+            cache.flush()
+        if args.watch and indexes:
+            watch_indexes(indexes, args, options, cache)
+        if cache is not None and args.cache_stats:
+            cache.flush()
+            emit({'cache': cache.stats()})
+    finally:
+        for directory, index in indexes:
+            index.close()
+        if cache is not None:
+            cache.close()
+    return 0 if indexes else 1
+
+def stdin_is_piped():
+    """标准输入是管道或重定向的普通文件（不是终端、/dev/null或继承来的套接字）"""
+    try:
+        mode = os.fstat(sys.stdin.fileno()).st_mode
+    except (AttributeError, OSError, ValueError):
+        return False
+    return stat.S_ISFIFO(mode) or stat.S_ISREG(mode)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Count chars, words and tokens of text and PDF files',
+        epilog='Multiple paths (or --files-from) switch to JSON-lines output: '
+               'one record per file followed by a summary record. '
+               'Records stream in completion order unless --ordered is given.'
+    )
+    parser.add_argument('paths', nargs='*', help='Files to process')
+    parser.add_argument('--files-from', metavar='FILE',
+                        help="Read file paths from FILE ('-' for stdin), NUL or newline separated")
+    parser.add_argument('--ordered', action='store_true',
+                        help='Emit records in input order instead of completion order')
+    parser.add_argument('--budget', type=int, metavar='TOKENS',
+                        help='Select a subset of the files whose total tokens fit in TOKENS')
+    parser.add_argument('--priority', choices=['mtime', 'size', 'glob'], default='mtime',
+                        help='File priority for --budget: most recently modified, fewest tokens, '
+                             'or order of --prefer patterns (default: mtime)')
+    parser.add_argument('--prefer', action='append', metavar='GLOB',
+                        help='Glob pattern for --priority glob, may be repeated (earlier wins)')
+    parser.add_argument('--solver', choices=['greedy', 'knapsack'], default='greedy',
+                        help='greedy takes files in priority order; knapsack maximizes the total '
+                             'priority weight of the selection (default: greedy)')
+    add_count_arguments(parser)
+    args = parser.parse_args(argv)
+    # 只在没有给出任何路径、也不是只查看缓存统计时，才从管道或重定向的标准输入读取文件列表
+    if (not args.paths and args.files_from is None and not args.cache_stats
+            and stdin_is_piped()):
+        args.files_from = '-'
+    if not args.paths and args.files_from is None and not args.cache_stats:
+        parser.error('no input files')
+    if args.budget is not None and args.budget < 0:
+        parser.error('--budget must not be negative')
+    if args.prefer and args.priority != 'glob':
+        # 给出--prefer时默认按模式排序
+        args.priority = 'glob'
+    return args
+
+def add_count_arguments(parser):
+    """添加计数和缓存相关的参数，普通模式与index/update命令共用"""
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Show warnings from PDF extraction')
+    parser.add_argument('-j', '--jobs', type=resolve_jobs, default='auto',
+                        help="Number of worker processes, or 'auto' for all CPUs (default: auto)")
+    parser.add_argument('--stream-threshold', type=int, default=STREAM_THRESHOLD,
+                        metavar='BYTES',
+                        help='Count text files larger than BYTES in bounded-memory chunks '
+                             f'(default: {STREAM_THRESHOLD})')
+    parser.add_argument('--pages', type=parse_page_ranges, metavar='RANGES',
+                        help='Only extract these PDF pages, e.g. 1-10,15,20- (1-based)')
+    parser.add_argument('--max-pages', type=int, metavar='N',
+                        help='Extract at most N pages from each PDF')
+    parser.add_argument('--encodings', type=parse_encodings, default=DEFAULT_ENCODINGS,
+                        metavar='NAMES',
+                        help='Comma-separated tiktoken encodings, e.g. cl100k_base,o200k_base; '
+                             'tokens reports the first, token_counts all (default: cl100k_base)')
+    parser.add_argument('--encoding-dir', metavar='DIR',
+                        default=os.environ.get('TOKEN_COUNT_ENCODING_DIR'),
+                        help='Directory with <name>.tiktoken files to use offline '
+                             '(default: $TOKEN_COUNT_ENCODING_DIR)')
+    parser.add_argument('--detector', choices=['chardet', 'charset_normalizer'], default='chardet',
+                        help='Encoding detector for files that are not plain UTF-8 '
+                             '(default: chardet)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not read or write the persistent result cache')
+    parser.add_argument('--cache-stats', action='store_true',
+                        help='Print cache statistics as a final {"cache": {...}} record')
+    parser.add_argument('--cache-max-entries', type=int, default=DEFAULT_MAX_ENTRIES,
+                        metavar='N',
+                        help='Evict least recently used entries above N '
+                             f'(default: {DEFAULT_MAX_ENTRIES})')
+
+def parse_extensions(value):
+    """解析--ext参数，如 "py,md,.txt"，返回小写扩展名集合"""
+    return {ext.strip().lstrip('.').lower() for ext in value.split(',') if ext.strip()}
+
+def parse_index_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='token_counter.py',
+        description='Keep a persistent token index of directories',
+        epilog='index rebuilds the index of each DIR; update only recounts files whose size, '
+               'mtime or inode changed since the last run. Both emit one JSON record per '
+               'indexed file (sorted by path) followed by a summary record.'
+    )
+    parser.add_argument('command', choices=INDEX_COMMANDS)
+    parser.add_argument('dirs', nargs='+', metavar='DIR', help='Directories to index')
+    parser.add_argument('--ext', type=parse_extensions, metavar='EXTS',
+                        help='Only index files with these comma-separated extensions')
+    parser.add_argument('-e', '--exclude', action='append', default=[], metavar='GLOB',
+                        help='Skip files and directories whose name or relative path matches GLOB, '
+                             'may be repeated')
+    parser.add_argument('--max-files', type=int, metavar='N',
+                        help='Index at most N files per directory (first N by path)')
+    parser.add_argument('--dirs', dest='show_dirs', action='store_true',
+                        help='Also emit {"dir": ...} records with rolled-up totals '
+                             'of every directory')
+    parser.add_argument('--summary-only', action='store_true',
+                        help='Only emit the summary record')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and emit changed records and a new summary on every '
+                             'change (inotify via watchdog if installed, polling otherwise)')
+    parser.add_argument('--interval', type=float, default=1.0, metavar='SECONDS',
+                        help='Debounce / polling interval for --watch (default: 1.0)')
+    add_count_arguments(parser)
+    return parser.parse_args(argv)
+
+def build_options(args):
+    """传给process_file的选项，进程池中的每个任务都会带上"""
+    return {'verbose': args.verbose, 'stream_threshold': args.stream_threshold,
+            'pages': args.pages, 'max_pages': args.max_pages, 'pdf_jobs': args.jobs,
+            'detector': args.detector, 'encodings': args.encodings}
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in INDEX_COMMANDS:
+        sys.exit(run_index(parse_index_args(argv)))
+    args = parse_args(argv)
+    paths = list(args.paths)
+    if args.files_from is not None:
+        paths.extend(read_file_list(args.files_from))
+
+    options = build_options(args)
+    prepare_encoding_cache(args.encoding_dir)
+
+    cache = None
+    if not args.no_cache:
+        cache = open_cache(max_entries=args.cache_max_entries)
+
+    try:
+        if not paths:
+            status = 0
+        elif args.budget is not None:
+            status = run_budget(paths, args.budget, options, args.jobs, cache,
+                                args.priority, args.prefer, args.solver)
+        # 多个文件时进入批量模式，在同一进程中处理全部文件
+        elif len(paths) != 1 or args.files_from is not None:
+            status = run_batch(paths, options, args.jobs, args.ordered, cache)
+        else:
+            status = 1
+            results = iter_results(paths, options, cache=cache, profile=cache_profile(options))
+            for file_path, result, error in results:
+                if result:
+                    # 使用json模块输出简洁的单行JSON
+                    print(json.dumps(result))
+                    status = 0
+        if cache is not None:
+            cache.flush()
+            if args.cache_stats:
+                emit({'cache': cache.stats()})
+    finally:
+        if cache is not None:
+            cache.close()
+    sys.exit(status)
 
 if __name__ == "__main__":
     main()
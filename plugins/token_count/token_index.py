@@ -0,0 +1,258 @@
+"""token_counter.py 的目录增量索引（SQLite）
+
+每个被索引的目录对应一个数据库，保存目录下每个文件的计数记录和 size、mtime_ns、inode，
+以及按目录逐级汇总的合计。update时只需遍历目录做stat，元数据变化的文件才重新计算。
+"""
+import fnmatch
+import hashlib
+import json
+import os
+import posixpath
+import sqlite3
+import stat
+
+from token_cache import default_cache_dir
+
+def default_index_path(root, scope=''):
+    """返回目录索引的路径，按目录绝对路径和扫描范围的哈希命名，不在被索引的目录中写文件
+
+    scope描述扫描范围（扩展名、排除模式等），不同范围的查询使用各自的索引，互不覆盖。
+    """
+    key = hashlib.sha1(
+        (os.path.realpath(root) + '\0' + scope).encode('utf-8', 'surrogateescape')
+    ).hexdigest()
+    return os.path.join(default_cache_dir(), 'index', key + '.sqlite3')
+
+def parent_dirs(rel_dir):
+    """产出目录自身及其所有上级目录，根目录为 '.'"""
+    while rel_dir not in ('', '.'):
+        yield rel_dir
+        rel_dir = posixpath.dirname(rel_dir)
+    yield '.'
+
+class DirectoryIndex:
+    """单个目录的文件计数索引"""
+
+    def __init__(self, root, path=None, scope=''):
+        self.root = os.path.realpath(root)
+        self.path = path or default_index_path(root, scope)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=5)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                rel TEXT PRIMARY KEY,
+                dir TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                record TEXT,
+                error TEXT,
+                chars INTEGER NOT NULL DEFAULT 0,
+                words INTEGER NOT NULL DEFAULT 0,
+                tokens INTEGER NOT NULL DEFAULT 0,
+                bytes INTEGER NOT NULL DEFAULT 0,
+                tier TEXT,
+                token_counts TEXT
+            );
+            CREATE TABLE IF NOT EXISTS dirs (
+                dir TEXT PRIMARY KEY,
+                files INTEGER NOT NULL,
+                failed INTEGER NOT NULL,
+                chars INTEGER NOT NULL,
+                words INTEGER NOT NULL,
+                tokens INTEGER NOT NULL,
+                size INTEGER NOT NULL
+            );
+        ''')
+
+    def set_profile(self, profile):
+        """计数配置（编码、页码范围等）变化时清空索引"""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'profile'").fetchone()
+        if row is not None and row[0] == profile:
+            return
+        with self.conn:
+            self.conn.execute('DELETE FROM files')
+            self.conn.execute('DELETE FROM dirs')
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('profile', ?)", (profile,))
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('root', ?)", (self.root,))
+
+    def clear(self):
+        with self.conn:
+            self.conn.execute('DELETE FROM files')
+            self.conn.execute('DELETE FROM dirs')
+
+    def entries(self):
+        """返回 {相对路径: (size, mtime_ns, inode)}"""
+        rows = self.conn.execute('SELECT rel, size, mtime_ns, inode FROM files')
+        return {rel: (size, mtime_ns, inode) for rel, size, mtime_ns, inode in rows}
+
+    def scan(self, extensions=None, excludes=(), max_files=None):
+        """遍历目录，返回 {相对路径: stat结果}
+
+        不跟随符号链接；excludes中的模式匹配路径中任一部分或整个相对路径时跳过，
+        匹配的目录不再进入。extensions为小写扩展名集合（不含点），None表示不过滤。
+        """
+        found = {}
+        stack = ['']
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                with os.scandir(os.path.join(self.root, rel_dir)) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                rel = posixpath.join(rel_dir, entry.name) if rel_dir else entry.name
+                if self.is_excluded(entry.name, rel, excludes):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(rel)
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    if not self.is_included(entry.name, extensions):
+                        continue
+                    found[rel] = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+        if max_files is not None and len(found) > max_files:
+            found = {rel: found[rel] for rel in sorted(found)[:max_files]}
+        return found
+
+    def scan_paths(self, paths, extensions=None, excludes=()):
+        """只检查给定的路径（监视模式下的变更事件），返回 {相对路径: stat结果或None}"""
+        found = {}
+        for file_path in paths:
+            rel = os.path.relpath(file_path, self.root)
+            if rel.startswith('..') or rel == '.':
+                continue
+            rel = rel.replace(os.sep, '/')
+            name = posixpath.basename(rel)
+            if (any(self.is_excluded(part, rel, excludes) for part in rel.split('/'))
+                    or not self.is_included(name, extensions)):
+                found[rel] = None
+                continue
+            try:
+                st = os.stat(os.path.join(self.root, rel), follow_symlinks=False)
+            except OSError:
+                st = None
+            found[rel] = st if st is not None and stat.S_ISREG(st.st_mode) else None
+        return found
+
+    @staticmethod
+    def is_excluded(name, rel, excludes):
+        return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(rel, pattern)
+                   for pattern in excludes)
+
+    @staticmethod
+    def is_included(name, extensions):
+        if extensions is None:
+            return True
+        _, ext = posixpath.splitext(name)
+        return ext[1:].lower() in extensions
+
+    def diff(self, scanned, partial=False):
+        """与已索引的元数据比较，返回 (需要重新计算的路径, 已删除的路径)
+
+        partial为True时scanned只包含部分路径，值为None表示该路径已不存在。
+        """
+        known = self.entries()
+        changed = []
+        removed = []
+        for rel, st in scanned.items():
+            if st is None:
+                if rel in known:
+                    removed.append(rel)
+                continue
+            if known.get(rel) != (st.st_size, st.st_mtime_ns, st.st_ino):
+                changed.append(rel)
+        if not partial:
+            removed.extend(rel for rel in known if rel not in scanned)
+        return sorted(changed), sorted(removed)
+
+    def store(self, rel, st, record=None, error=None):
+        """记录一个文件的计数结果或错误信息，在commit时提交"""
+        record = record or {}
+        token_counts = record.get('token_counts')
+        self.conn.execute(
+            'INSERT OR REPLACE INTO files '
+            '(rel, dir, size, mtime_ns, inode, record, error, '
+            'chars, words, tokens, bytes, tier, token_counts) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (rel, posixpath.dirname(rel) or '.', st.st_size, st.st_mtime_ns, st.st_ino,
+             json.dumps(record, ensure_ascii=False) if record else None, error,
+             record.get('chars', 0), record.get('words', 0), record.get('tokens', 0),
+             record.get('size', 0), record.get('tier'),
+             json.dumps(token_counts) if token_counts else None)
+        )
+
+    def remove(self, rels):
+        self.conn.executemany('DELETE FROM files WHERE rel = ?', [(rel,) for rel in rels])
+
+    def rollup(self):
+        """重新计算每个目录（含所有子目录）的合计"""
+        totals = {}
+        rows = self.conn.execute(
+            'SELECT dir, SUM(record IS NOT NULL), SUM(record IS NULL), '
+            'SUM(chars), SUM(words), SUM(tokens), SUM(bytes) FROM files GROUP BY dir'
+        )
+        for rel_dir, *counts in rows:
+            for parent in parent_dirs(rel_dir):
+                total = totals.setdefault(parent, [0] * 6)
+                for i, count in enumerate(counts):
+                    total[i] += count
+        self.conn.execute('DELETE FROM dirs')
+        self.conn.executemany('INSERT INTO dirs VALUES (?, ?, ?, ?, ?, ?, ?)',
+                              [(rel_dir, *total) for rel_dir, total in totals.items()])
+
+    def commit(self):
+        self.conn.commit()
+
+    def records(self, rels=None):
+        """按路径顺序产出 (相对路径, 记录JSON文本, 错误信息)"""
+        if rels is None:
+            yield from self.conn.execute('SELECT rel, record, error FROM files ORDER BY rel')
+            return
+        for rel in rels:
+            row = self.conn.execute(
+                'SELECT rel, record, error FROM files WHERE rel = ?', (rel,)
+            ).fetchone()
+            if row is not None:
+                yield row
+
+    def dirs(self):
+        """按目录顺序产出各目录的合计"""
+        rows = self.conn.execute(
+            'SELECT dir, files, failed, chars, words, tokens, size FROM dirs ORDER BY dir'
+        )
+        for rel_dir, files, failed, chars, words, tokens, size in rows:
+            yield {'dir': rel_dir, 'files': files, 'failed': failed,
+                   'chars': chars, 'words': words, 'tokens': tokens, 'size': size}
+
+    def summary(self):
+        """返回与批量模式汇总记录相同字段的合计"""
+        row = self.conn.execute(
+            "SELECT files, failed, chars, words, tokens, size FROM dirs WHERE dir = '.'"
+        ).fetchone() or (0,) * 6
+        summary = dict(zip(('files', 'failed', 'chars', 'words', 'tokens', 'size'), row))
+        summary['tiers'] = dict(self.conn.execute(
+            'SELECT tier, COUNT(*) FROM files WHERE tier IS NOT NULL GROUP BY tier ORDER BY tier'
+        ).fetchall())
+        token_counts = {}
+        for (text,) in self.conn.execute(
+                'SELECT token_counts FROM files WHERE token_counts IS NOT NULL'):
+            for name, count in json.loads(text).items():
+                token_counts[name] = token_counts.get(name, 0) + count
+        if token_counts:
+            summary['token_counts'] = token_counts
+        return summary
+
+    def close(self):
+        self.conn.close()
@@ -1,12 +1,46 @@
 function whisper --description "一键音视频转录文字"
-    argparse h/help s/srt -- $argv
+    argparse h/help s/srt 'f/format=' 'o/output=' serve stop -- $argv
     or return
 
     if set -ql _flag_help
-        echo "用法: whisper [-s/--srt] <音频或视频文件路径>"
+        echo "用法: whisper [-s/--srt] [-f/--format 格式] [-o/--output 目录] <音频或视频文件、目录或通配符>..."
         echo "选项:"
-        echo "  -s, --srt      输出 SRT 格式字幕文件（默认为 TXT）"
-        echo "  -h, --help     显示此帮助信息"
+        echo "  -s, --srt          输出 SRT 格式字幕文件（默认为 TXT）"
+        echo "  -f, --format FMT   输出格式: txt、srt、vtt 或 json"
+        echo "  -o, --output DIR   转录结果的保存目录（默认为当前目录）"
+        echo "      --serve        在后台启动常驻转录服务，之后的转录不再加载模型"
+        echo "      --stop         停止常驻转录服务"
+        echo "  -h, --help         显示此帮助信息"
+        echo
+        echo "多个文件或目录时模型只加载一次，结束后显示每个文件的耗时和实时率"
+        echo "转录结果边转录边写入，中断后再次运行同一命令会从断点继续"
+        return 0
+    end
+
+    set -l client $SCRIPTS_DIR/fish/plugins/transcribe_client.py
+
+    if set -ql _flag_stop
+        python3 $client --shutdown >/dev/null
+        and echo "转录服务已停止"
+        return
+    end
+
+    if set -ql _flag_serve
+        if python3 $client --status >/dev/null 2>&1
+            echo "转录服务已在运行"
+            return 0
+        end
+        conda activate whisper
+        or begin
+            echo "错误: 无法激活 whisper 环境"
+            return 1
+        end
+        # 服务进程脱离当前shell，日志写入 ~/.cache/whisper-serve.log
+        mkdir -p ~/.cache
+        nohup python $SCRIPTS_DIR/fish/plugins/transcribe.py serve --model medium >~/.cache/whisper-serve.log 2>&1 &
+        disown
+        conda deactivate
+        echo "转录服务正在后台启动，日志: ~/.cache/whisper-serve.log"
         return 0
     end
 
@@ -17,13 +51,33 @@ function whisper --description "一键音视频转录文字"
         return 1
     end
 
-    set -l media_file $argv[1]
+    # 通配符已由 fish 展开，这里只检查文件和目录是否存在
+    for media_file in $argv
+        if not test -e "$media_file"
+            echo "错误: 文件 '$media_file' 不存在"
+            return 1
+        end
+    end
+
+    # 构建命令：总是使用 -v，根据 srt 标志决定格式
+    set -l cmd_args --model medium -v
+    if set -ql _flag_format
+        set -a cmd_args --format $_flag_format
+    else if set -ql _flag_srt
+        set -a cmd_args --format srt
+    end
+    if set -ql _flag_output
+        set -a cmd_args --output-dir $_flag_output
+    end
 
-    if not test -f "$media_file"
-        echo "错误: 文件 '$media_file' 不存在"
-        return 1
+    # 常驻服务运行时直接提交任务，不需要激活 Conda 环境和加载模型
+    python3 $client $cmd_args -- $argv
+    set -l client_status $status
+    if test $client_status -ne 2
+        return $client_status
     end
 
+    # 服务未运行（退出码 2），在本地转录
     # 激活 Conda 环境
     conda activate whisper
 
@@ -32,12 +86,7 @@ function whisper --description "一键音视频转录文字"
         return 1
     end
 
-    # 构建命令：总是使用 -v，根据 srt 标志决定格式
-    if set -ql _flag_srt
-        python $SCRIPTS_DIR/fish/plugins/transcribe.py "$media_file" --model medium -v --format srt
-    else
-        python $SCRIPTS_DIR/fish/plugins/transcribe.py "$media_file" --model medium -v
-    end
+    python $SCRIPTS_DIR/fish/plugins/transcribe.py $cmd_args -- $argv
 
     # 保存执行状态
     set -l status_code $status
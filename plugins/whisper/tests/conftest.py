@@ -0,0 +1,30 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PLUGIN_DIR)
+
+SAMPLE_RATE = 16000
+
+
+@pytest.fixture
+def speech_audio():
+    """
+    合成的200秒音频：2~8秒的带噪声正弦波（代替语音）之间隔着0.5~1.5秒的低噪声静音
+    返回 (音频, 每个样本是否在静音中)
+    """
+    rng = np.random.default_rng(0)
+    parts, silent = [], []
+    while sum(len(part) for part in parts) < 200 * SAMPLE_RATE:
+        length = int(rng.uniform(2, 8) * SAMPLE_RATE)
+        t = np.arange(length) / SAMPLE_RATE
+        tone = 0.3 * np.sin(2 * np.pi * rng.uniform(150, 400) * t)
+        parts.append(tone + 0.05 * rng.standard_normal(length))
+        silent.append(np.zeros(length, dtype=bool))
+        length = int(rng.uniform(0.5, 1.5) * SAMPLE_RATE)
+        parts.append(1e-4 * rng.standard_normal(length))
+        silent.append(np.ones(length, dtype=bool))
+    return np.concatenate(parts).astype(np.float32), np.concatenate(silent)
@@ -0,0 +1,175 @@
+import numpy as np
+import pytest
+
+import transcribe
+
+SAMPLE_RATE = transcribe.SAMPLE_RATE
+
+
+def assert_contiguous(chunks, total, chunk_length):
+    assert chunks[0][0] == 0
+    assert chunks[-1][1] == total
+    for (_, end), (start, _) in zip(chunks, chunks[1:]):
+        assert end == start
+    for start, end in chunks:
+        assert 0 < end - start <= chunk_length * SAMPLE_RATE
+
+
+@pytest.mark.parametrize("chunk_length", [30, 60, 90])
+def test_split_audio_cuts_in_silence(speech_audio, chunk_length):
+    audio, silent = speech_audio
+    chunks = transcribe.split_audio(audio, chunk_length)
+    assert len(chunks) > 1
+    assert_contiguous(chunks, len(audio), chunk_length)
+    frame = int(SAMPLE_RATE * transcribe.VAD_FRAME_S)
+    for _, cut in chunks[:-1]:
+        # 切分点前后各一帧都在静音中，不会切断语音
+        assert silent[cut - frame:cut + frame].all()
+    for start, end in chunks[:-1]:
+        # 块不短于 chunk_length 的一半
+        assert end - start >= chunk_length * SAMPLE_RATE // 2 - frame
+
+
+def test_split_audio_without_silence_uses_quietest_frame():
+    t = np.arange(100 * SAMPLE_RATE) / SAMPLE_RATE
+    # 振幅缓慢起伏的连续音，没有足够长的静音
+    envelope = 0.2 + 0.15 * np.sin(2 * np.pi * t / 17)
+    audio = (envelope * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+    chunks = transcribe.split_audio(audio, 30)
+    assert_contiguous(chunks, len(audio), 30)
+    frame = int(SAMPLE_RATE * transcribe.VAD_FRAME_S)
+    energy = transcribe.frame_energy(audio, frame)
+    for start, cut in chunks[:-1]:
+        lo = (start + 15 * SAMPLE_RATE) // frame
+        hi = (start + 30 * SAMPLE_RATE) // frame
+        assert energy[cut // frame] == energy[lo:hi].min()
+
+
+def test_split_audio_short_audio_is_one_chunk(speech_audio):
+    audio, _ = speech_audio
+    assert transcribe.split_audio(audio[:20 * SAMPLE_RATE], 30) == [(0, 20 * SAMPLE_RATE)]
+
+
+def chunk_segments(duration):
+    """模拟whisper对一个块的输出：时间相对于块的开头，最后一段超出块的结尾"""
+    segments = []
+    start = 0.0
+    while start < duration:
+        end = start + 4.0
+        words = [{"word": " a", "start": start, "end": start + 1.5},
+                 {"word": " b", "start": start + 2.0, "end": end}]
+        segments.append({"id": len(segments), "seek": 0, "start": start, "end": end,
+                         "text": " a b", "words": words})
+        start = end + 1.0
+    # whisper在块尾的静音中可能给出超出音频长度的时间
+    segments[-1]["end"] = segments[-1]["words"][-1]["end"] = duration + 2.0
+    return segments
+
+
+def assert_monotonic(segments):
+    times = []
+    for segment in segments:
+        assert segment["start"] <= segment["end"]
+        times.append(segment["start"])
+        for word in segment["words"]:
+            assert segment["start"] <= word["start"] <= word["end"] <= segment["end"]
+            times.extend((word["start"], word["end"]))
+        times.append(segment["end"])
+    assert times == sorted(times)
+
+
+def test_offset_segments_absolute_and_clamped():
+    segments = list(transcribe.offset_segments(chunk_segments(30.0), 60.0, 30.0, first_id=7))
+    assert [segment["id"] for segment in segments] == list(range(7, 7 + len(segments)))
+    assert segments[0]["start"] == 60.0
+    # 超出块结尾的分段和词被截到块的结尾，不会与下一块重叠
+    assert segments[-1]["end"] == 90.0
+    assert max(word["end"] for segment in segments for word in segment["words"]) == 90.0
+    assert all(segment["seek"] == 60 * SAMPLE_RATE // transcribe.HOP_LENGTH for segment in segments)
+    assert_monotonic(segments)
+
+
+class FakeModel:
+    """按块的长度返回相对时间的分段，代替whisper模型"""
+    def __init__(self):
+        self.prompts = []
+
+    def transcribe(self, audio, **options):
+        self.prompts.append(options.get("initial_prompt"))
+        return {"segments": chunk_segments(len(audio) / SAMPLE_RATE)}
+
+
+def test_stream_chunks_stitches_absolute_times(speech_audio):
+    audio, _ = speech_audio
+    chunks = transcribe.split_audio(audio, 60)
+    model = FakeModel()
+    results = list(transcribe.stream_chunks(model, audio, 60, language="en"))
+    assert [offset for offset, _ in results] == [end for _, end in chunks]
+    segments = [segment for _, chunk in results for segment in chunk]
+    assert [segment["id"] for segment in segments] == list(range(len(segments)))
+    assert_monotonic(segments)
+    for (start, end), (_, chunk) in zip(chunks, results):
+        assert chunk[0]["start"] == round(start / SAMPLE_RATE, 3)
+        assert chunk[-1]["end"] == round(end / SAMPLE_RATE, 3)
+    # 上一块的文本作为下一块的提示词
+    assert model.prompts[0] is None
+    assert all(model.prompts[1:])
+
+
+def test_stream_chunks_resume_from_offset(speech_audio):
+    audio, _ = speech_audio
+    start = transcribe.split_audio(audio, 60)[1][0]
+    results = list(transcribe.stream_chunks(FakeModel(), audio, 60, start, first_id=5,
+                                            language="en"))
+    segments = [segment for _, chunk in results for segment in chunk]
+    assert segments[0]["id"] == 5
+    assert segments[0]["start"] == round(start / SAMPLE_RATE, 3)
+    assert results[-1][0] == len(audio)
+    assert_monotonic(segments)
+
+
+class FakePool:
+    """立即完成的进程池，记录提交的块数"""
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, fn, audio, options):
+        from concurrent.futures import Future
+        self.submitted += 1
+        future = Future()
+        future.set_result({"segments": chunk_segments(len(audio) / SAMPLE_RATE)})
+        return future
+
+
+def chunked_transcriber(jobs, chunk_length):
+    # 不创建真正的进程池（每个工作进程都要加载whisper模型）
+    transcriber = transcribe.ChunkedTranscriber.__new__(transcribe.ChunkedTranscriber)
+    transcriber.jobs = jobs
+    transcriber.chunk_length = chunk_length
+    transcriber.pool = FakePool()
+    return transcriber
+
+
+def test_chunked_transcriber_bounds_in_flight_chunks(speech_audio):
+    audio, _ = speech_audio
+    transcriber = chunked_transcriber(2, 30)
+    chunks = transcribe.split_audio(audio, 30)
+    results = []
+    for offset, segments in transcriber.iter_chunks(audio, language="en"):
+        results.append((offset, segments))
+        # 已产出的块之外最多有 2 * jobs 个块在途
+        assert transcriber.pool.submitted <= len(results) + 2 * 2
+    assert transcriber.pool.submitted == len(chunks)
+    assert [offset for offset, _ in results] == [end for _, end in chunks]
+    segments = [segment for _, chunk in results for segment in chunk]
+    assert [segment["id"] for segment in segments] == list(range(len(segments)))
+    assert_monotonic(segments)
+
+
+def test_chunked_transcriber_stops_submitting_when_closed(speech_audio):
+    audio, _ = speech_audio
+    transcriber = chunked_transcriber(1, 30)
+    chunks = transcriber.iter_chunks(audio, language="en")
+    next(chunks)
+    chunks.close()
+    assert transcriber.pool.submitted == 2
@@ -0,0 +1,208 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import transcribe
+
+SAMPLE_RATE = transcribe.SAMPLE_RATE
+SEGMENTS = [
+    {"id": 0, "start": 0.0, "end": 2.5, "text": " 第一段"},
+    {"id": 1, "start": 3.0, "end": 65.25, "text": " second, \"quoted\""},
+    {"id": 2, "start": 3661.5, "end": 3662.0, "text": " third"},
+]
+INFO = {"audio": "a.wav", "model": "tiny", "device": "cpu", "language": "zh"}
+
+
+def write_all(path, output_format, segments=SEGMENTS):
+    transcribe.save_result({"segments": segments}, str(path), output_format, INFO)
+    return path.read_text(encoding="utf-8")
+
+
+def test_srt_writer(tmp_path):
+    assert write_all(tmp_path / "out.srt", "srt") == (
+        "1\n00:00:00,000 --> 00:00:02,500\n第一段\n\n"
+        "2\n00:00:03,000 --> 00:01:05,250\nsecond, \"quoted\"\n\n"
+        "3\n01:01:01,500 --> 01:01:02,000\nthird\n\n")
+
+
+def test_vtt_writer(tmp_path):
+    assert write_all(tmp_path / "out.vtt", "vtt") == (
+        "WEBVTT\n\n"
+        "00:00:00.000 --> 00:00:02.500\n第一段\n\n"
+        "00:00:03.000 --> 00:01:05.250\nsecond, \"quoted\"\n\n"
+        "01:01:01.500 --> 01:01:02.000\nthird\n\n")
+
+
+def test_txt_writer(tmp_path):
+    lines = write_all(tmp_path / "out.txt", "txt").splitlines()
+    assert lines[0].startswith("转录时间: ")
+    assert lines[1:6] == ["源文件: a.wav", "使用模型: tiny", "运行设备: cpu", "检测语言: zh", ""]
+    assert lines[6:] == ["=== 转录内容 ===", "",
+                         "[00:00:00,000 --> 00:00:02,500] 第一段",
+                         "[00:00:03,000 --> 00:01:05,250] second, \"quoted\"",
+                         "[01:01:01,500 --> 01:01:02,000] third"]
+
+
+@pytest.mark.parametrize("segments", [SEGMENTS, []], ids=["segments", "empty"])
+def test_json_writer(tmp_path, segments):
+    data = json.loads(write_all(tmp_path / "out.json", "json", segments))
+    assert {key: data[key] for key in INFO} == INFO
+    assert data["segments"] == segments
+
+
+@pytest.mark.parametrize("output_format", ["srt", "vtt", "txt", "json"])
+def test_writer_resume_truncates_after_checkpoint(tmp_path, output_format):
+    expected = write_all(tmp_path / f"whole.{output_format}", output_format)
+    path = str(tmp_path / f"resumed.{output_format}")
+    writer = transcribe.WRITERS[output_format](path)
+    writer.begin(INFO)
+    writer.write(SEGMENTS[0])
+    writer.write(SEGMENTS[1])
+    size = writer.sync()
+    # 断点之后写入的内容在续写时丢弃
+    writer.write_text("不完整的分段")
+    writer.close()
+    with transcribe.WRITERS[output_format](path, resume_bytes=size, count=2) as writer:
+        writer.write(SEGMENTS[2])
+        writer.end(INFO)
+    resumed = open(path, encoding="utf-8").read()
+    if output_format == "txt":
+        # 文件头中的转录时间不同
+        expected, resumed = expected.split("\n", 1)[1], resumed.split("\n", 1)[1]
+    assert resumed == expected
+
+
+class WindowModel:
+    """代替whisper模型：每5秒一段，最后一段延伸到音频结尾；记录每次调用的音频长度和提示词"""
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, audio, **options):
+        self.calls.append((len(audio), options.get("initial_prompt")))
+        duration = len(audio) / SAMPLE_RATE
+        segments = [{"id": i, "seek": 0, "start": float(start), "end": min(start + 4.0, duration),
+                     "text": " 段"}
+                    for i, start in enumerate(np.arange(0, duration, 5.0))]
+        segments[-1]["end"] = duration
+        return {"segments": segments}
+
+
+def test_stream_segments_windows():
+    audio = np.zeros(100 * SAMPLE_RATE, dtype=np.float32)
+    model = WindowModel()
+    results = list(transcribe.stream_segments(model, audio, language="en"))
+    assert all(length <= transcribe.N_SAMPLES for length, _ in model.calls)
+    # 到达窗口结尾的最后一段留给下一个窗口，从它的开头重新转录
+    assert [offset for offset, _ in results] == [25 * SAMPLE_RATE, 50 * SAMPLE_RATE,
+                                                 75 * SAMPLE_RATE, len(audio)]
+    segments = [segment for _, window in results for segment in window]
+    assert [segment["id"] for segment in segments] == list(range(len(segments)))
+    assert [segment["start"] for segment in segments] == list(range(0, 100, 5))
+    assert segments[-1]["end"] == 100.0
+    assert model.calls[0][1] is None
+    assert all(prompt for _, prompt in model.calls[1:])
+
+
+def test_stream_segments_from_offset():
+    audio = np.zeros(100 * SAMPLE_RATE, dtype=np.float32)
+    results = list(transcribe.stream_segments(WindowModel(), audio, 50 * SAMPLE_RATE, 10))
+    segments = [segment for _, window in results for segment in window]
+    assert segments[0]["id"] == 10
+    assert segments[0]["start"] == 50.0
+    assert results[-1][0] == len(audio)
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def audio_file(tmp_path):
+    path = tmp_path / "talk.wav"
+    path.write_bytes(b"RIFF")
+    return str(path)
+
+
+def run(audio_file, output_dir, output_format, **kwargs):
+    audio = np.zeros(100 * SAMPLE_RATE, dtype=np.float32)
+    output_dir.mkdir(exist_ok=True)
+    return transcribe.transcribe_to_file(WindowModel(), audio, audio_file, "tiny", "cpu",
+                                         output_format, str(output_dir), "en", **kwargs)
+
+
+def interrupt_after(count):
+    written = []
+
+    def on_segment(segment):
+        written.append(segment)
+        if len(written) == count:
+            raise Interrupted
+    return on_segment
+
+
+@pytest.mark.parametrize("output_format", ["srt", "vtt", "txt", "json"])
+def test_interrupted_transcription_resumes(tmp_path, audio_file, output_format):
+    whole = run(audio_file, tmp_path / "whole", output_format)["output"]
+    expected = open(whole, encoding="utf-8").read()
+    output_dir = tmp_path / "out"
+    # 第二个窗口的分段写入了一半时中断
+    with pytest.raises(Interrupted):
+        run(audio_file, output_dir, output_format, on_segment=interrupt_after(7))
+    [output] = [str(path) for path in output_dir.iterdir()
+                if not path.name.endswith(transcribe.CHECKPOINT_SUFFIX)]
+    with open(transcribe.checkpoint_path(output), encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    assert checkpoint["offset"] == 25 * SAMPLE_RATE
+    assert checkpoint["segments"] == 5
+    assert checkpoint["language"] == "en"
+    assert os.path.getsize(output) > checkpoint["bytes"]
+
+    result = run(audio_file, output_dir, output_format)
+    assert result["output"] == output
+    assert result["resumed_s"] == 25.0
+    assert not os.path.exists(transcribe.checkpoint_path(output))
+    resumed = open(output, encoding="utf-8").read()
+    if output_format == "json":
+        assert json.loads(resumed) == json.loads(expected)
+    if output_format == "txt":
+        expected, resumed = expected.split("\n", 1)[1], resumed.split("\n", 1)[1]
+    assert resumed == expected
+
+
+@pytest.fixture
+def checkpointed(tmp_path, audio_file):
+    """中断后留下断点的srt输出，返回输出文件路径"""
+    with pytest.raises(Interrupted):
+        run(audio_file, tmp_path, "srt", on_segment=interrupt_after(7))
+    [output] = [str(path) for path in tmp_path.glob("transcript_*.srt")]
+    return output
+
+
+def test_find_checkpoint(tmp_path, audio_file, checkpointed):
+    checkpoint = transcribe.find_checkpoint(audio_file, "srt", str(tmp_path), "tiny")
+    assert checkpoint["output"] == checkpointed
+    assert checkpoint["offset"] == 25 * SAMPLE_RATE
+    # 模型、格式不同时不续写
+    assert transcribe.find_checkpoint(audio_file, "srt", str(tmp_path), "base") is None
+    assert transcribe.find_checkpoint(audio_file, "vtt", str(tmp_path), "tiny") is None
+
+
+def test_find_checkpoint_source_changed(tmp_path, audio_file, checkpointed):
+    with open(audio_file, "ab") as f:
+        f.write(b"more")
+    assert transcribe.find_checkpoint(audio_file, "srt", str(tmp_path), "tiny") is None
+
+
+def test_find_checkpoint_output_truncated(tmp_path, audio_file, checkpointed):
+    with open(checkpointed, "r+b") as f:
+        f.truncate(10)
+    assert transcribe.find_checkpoint(audio_file, "srt", str(tmp_path), "tiny") is None
+
+
+def test_no_resume_starts_new_output(tmp_path, audio_file, checkpointed):
+    result = run(audio_file, tmp_path, "srt", resume=False)
+    assert result["output"] != checkpointed
+    assert result["resumed_s"] == 0
+    assert os.path.exists(transcribe.checkpoint_path(checkpointed))
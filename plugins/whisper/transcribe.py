@@ -1,14 +1,53 @@
-import whisper
 import datetime
+import gc
+import glob
+import importlib
+import json
+import multiprocessing
 import os
 import argparse
+import contextlib
+import queue
+import signal
+import socket
+import socketserver
+import threading
 import warnings
-import torch
 import time
 import sys
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from transcribe_client import default_socket_path, send_message
+# whisper、torch和numpy合计导入约需数秒，只在解码或加载模型时才导入，
+# --help、参数检查和通过服务转录时都不需要
 # 过滤特定的警告
 warnings.filterwarnings("ignore", category=UserWarning)
 warnings.filterwarnings("ignore", category=FutureWarning)
+# 目录输入时转录的文件类型（ffmpeg能解码的常见音视频格式）
+MEDIA_EXTENSIONS = {
+    '.mp3', '.wav', '.m4a', '.flac', '.ogg', '.opus', '.aac', '.wma',
+    '.mp4', '.mkv', '.mov', '.avi', '.webm'
+}
+# 预先解码的文件数，解码后的音频为16kHz float32，每小时约230MB
+PREFETCH = 1
+# 分块转录：按30ms的帧计算能量，低于 SILENCE_DB（dBFS）且持续 MIN_SILENCE_S 以上视为静音
+VAD_FRAME_S = 0.03
+SILENCE_DB = -40.0
+MIN_SILENCE_S = 0.3
+DEFAULT_CHUNK_S = 300
+# 整段转录时窗口的最后一段结束在窗口结尾前 WINDOW_EDGE_S 秒以内时，视为被窗口截断
+WINDOW_EDGE_S = 1.0
+OUTPUT_EXTENSIONS = {'txt': '.txt', 'srt': '.srt', 'vtt': '.vtt', 'json': '.json'}
+CHECKPOINT_SUFFIX = '.checkpoint'
+# 各模型的参数量，加载前用于估算内存（float32）
+MODEL_PARAMS = {
+    'tiny': 39_000_000, 'base': 74_000_000, 'small': 244_000_000,
+    'medium': 769_000_000, 'large': 1_550_000_000
+}
+# 与 whisper.audio 中的常量相同，使用时不需要导入whisper
+SAMPLE_RATE = 16000
+HOP_LENGTH = 160
+N_SAMPLES = 30 * SAMPLE_RATE
 def format_timestamp(seconds):
     """将秒数转换为 SRT 时间戳格式 (00:00:00,000)"""
     hours = int(seconds // 3600)
@@ -17,33 +56,480 @@ def format_timestamp(seconds):
     milliseconds = int((seconds % 1) * 1000)
     seconds = int(seconds)
     return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+class SegmentWriter:
+    """
+    逐段写入转录结果，每段写入后立即flush，fsync为True时同时同步到磁盘
+    resume_bytes不为None时续写已有文件：先截断到断点记录的长度，丢弃断点之后写入的不完整内容
+    """
+    def __init__(self, path, fsync=False, resume_bytes=None, count=0):
+        self.path = path
+        self.fsync = fsync
+        self.count = count
+        if resume_bytes is None:
+            self.file = open(path, 'wb')
+        else:
+            self.file = open(path, 'r+b')
+            self.file.truncate(resume_bytes)
+            self.file.seek(resume_bytes)
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+    def write_text(self, text):
+        self.file.write(text.encode('utf-8'))
+    def begin(self, info):
+        """写入文件头，info包含 audio、model、device、language"""
+    def write(self, segment):
+        self.count += 1
+        self.write_segment(segment)
+    def write_segment(self, segment):
+        raise NotImplementedError
+    def end(self, info):
+        """写入文件尾"""
+    def sync(self):
+        """把已写入的内容交给操作系统（fsync时写入磁盘），返回文件当前长度"""
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        return self.file.tell()
+    def close(self):
+        self.sync()
+        self.file.close()
+class SrtWriter(SegmentWriter):
+    """SRT 字幕格式"""
+    def write_segment(self, segment):
+        start = format_timestamp(segment["start"])
+        end = format_timestamp(segment["end"])
+        self.write_text(f"{self.count}\n{start} --> {end}\n{segment['text'].strip()}\n\n")
+class VttWriter(SegmentWriter):
+    """WebVTT 字幕格式，时间戳的毫秒分隔符为点"""
+    def begin(self, info):
+        self.write_text("WEBVTT\n\n")
+    def write_segment(self, segment):
+        start = format_timestamp(segment["start"]).replace(",", ".")
+        end = format_timestamp(segment["end"]).replace(",", ".")
+        self.write_text(f"{start} --> {end}\n{segment['text'].strip()}\n\n")
+class TxtWriter(SegmentWriter):
+    """带时间戳的文本格式"""
+    def begin(self, info):
+        # 写入基本信息
+        self.write_text(f"转录时间: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        self.write_text(f"源文件: {info['audio']}\n")
+        self.write_text(f"使用模型: {info['model']}\n")
+        self.write_text(f"运行设备: {info['device']}\n")
+        if info.get("language"):
+            self.write_text(f"检测语言: {info['language']}\n")
+        self.write_text("\n=== 转录内容 ===\n\n")
+    def write_segment(self, segment):
+        time_start = format_timestamp(segment["start"])
+        time_end = format_timestamp(segment["end"])
+        self.write_text(f"[{time_start} --> {time_end}] {segment['text'].strip()}\n")
+class JsonWriter(SegmentWriter):
+    """JSON格式，每个分段一行；文件尾在end时写入，中断时文件不完整，续写后恢复完整"""
+    def begin(self, info):
+        header = {key: info.get(key) for key in ("audio", "model", "device", "language")}
+        header = json.dumps(header, ensure_ascii=False, indent=2)[:-2]
+        self.write_text(header + ',\n  "segments": [')
+    def write_segment(self, segment):
+        fields = {key: segment[key] for key in ("id", "start", "end", "text")}
+        separator = ",\n" if self.count > 1 else "\n"
+        self.write_text(separator + "    " + json.dumps(fields, ensure_ascii=False))
+    def end(self, info):
+        self.write_text("\n  ]\n}\n")
+WRITERS = {'txt': TxtWriter, 'srt': SrtWriter, 'vtt': VttWriter, 'json': JsonWriter}
+def save_result(result, output_path, output_format, info):
+    """把完整的转录结果一次写入文件"""
+    with WRITERS[output_format](output_path) as writer:
+        writer.begin(info)
+        for segment in result["segments"]:
+            writer.write(segment)
+        writer.end(info)
 def save_as_srt(result, output_path):
     """将转录结果保存为 SRT 格式"""
-    with open(output_path, 'w', encoding='utf-8') as f:
-        for i, segment in enumerate(result["segments"], 1):
-            start = format_timestamp(segment["start"])
-            end = format_timestamp(segment["end"])
-            f.write(f"{i}\n")
-            f.write(f"{start} --> {end}\n")
-            f.write(f"{segment['text'].strip()}\n\n")
+    save_result(result, output_path, "srt", {})
 def save_as_txt(result, output_path, audio_path, model_name, device):
     """将转录结果保存为带时间戳的文本格式"""
-    with open(output_path, "w", encoding='utf-8') as f:
-        # 写入基本信息
-        f.write(f"转录时间: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"源文件: {audio_path}\n")
-        f.write(f"使用模型: {model_name}\n")
-        f.write(f"运行设备: {device}\n")
-        if result.get("language"):
-            f.write(f"检测语言: {result['language']}\n")
-        f.write("\n=== 转录内容 ===\n\n")
-        # 写入转录内容
-        if "segments" in result:
-            for segment in result["segments"]:
-                time_start = format_timestamp(segment["start"])
-                time_end = format_timestamp(segment["end"])
-                f.write(f"[{time_start} --> {time_end}] {segment['text'].strip()}\n")
-def transcribe_audio(audio_path, model_name="base", device="cpu", output_format="txt", language=None, verbose=False):
+    save_result(result, output_path, "txt", {"audio": audio_path, "model": model_name,
+                                             "device": device, "language": result.get("language")})
+def expand_inputs(inputs):
+    """
+    展开命令行输入：文件原样保留，目录递归查找音视频文件，含通配符的模式用glob展开
+    返回 (文件列表, 无法匹配的输入)，文件去重并保持输入顺序
+    """
+    files = []
+    missing = []
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = []
+            for root, dirs, names in os.walk(item):
+                dirs.sort()
+                matches.extend(os.path.join(root, name) for name in sorted(names)
+                               if os.path.splitext(name)[1].lower() in MEDIA_EXTENSIONS)
+        elif os.path.isfile(item):
+            matches = [item]
+        elif glob.has_magic(item):
+            matches = sorted(path for path in glob.glob(item, recursive=True)
+                             if os.path.isfile(path))
+        else:
+            matches = []
+        if not matches:
+            missing.append(item)
+        files.extend(matches)
+    return list(dict.fromkeys(files)), missing
+def output_filename(audio_path, output_format, output_dir="."):
+    """生成输出文件名 transcript_<文件名>_<时间戳>.<格式>，重名时添加序号"""
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    audio_filename = os.path.splitext(os.path.basename(audio_path))[0]
+    extension = OUTPUT_EXTENSIONS[output_format.lower()]
+    path = os.path.join(output_dir, f"transcript_{audio_filename}_{timestamp}{extension}")
+    suffix = 2
+    while os.path.exists(path):
+        path = os.path.join(output_dir,
+                            f"transcript_{audio_filename}_{timestamp}_{suffix}{extension}")
+        suffix += 1
+    return path
+def decode_ahead(paths, prefetch=PREFETCH):
+    """
+    在后台线程中用ffmpeg依次解码音频，与当前文件的推理重叠
+    按顺序产出 (路径, 音频数组或异常, 解码耗时)
+    调用方提前退出时应关闭生成器（contextlib.closing）：通知后台线程停止，并丢弃已解码但未取走的音频
+    """
+    import whisper
+    decoded = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    def worker():
+        for path in paths:
+            if stop.is_set():
+                return
+            start = time.perf_counter()
+            try:
+                audio = whisper.load_audio(path)
+            except Exception as e:
+                audio = e
+            item = (path, audio, time.perf_counter() - start)
+            # 队列已满时定期检查是否已停止，调用方退出后不会一直阻塞并持有解码后的音频
+            while not stop.is_set():
+                try:
+                    decoded.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+    threading.Thread(target=worker, daemon=True).start()
+    try:
+        for _ in paths:
+            yield decoded.get()
+    finally:
+        stop.set()
+        while True:
+            try:
+                decoded.get_nowait()
+            except queue.Empty:
+                break
+def frame_energy(audio, frame_length):
+    """每帧的平均能量（dBFS），不足一帧的尾部忽略"""
+    import numpy as np
+    frames = len(audio) // frame_length
+    blocks = audio[:frames * frame_length].reshape(frames, frame_length)
+    # einsum不产生与音频等长的临时数组
+    power = np.einsum('ij,ij->i', blocks, blocks) / frame_length
+    return 10 * np.log10(power.astype(np.float64) + 1e-10)
+def silence_cut(silent, min_run):
+    """返回最后一段足够长的静音的中间帧，没有时返回None"""
+    import numpy as np
+    padded = np.concatenate(([False], silent, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    starts, ends = edges[::2], edges[1::2]
+    long_runs = np.flatnonzero(ends - starts >= min_run)
+    if len(long_runs) == 0:
+        return None
+    run = long_runs[-1]
+    return int((starts[run] + ends[run]) // 2)
+def split_audio(audio, chunk_length=DEFAULT_CHUNK_S, silence_db=SILENCE_DB,
+                min_silence=MIN_SILENCE_S):
+    """
+    基于能量的静音检测，把音频切成不超过 chunk_length 秒的块，返回 [(起始样本, 结束样本)]
+    切分点在块后半段的最后一段静音的中间；没有足够长的静音时取能量最低的帧
+    """
+    import numpy as np
+    frame_length = int(SAMPLE_RATE * VAD_FRAME_S)
+    max_samples = int(chunk_length * SAMPLE_RATE)
+    if len(audio) <= max_samples:
+        return [(0, len(audio))]
+    energy = frame_energy(audio, frame_length)
+    silent = energy < silence_db
+    min_run = max(1, round(min_silence / VAD_FRAME_S))
+    chunks = []
+    start = 0
+    while len(audio) - start > max_samples:
+        # 块长度在 chunk_length 的一半到全长之间
+        lo = (start + max_samples // 2) // frame_length
+        hi = (start + max_samples) // frame_length
+        cut = silence_cut(silent[lo:hi], min_run)
+        if cut is None:
+            cut = int(np.argmin(energy[lo:hi]))
+        end = (lo + cut) * frame_length + frame_length // 2
+        chunks.append((start, end))
+        start = end
+    chunks.append((start, len(audio)))
+    return chunks
+def offset_segments(segments, offset, duration, first_id=0):
+    """把块内的分段时间加上块的起始时间，结束时间不超过块的长度，并重新编号"""
+    for segment_id, segment in enumerate(segments, first_id):
+        segment = dict(segment, id=segment_id,
+                       start=round(offset + min(segment["start"], duration), 3),
+                       end=round(offset + min(segment["end"], duration), 3))
+        if "seek" in segment:
+            segment["seek"] += int(offset * SAMPLE_RATE) // HOP_LENGTH
+        if segment.get("words"):
+            segment["words"] = [dict(word, start=round(offset + min(word["start"], duration), 3),
+                                     end=round(offset + min(word["end"], duration), 3))
+                                for word in segment["words"]]
+        yield segment
+def detect_language(model, audio):
+    """用开头30秒检测语言"""
+    import whisper
+    mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), model.dims.n_mels)
+    mel = mel.to(model.device)
+    _, probs = model.detect_language(mel)
+    return max(probs, key=probs.get)
+def stream_chunks(model, audio, chunk_length=DEFAULT_CHUNK_S, start=0, first_id=0, **options):
+    """
+    在当前进程中从start样本处开始逐块转录，每块完成后产出 (块结束的样本位置, 分段列表)
+    块在静音处切分，options中应指定language，使所有块的语言一致；
+    上一块的文本作为下一块的提示词，延续whisper在块内对前文的依赖
+    """
+    prompt = None
+    for chunk_start, chunk_end in split_audio(audio[start:], chunk_length):
+        chunk_start += start
+        chunk_end += start
+        if prompt and options.get("condition_on_previous_text", True):
+            options["initial_prompt"] = prompt
+        segments = model.transcribe(audio[chunk_start:chunk_end], **options)["segments"]
+        segments = list(offset_segments(segments, chunk_start / SAMPLE_RATE,
+                                        (chunk_end - chunk_start) / SAMPLE_RATE, first_id))
+        first_id += len(segments)
+        prompt = "".join(segment["text"] for segment in segments) or prompt
+        yield chunk_end, segments
+# 分块转录的工作进程中加载的模型
+_chunk_model = None
+def init_chunk_worker(model_name, threads):
+    """工作进程初始化：限制torch线程数，每个进程只加载一次模型"""
+    global _chunk_model
+    import torch
+    import whisper
+    torch.set_num_threads(threads)
+    _chunk_model = whisper.load_model(model_name, device="cpu")
+def detect_chunk_language(audio):
+    """用开头30秒检测语言，所有块使用同一种语言"""
+    return detect_language(_chunk_model, audio)
+def transcribe_chunk(audio, options):
+    """在工作进程中转录一个块，时间相对于块的开头"""
+    import torch
+    # 固定随机种子：温度回退时的采样结果与块被分配到哪个进程无关
+    torch.manual_seed(0)
+    result = _chunk_model.transcribe(audio, **options)
+    return {"language": result.get("language"), "segments": result["segments"]}
+class ChunkedTranscriber:
+    """
+    长音频的多进程CPU转录：在静音处切块，由进程池并行转录，再按块的偏移拼接分段
+    每个进程各加载一份模型
+    """
+    def __init__(self, model_name, jobs, threads=None, chunk_length=DEFAULT_CHUNK_S):
+        self.jobs = jobs
+        self.chunk_length = chunk_length
+        threads = threads or max(1, (os.cpu_count() or 1) // jobs)
+        # 使用spawn：fork已初始化的torch线程池可能死锁
+        self.pool = ProcessPoolExecutor(
+            max_workers=jobs,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_chunk_worker,
+            initargs=(model_name, threads)
+        )
+    def detect_language(self, audio):
+        return self.pool.submit(detect_chunk_language, audio[:N_SAMPLES]).result()
+    def iter_chunks(self, audio, start=0, first_id=0, **options):
+        """
+        从start样本处开始并行转录，按时间顺序产出 (块结束的样本位置, 分段列表)
+        前面的块完成后立即产出，不等待所有块；提交给进程池的块要复制到工作进程，
+        在途的块不超过进程数的两倍，额外占用的内存与进程数而不是音频长度成正比
+        """
+        queued = deque((chunk_start + start, chunk_end + start)
+                       for chunk_start, chunk_end in split_audio(audio[start:], self.chunk_length))
+        print(f"分为 {len(queued)} 块并行转录")
+        window = self.jobs * 2
+        pending = deque()
+        try:
+            while queued or pending:
+                while queued and len(pending) < window:
+                    chunk_start, chunk_end = queued.popleft()
+                    future = self.pool.submit(transcribe_chunk, audio[chunk_start:chunk_end],
+                                              options)
+                    pending.append((chunk_start, chunk_end, future))
+                chunk_start, chunk_end, future = pending.popleft()
+                segments = list(offset_segments(future.result()["segments"],
+                                                chunk_start / SAMPLE_RATE,
+                                                (chunk_end - chunk_start) / SAMPLE_RATE, first_id))
+                first_id += len(segments)
+                yield chunk_end, segments
+        finally:
+            # 提前结束（出错或客户端断开）时不再转录尚未开始的块
+            for _, _, future in pending:
+                future.cancel()
+    def close(self):
+        self.pool.shutdown()
+def load_transcriber(model_name, device="cpu", jobs=1, threads=None, chunk_length=DEFAULT_CHUNK_S):
+    """jobs大于1时返回分块并行的转录器，否则直接加载whisper模型"""
+    if jobs > 1:
+        return ChunkedTranscriber(model_name, jobs, threads, chunk_length)
+    import torch
+    import whisper
+    if threads:
+        torch.set_num_threads(threads)
+    return whisper.load_model(model_name, device=device)
+def model_language(model, audio):
+    if isinstance(model, ChunkedTranscriber):
+        return model.detect_language(audio)
+    return detect_language(model, audio)
+def stream_segments(model, audio, start=0, first_id=0, **options):
+    """
+    在当前进程中从start样本处开始按whisper的30秒窗口逐个转录，每个窗口完成后
+    产出 (已处理到的样本位置, 分段列表)，调用者写出后才转录下一个窗口
+    只把窗口内的音频交给whisper：对整个文件使用clip_timestamps时每个窗口都要重新计算
+    全文件的梅尔频谱。与whisper相同，最后一段到达窗口结尾时可能被截断，
+    下一个窗口从这一段的开头重新转录；上一个窗口的文本作为下一个窗口的提示词
+    """
+    prompt = None
+    while start < len(audio):
+        end = min(start + N_SAMPLES, len(audio))
+        if prompt and options.get("condition_on_previous_text", True):
+            options["initial_prompt"] = prompt
+        segments = model.transcribe(audio[start:end], **options)["segments"]
+        if end < len(audio) and len(segments) > 1:
+            last = segments[-1]
+            cut = start + round(last["start"] * SAMPLE_RATE)
+            if last["end"] >= (end - start) / SAMPLE_RATE - WINDOW_EDGE_S and cut > start:
+                segments.pop()
+                end = cut
+        segments = list(offset_segments(segments, start / SAMPLE_RATE,
+                                        (end - start) / SAMPLE_RATE, first_id))
+        first_id += len(segments)
+        prompt = "".join(segment["text"] for segment in segments) or prompt
+        yield end, segments
+        start = end
+def iter_chunks(model, audio, start=0, first_id=0, chunked=False, chunk_length=DEFAULT_CHUNK_S,
+                **options):
+    """
+    从start样本处开始转录，按时间顺序产出 (已处理到的样本位置, 分段列表)
+    默认按whisper的30秒窗口逐个转录；并行转录器或chunked为True时在静音处切块转录
+    """
+    if start >= len(audio):
+        # 上次已转录到结尾，只差写入文件尾
+        return iter(())
+    if isinstance(model, ChunkedTranscriber):
+        return model.iter_chunks(audio, start, first_id, **options)
+    if chunked:
+        return stream_chunks(model, audio, chunk_length, start, first_id, **options)
+    return stream_segments(model, audio, start, first_id, **options)
+def close_transcriber(model):
+    if isinstance(model, ChunkedTranscriber):
+        model.close()
+def checkpoint_path(output_path):
+    return output_path + CHECKPOINT_SUFFIX
+def source_info(audio_path):
+    """用于确认断点属于同一个源文件"""
+    st = os.stat(audio_path)
+    return {"audio": os.path.abspath(audio_path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+def find_checkpoint(audio_path, output_format, output_dir, model_name):
+    """
+    在输出目录中查找同一源文件、模型和格式的未完成转录，返回断点记录（含输出文件路径）
+    输出文件比断点记录的长度短（断点之后文件被截断或替换）时不能续写
+    """
+    audio_filename = os.path.splitext(os.path.basename(audio_path))[0]
+    pattern = os.path.join(glob.escape(output_dir), f"transcript_{glob.escape(audio_filename)}_*"
+                           f"{OUTPUT_EXTENSIONS[output_format]}{CHECKPOINT_SUFFIX}")
+    source = source_info(audio_path)
+    found = []
+    for path in glob.glob(pattern):
+        try:
+            with open(path, encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            output = path[:-len(CHECKPOINT_SUFFIX)]
+            if (checkpoint.get("source") != source or checkpoint.get("model") != model_name
+                    or checkpoint.get("format") != output_format
+                    or os.path.getsize(output) < checkpoint["bytes"]):
+                continue
+        except (OSError, ValueError, KeyError):
+            continue
+        found.append((os.path.getmtime(path), output, checkpoint))
+    if not found:
+        return None
+    _, output, checkpoint = max(found)
+    return dict(checkpoint, output=output)
+def write_checkpoint(path, checkpoint, fsync=False):
+    """原子地替换断点文件，中断时保留上一个完整的断点"""
+    temp = path + ".tmp"
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(temp, path)
+def transcribe_to_file(model, audio, audio_path, model_name, device, output_format="txt",
+                       output_dir=".", language=None, verbose=False, fsync=False, resume=True,
+                       on_segment=None, chunked=False, chunk_length=DEFAULT_CHUNK_S):
+    """
+    转录解码后的音频，每解码完一个窗口（分块时每完成一块）把分段写入输出文件，
+    并在 <输出文件>.checkpoint 记录已完成的位置
+    resume为True时从同一源文件未完成的断点处继续；完成后删除断点文件
+    返回 {"output", "language", "resumed_s"}
+    """
+    sample_rate = SAMPLE_RATE
+    checkpoint = None
+    if resume:
+        checkpoint = find_checkpoint(audio_path, output_format, output_dir, model_name)
+    if checkpoint is not None:
+        output_path = checkpoint["output"]
+        language = checkpoint["language"]
+        start = checkpoint["offset"]
+        print(f"从断点继续: {output_path}（已完成 {format_duration(start / sample_rate)}）")
+        writer = WRITERS[output_format](output_path, fsync, checkpoint["bytes"],
+                                        checkpoint["segments"])
+    else:
+        output_path = output_filename(audio_path, output_format, output_dir)
+        language = language or model_language(model, audio)
+        start = 0
+        writer = WRITERS[output_format](output_path, fsync)
+    info = {"audio": audio_path, "model": model_name, "device": device, "language": language}
+    state = {"source": source_info(audio_path), "model": model_name, "format": output_format,
+             "language": language}
+    resumed_s = start / sample_rate
+    total = format_duration(len(audio) / sample_rate)
+    # 工作进程和whisper本身不输出进度，分段按时间顺序在这里输出
+    options = {"language": language, "verbose": None, "fp16": False}
+    with writer:
+        if checkpoint is None:
+            writer.begin(info)
+        for offset, segments in iter_chunks(model, audio, start, writer.count,
+                                            chunked, chunk_length, **options):
+            for segment in segments:
+                writer.write(segment)
+                if verbose:
+                    print(f"[{format_timestamp(segment['start'])} --> "
+                          f"{format_timestamp(segment['end'])}] {segment['text'].strip()}")
+                if on_segment:
+                    on_segment(segment)
+            # 先把分段写入文件，再记录断点，断点中的长度不会超过文件的实际长度
+            write_checkpoint(checkpoint_path(output_path),
+                             dict(state, offset=offset, segments=writer.count, bytes=writer.sync()),
+                             fsync)
+            if not verbose:
+                print(f"已转录 {format_duration(offset / sample_rate)} / {total}", flush=True)
+        writer.end(info)
+    os.remove(checkpoint_path(output_path))
+    return {"output": output_path, "language": language, "resumed_s": resumed_s}
+def transcribe_audio(audio_path, model_name="base", device="cpu", output_format="txt",
+                     language=None, verbose=False, output_dir=".", jobs=1, threads=None,
+                     chunk_length=DEFAULT_CHUNK_S, fsync=False, resume=True, chunked=False):
     """
     转录音频文件并保存为指定格式
     """
@@ -53,43 +539,338 @@ def transcribe_audio(audio_path, model_name="base", device="cpu", output_format=
     try:
         start_time = time.time()
         print(f"[2/3] 加载模型: {model_name}")
-        model = whisper.load_model(model_name, device=device)
+        model = load_transcriber(model_name, device, jobs, threads, chunk_length)
         print(f"[3/3] 开始转录音频: {os.path.basename(audio_path)}")
         if verbose:
             print("转录中，将实时显示结果...")
         else:
             print("转录中，请稍候...")
-        # 设置 verbose 参数以获取实时输出
-        transcribe_options = {
-            "verbose": verbose,  # 这将启用 Whisper 的原生进度输出
-            "fp16": False       # 禁用FP16以避免警告
-        }
         if language:
-            transcribe_options["language"] = language
             print(f"指定语言: {language}")
-        result = model.transcribe(audio_path, **transcribe_options)
-        # 生成输出文件名
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        audio_filename = os.path.splitext(os.path.basename(audio_path))[0]
-        extension = ".srt" if output_format.lower() == "srt" else ".txt"
-        output_filename = f"transcript_{audio_filename}_{timestamp}{extension}"
-        # 保存转录结果
-        if output_format.lower() == "srt":
-            save_as_srt(result, output_filename)
-        else:
-            save_as_txt(result, output_filename, audio_path, model_name, device)
+        os.makedirs(output_dir, exist_ok=True)
+        import whisper
+        try:
+            output_path = transcribe_to_file(model, whisper.load_audio(audio_path), audio_path,
+                                             model_name, device, output_format, output_dir,
+                                             language, verbose, fsync, resume, None, chunked,
+                                             chunk_length)["output"]
+        finally:
+            close_transcriber(model)
         end_time = time.time()
         elapsed = end_time - start_time
         elapsed_str = str(datetime.timedelta(seconds=int(elapsed)))
         print(f"\n转录完成！耗时: {elapsed_str}")
-        print(f"结果已保存至: {output_filename}")
-        return output_filename
+        print(f"结果已保存至: {output_path}")
+        return output_path
     except Exception as e:
         print(f"转录过程中出现错误: {e}")
         raise
+def transcribe_batch(audio_paths, model_name="base", device="cpu", output_format="txt",
+                     language=None, verbose=False, output_dir=".", jobs=1, threads=None,
+                     chunk_length=DEFAULT_CHUNK_S, fsync=False, resume=True, chunked=False):
+    """
+    批量转录：模型只加载一次，下一个文件的解码与当前文件的推理重叠
+    每个文件完成后打印实时率（推理耗时/音频时长），返回本次运行的汇总
+    """
+    run_start = time.perf_counter()
+    print(f"[1/3] 使用设备: {device}")
+    print(f"[2/3] 加载模型: {model_name}")
+    load_start = time.perf_counter()
+    model = load_transcriber(model_name, device, jobs, threads, chunk_length)
+    load_s = time.perf_counter() - load_start
+    print(f"[3/3] 开始转录 {len(audio_paths)} 个文件")
+    os.makedirs(output_dir, exist_ok=True)
+    files = []
+    decoded = decode_ahead(audio_paths)
+    try:
+        for index, (audio_path, audio, decode_s) in enumerate(decoded, 1):
+            print(f"\n[{index}/{len(audio_paths)}] {audio_path}")
+            entry = {"file": audio_path, "decode_s": round(decode_s, 3)}
+            files.append(entry)
+            if isinstance(audio, Exception):
+                # ffmpeg的错误信息很长，只保留最后一行
+                lines = str(audio).strip().splitlines() or [repr(audio)]
+                entry["error"] = f"解码失败: {lines[-1]}"
+                print(f"错误: {entry['error']}")
+                continue
+            duration = len(audio) / SAMPLE_RATE
+            entry["duration_s"] = round(duration, 3)
+            start = time.perf_counter()
+            try:
+                result = transcribe_to_file(model, audio, audio_path, model_name, device,
+                                            output_format, output_dir, language, verbose, fsync,
+                                            resume, None, chunked, chunk_length)
+            except Exception as e:
+                entry["error"] = str(e)
+                print(f"转录过程中出现错误: {e}")
+                continue
+            finally:
+                # 尽早释放解码后的音频
+                del audio
+            elapsed = time.perf_counter() - start
+            # 从断点继续时只按本次转录的部分计算实时率
+            transcribed = duration - result["resumed_s"]
+            entry.update({
+                "output": result["output"],
+                "language": result["language"],
+                "transcribe_s": round(elapsed, 3),
+                "realtime_factor": round(elapsed / transcribed, 3) if transcribed > 0 else None,
+            })
+            if result["resumed_s"]:
+                entry["resumed_s"] = round(result["resumed_s"], 3)
+            print(f"完成: {result['output']}（音频 {format_duration(duration)}，"
+                  f"耗时 {format_duration(elapsed)}，实时率 {entry['realtime_factor']}）")
+    finally:
+        decoded.close()
+        close_transcriber(model)
+    audio_s = sum(entry.get("duration_s", 0) for entry in files if "error" not in entry)
+    transcribe_s = sum(entry.get("transcribe_s", 0) for entry in files)
+    return {
+        "model": model_name,
+        "device": device,
+        "files": files,
+        "failed": sum("error" in entry for entry in files),
+        "model_load_s": round(load_s, 3),
+        "audio_s": round(audio_s, 3),
+        "transcribe_s": round(transcribe_s, 3),
+        "wall_s": round(time.perf_counter() - run_start, 3),
+        "realtime_factor": round(transcribe_s / audio_s, 3) if audio_s else None,
+    }
+def format_duration(seconds):
+    return str(datetime.timedelta(seconds=int(seconds)))
+def print_summary(summary):
+    """打印批量转录的汇总表"""
+    print("\n=== 转录汇总 ===")
+    print(f"{'文件':40} {'时长':>9} {'解码s':>8} {'转录s':>9} {'实时率':>7}")
+    for entry in summary["files"]:
+        name = os.path.basename(entry["file"])[:40]
+        if "error" in entry:
+            print(f"{name:40} 错误: {entry['error']}")
+            continue
+        print(f"{name:40} {format_duration(entry['duration_s']):>9} {entry['decode_s']:8.2f} "
+              f"{entry['transcribe_s']:9.2f} {entry['realtime_factor']:7.3f}")
+    print(f"共 {len(summary['files'])} 个文件，失败 {summary['failed']} 个；"
+          f"模型加载 {summary['model_load_s']:.1f}s，"
+          f"音频总长 {format_duration(summary['audio_s'])}，"
+          f"总耗时 {format_duration(summary['wall_s'])}，"
+          f"整体实时率 {summary['realtime_factor']}")
+class ModelCache:
+    """
+    服务进程中已加载的模型，按最近使用顺序淘汰，使模型占用的内存不超过 max_bytes
+    单个模型超过上限时仍会加载，但会先卸载其他所有模型
+    """
+    def __init__(self, device, max_bytes):
+        self.device = device
+        self.max_bytes = max_bytes
+        self.models = OrderedDict()  # 模型名称 -> (模型, 字节数)
+    def get(self, name):
+        """返回 (模型, 加载耗时)，已加载时耗时为0"""
+        if name in self.models:
+            self.models.move_to_end(name)
+            return self.models[name][0], 0.0
+        self.evict(MODEL_PARAMS.get(name, 0) * 4)
+        import whisper
+        start = time.perf_counter()
+        model = whisper.load_model(name, device=self.device)
+        size = sum(param.numel() * param.element_size() for param in model.parameters())
+        self.models[name] = (model, size)
+        return model, time.perf_counter() - start
+    def evict(self, needed):
+        """卸载最久未使用的模型，直到能放下needed字节"""
+        evicted = False
+        while self.models and self.used() + needed > self.max_bytes:
+            name, _ = self.models.popitem(last=False)
+            print(f"卸载模型: {name}", flush=True)
+            evicted = True
+        if evicted:
+            gc.collect()
+            if self.device == "cuda":
+                import torch
+                torch.cuda.empty_cache()
+    def used(self):
+        return sum(size for _, size in self.models.values())
+    def status(self):
+        return [{"model": name, "bytes": size} for name, (_, size) in self.models.items()]
+class ClientDisconnected(Exception):
+    """客户端在任务完成前断开了连接"""
+class TranscribeServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """常驻的转录服务：每个连接一个线程，转录任务按到达顺序逐个执行"""
+    daemon_threads = True
+    def __init__(self, socket_path, device, max_bytes):
+        self.device = device
+        self.models = ModelCache(device, max_bytes)
+        # 推理会占满所有CPU核，同时只执行一个任务
+        self.lock = threading.Lock()
+        self.started = time.time()
+        super().__init__(socket_path, TranscribeHandler)
+class TranscribeHandler(socketserver.StreamRequestHandler):
+    """处理一个客户端连接：读取一行JSON请求，逐行返回事件"""
+    def send(self, message):
+        try:
+            send_message(self.wfile, message)
+        except OSError as e:
+            raise ClientDisconnected() from e
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            command = request.get("cmd")
+            if command == "status":
+                self.send({
+                    "socket": self.server.server_address,
+                    "pid": os.getpid(),
+                    "device": self.server.device,
+                    "uptime_s": round(time.time() - self.server.started),
+                    "busy": self.server.lock.locked(),
+                    "max_bytes": self.server.models.max_bytes,
+                    "models": self.server.models.status(),
+                })
+            elif command == "shutdown":
+                self.send({"event": "shutdown"})
+                # shutdown() 会等待serve_forever退出，不能在处理请求的线程中直接调用
+                threading.Thread(target=self.server.shutdown).start()
+            elif command == "transcribe":
+                with self.server.lock:
+                    serve_transcription(self.server, request, self.send)
+            else:
+                self.send({"event": "error", "message": f"未知的命令: {command}"})
+        except (ValueError, AttributeError):
+            self.send({"event": "error", "message": "无效的请求"})
+        except ClientDisconnected:
+            # 放弃当前任务，剩余的文件不再转录
+            print("客户端已断开，任务取消", flush=True)
+def serve_transcription(server, request, send):
+    """执行一个转录请求，转录过程中逐个发送分段"""
+    run_start = time.perf_counter()
+    audio_paths, missing = expand_inputs(request.get("inputs") or [])
+    for item in missing:
+        send({"event": "error", "file": item, "message": "找不到音频文件"})
+    model_name = request.get("model") or "base"
+    output_format = request.get("format") or "txt"
+    output_dir = request.get("output_dir") or "."
+    failed = len(missing)
+    files = len(audio_paths) + len(missing)
+    if output_format not in WRITERS:
+        send({"event": "error", "message": f"不支持的输出格式: {output_format}"})
+        failed += len(audio_paths)
+        audio_paths = []
+    if audio_paths:
+        try:
+            model, load_s = server.models.get(model_name)
+        except Exception as e:
+            # 模型名称无效、下载失败或内存不足：整个请求失败，服务继续运行
+            send({"event": "error", "model": model_name,
+                  "message": f"无法加载模型 {model_name}: {e}"})
+            failed += len(audio_paths)
+            audio_paths = []
+        else:
+            if load_s:
+                send({"event": "model", "model": model_name, "load_s": round(load_s, 3)})
+            os.makedirs(output_dir, exist_ok=True)
+    # 客户端断开时立即停止后台解码，不再持有后面文件的音频
+    with contextlib.closing(decode_ahead(audio_paths)) as decoded:
+        for index, (audio_path, audio, decode_s) in enumerate(decoded, 1):
+            send({"event": "start", "file": audio_path, "index": index, "total": len(audio_paths)})
+            if isinstance(audio, Exception):
+                lines = str(audio).strip().splitlines() or [repr(audio)]
+                send({"event": "error", "file": audio_path, "message": f"解码失败: {lines[-1]}"})
+                failed += 1
+                continue
+            duration = len(audio) / SAMPLE_RATE
+            start = time.perf_counter()
+            def on_segment(segment):
+                send({"event": "segment", "file": audio_path, "id": segment["id"],
+                      "start": segment["start"], "end": segment["end"], "text": segment["text"]})
+            try:
+                # 客户端断开时断点保留，下次提交同一文件时从断点继续
+                result = transcribe_to_file(model, audio, audio_path, model_name, server.device,
+                                            output_format, output_dir, request.get("language"),
+                                            on_segment=on_segment)
+            except ClientDisconnected:
+                raise
+            except Exception as e:
+                send({"event": "error", "file": audio_path, "message": str(e)})
+                failed += 1
+                continue
+            finally:
+                del audio
+            elapsed = time.perf_counter() - start
+            transcribed = duration - result["resumed_s"]
+            send({
+                "event": "done",
+                "file": audio_path,
+                "output": result["output"],
+                "language": result["language"],
+                "duration_s": round(duration, 3),
+                "resumed_s": round(result["resumed_s"], 3),
+                "decode_s": round(decode_s, 3),
+                "transcribe_s": round(elapsed, 3),
+                "realtime_factor": round(elapsed / transcribed, 3) if transcribed > 0 else None,
+            })
+    send({"event": "summary", "files": files, "failed": failed,
+          "wall_s": round(time.perf_counter() - run_start, 3)})
+def serve(socket_path, device="cpu", max_memory=6.0, preload=(), threads=None):
+    """启动常驻的转录服务，直到收到shutdown请求、SIGTERM或Ctrl+C"""
+    # 常驻服务在启动时就导入，第一个请求不必等待
+    import torch
+    importlib.import_module("whisper")
+    if threads:
+        torch.set_num_threads(threads)
+    if os.path.exists(socket_path):
+        # 上次异常退出留下的套接字文件；如果仍能连接说明服务已在运行
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(socket_path)
+            raise RuntimeError(f"转录服务已在运行: {socket_path}")
+        except ConnectionRefusedError:
+            os.unlink(socket_path)
+    os.makedirs(os.path.dirname(socket_path) or ".", exist_ok=True)
+    old_umask = os.umask(0o177)  # 套接字只允许当前用户连接
+    try:
+        server = TranscribeServer(socket_path, device, int(max_memory * 1024 ** 3))
+    finally:
+        os.umask(old_umask)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        for model_name in preload:
+            print(f"预加载模型: {model_name}", flush=True)
+            server.models.get(model_name)
+        print(f"转录服务已启动: {socket_path}（设备: {device}，"
+              f"模型内存上限: {max_memory}GB）", flush=True)
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        print("转录服务已停止", flush=True)
+def serve_main(argv):
+    parser = argparse.ArgumentParser(prog='transcribe.py serve',
+                                     description='常驻的Whisper转录服务，通过Unix套接字接收任务')
+    parser.add_argument('--socket', default=default_socket_path(),
+                      help='套接字路径 (默认: $WHISPER_SOCKET 或 '
+                           '$XDG_RUNTIME_DIR/whisper-transcribe-<uid>.sock)')
+    parser.add_argument('--device', choices=['cpu', 'cuda'], default='cpu',
+                      help='运行设备 (默认: cpu)')
+    parser.add_argument('--model', action='append', default=[],
+                      choices=['tiny', 'base', 'small', 'medium', 'large'],
+                      help='启动时预加载的模型，可重复')
+    parser.add_argument('--max-memory', type=float, default=6.0,
+                      help='已加载模型占用内存的上限（GB），超出时卸载最久未使用的模型 (默认: 6)')
+    parser.add_argument('--threads', type=int, help='torch线程数 (默认: 全部CPU核)')
+    args = parser.parse_args(argv)
+    try:
+        serve(args.socket, args.device, args.max_memory, args.model, args.threads)
+    except RuntimeError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
 if __name__ == "__main__":
+    if sys.argv[1:2] == ['serve']:
+        serve_main(sys.argv[2:])
+        sys.exit(0)
     parser = argparse.ArgumentParser(description='使用Whisper转录音频文件')
-    parser.add_argument('audio_file', help='要转录的音频文件路径')
+    parser.add_argument('audio_files', nargs='+',
+                      help='要转录的音频文件、目录（递归查找音视频文件）或通配符模式')
     parser.add_argument('--model', default='base',
                       choices=['tiny', 'base', 'small', 'medium', 'large'],
                       help='使用的Whisper模型 (默认: base)')
@@ -98,7 +879,7 @@ if __name__ == "__main__":
                       default='cpu',
                       help='运行设备 (默认: cpu)')
     parser.add_argument('--format',
-                      choices=['txt', 'srt'],
+                      choices=list(WRITERS),
                       default='txt',
                       help='输出文件格式 (默认: txt)')
     parser.add_argument('--language',
@@ -106,17 +887,80 @@ if __name__ == "__main__":
     parser.add_argument('-v', '--verbose',
                       action='store_true',
                       help='显示详细输出，包括实时转录结果')
+    parser.add_argument('-o', '--output-dir', default='.',
+                      help='转录结果的保存目录 (默认: 当前目录)')
+    parser.add_argument('--summary',
+                      help='多个文件时将汇总（每个文件的耗时和实时率）写入JSON文件')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                      help='CPU并行转录的进程数，大于1时在静音处切块并行转录长音频 (默认: 1)')
+    parser.add_argument('--threads', type=int,
+                      help='每个进程的torch线程数 (默认: CPU核数/进程数)')
+    parser.add_argument('--chunked', action='store_true',
+                      help='单进程时也在静音处切块逐块转录（默认按whisper的30秒窗口逐个转录）')
+    parser.add_argument('--chunk-length', type=float, default=DEFAULT_CHUNK_S,
+                      help=f'分块转录时每块的最大秒数 (默认: {DEFAULT_CHUNK_S})')
+    parser.add_argument('--fsync', action='store_true',
+                      help='每次写入分段后把输出文件和断点同步到磁盘')
+    parser.add_argument('--no-resume', action='store_true',
+                      help='忽略输出目录中未完成的断点，重新开始转录')
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error('--jobs 必须大于0')
+    if args.jobs > 1 and args.device != 'cpu':
+        parser.error('--jobs 只适用于 --device cpu')
+    if args.chunk_length < 30:
+        parser.error('--chunk-length 不能小于30秒')
+    audio_files, missing = expand_inputs(args.audio_files)
+    for item in missing:
+        print(f"错误: 找不到音频文件: {item}")
+    if not audio_files:
+        sys.exit(1)
+    if len(audio_files) == 1 and not args.summary:
+        try:
+            transcribe_audio(
+                audio_files[0],
+                args.model,
+                args.device,
+                args.format,
+                args.language,
+                args.verbose,
+                args.output_dir,
+                args.jobs,
+                args.threads,
+                args.chunk_length,
+                args.fsync,
+                not args.no_resume,
+                args.chunked
+            )
+        except FileNotFoundError as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+        except Exception as e:
+            print(f"转录过程中出现错误: {e}")
+            sys.exit(1)
+        sys.exit(1 if missing else 0)
     try:
-        transcribe_audio(
-            args.audio_file,
+        summary = transcribe_batch(
+            audio_files,
             args.model,
             args.device,
             args.format,
             args.language,
-            args.verbose
+            args.verbose,
+            args.output_dir,
+            args.jobs,
+            args.threads,
+            args.chunk_length,
+            args.fsync,
+            not args.no_resume,
+            args.chunked
         )
-    except FileNotFoundError as e:
-        print(f"错误: {e}")
     except Exception as e:
-        print(f"转录过程中出现错误: {e}")
\ No newline at end of file
+        print(f"转录过程中出现错误: {e}")
+        sys.exit(1)
+    print_summary(summary)
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"汇总已保存至: {args.summary}")
+    sys.exit(1 if summary["failed"] or missing else 0)
@@ -0,0 +1,130 @@
+"""
+whisper转录服务（transcribe.py serve）的客户端，只依赖标准库
+不需要激活conda环境、导入torch或加载模型，转录任务通过Unix套接字交给常驻的服务进程
+
+协议：每条消息是一行JSON。客户端发送一个请求，服务端按顺序返回事件直到连接关闭：
+  {"cmd": "transcribe", "inputs": [...], "model": ..., "format": ...,
+   "language": ..., "output_dir": ...}
+  {"event": "start" | "segment" | "done" | "error" | "summary", ...}
+"""
+import argparse
+import datetime
+import json
+import os
+import socket
+import sys
+# 服务未运行时的退出码，fish函数据此改为在本地转录
+EXIT_NO_SERVER = 2
+def default_socket_path():
+    """
+    返回 $WHISPER_SOCKET，或 $XDG_RUNTIME_DIR（没有时为/tmp）下的
+    whisper-transcribe-<uid>.sock
+    """
+    if os.environ.get("WHISPER_SOCKET"):
+        return os.environ["WHISPER_SOCKET"]
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(runtime_dir, f"whisper-transcribe-{os.getuid()}.sock")
+def send_message(stream, message):
+    """写入一行JSON并立即发送"""
+    stream.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+    stream.flush()
+def request(socket_path, message):
+    """发送一个请求，逐条产出服务端返回的消息；连接失败时抛出OSError"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        with sock.makefile("rwb") as stream:
+            send_message(stream, message)
+            for line in stream:
+                yield json.loads(line)
+def format_timestamp(seconds):
+    """与 transcribe.py 相同的 SRT 时间戳格式"""
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    seconds = seconds % 60
+    milliseconds = int((seconds % 1) * 1000)
+    seconds = int(seconds)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+def format_duration(seconds):
+    return str(datetime.timedelta(seconds=int(seconds)))
+def print_event(event, verbose=False):
+    """按本地转录的输出格式显示服务端事件，返回该事件是否表示失败"""
+    kind = event.get("event")
+    if kind == "start":
+        print(f"\n[{event['index']}/{event['total']}] {event['file']}")
+    elif kind == "model":
+        print(f"加载模型: {event['model']}（{event['load_s']:.1f}s）")
+    elif kind == "segment" and verbose:
+        print(f"[{format_timestamp(event['start'])} --> {format_timestamp(event['end'])}] "
+              f"{event['text'].strip()}")
+    elif kind == "done":
+        if event.get("resumed_s"):
+            print(f"从断点继续，跳过已完成的 {format_duration(event['resumed_s'])}")
+        print(f"完成: {event['output']}（音频 {format_duration(event['duration_s'])}，"
+              f"耗时 {format_duration(event['transcribe_s'])}，实时率 {event['realtime_factor']}）")
+    elif kind == "error":
+        prefix = f"{event['file']}: " if event.get("file") else ""
+        print(f"错误: {prefix}{event['message']}")
+        return True
+    elif kind == "summary":
+        print(f"\n共 {event['files']} 个文件，失败 {event['failed']} 个，"
+              f"总耗时 {format_duration(event['wall_s'])}")
+    return False
+def main():
+    parser = argparse.ArgumentParser(description='通过常驻的转录服务转录音频文件')
+    parser.add_argument('audio_files', nargs='*',
+                      help='要转录的音频文件、目录（递归查找音视频文件）或通配符模式')
+    parser.add_argument('--socket', default=default_socket_path(),
+                      help='服务的套接字路径 (默认: $WHISPER_SOCKET 或 '
+                           '$XDG_RUNTIME_DIR/whisper-transcribe-<uid>.sock)')
+    parser.add_argument('--model', default='base',
+                      choices=['tiny', 'base', 'small', 'medium', 'large'],
+                      help='使用的Whisper模型 (默认: base)')
+    parser.add_argument('--format', choices=['txt', 'srt', 'vtt', 'json'], default='txt',
+                      help='输出文件格式 (默认: txt)')
+    parser.add_argument('--language',
+                      help='音频语言 (例如: "zh" 表示中文，默认自动检测)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                      help='显示实时转录结果')
+    parser.add_argument('-o', '--output-dir', default='.',
+                      help='转录结果的保存目录 (默认: 当前目录)')
+    parser.add_argument('--status', action='store_true', help='显示服务状态和已加载的模型')
+    parser.add_argument('--shutdown', action='store_true', help='停止服务')
+    args = parser.parse_args()
+    if args.status:
+        message = {"cmd": "status"}
+    elif args.shutdown:
+        message = {"cmd": "shutdown"}
+    elif args.audio_files:
+        # 服务进程的工作目录不同，路径和通配符都转换为绝对路径
+        message = {
+            "cmd": "transcribe",
+            "inputs": [os.path.abspath(item) for item in args.audio_files],
+            "model": args.model,
+            "format": args.format,
+            "language": args.language,
+            "output_dir": os.path.abspath(args.output_dir),
+        }
+    else:
+        parser.error("请提供音频或视频文件路径")
+    failed = False
+    finished = message["cmd"] != "transcribe"
+    try:
+        for event in request(args.socket, message):
+            if message["cmd"] != "transcribe":
+                print(json.dumps(event, ensure_ascii=False, indent=2))
+                continue
+            failed = print_event(event, args.verbose) or failed
+            finished = finished or event.get("event") == "summary"
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f"转录服务未运行: {args.socket}", file=sys.stderr)
+        return EXIT_NO_SERVER
+    except (OSError, ValueError) as e:
+        print(f"错误: 与转录服务的连接中断: {e}", file=sys.stderr)
+        return 1
+    if not finished:
+        # 服务在任务完成前退出
+        print("错误: 转录服务意外断开连接", file=sys.stderr)
+        return 1
+    return 1 if failed else 0
+if __name__ == "__main__":
+    sys.exit(main())